@@ -20,6 +20,7 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 from core.models import Base
 from core.config import settings
+from core.migrations import PROGRESS_TABLE
 
 target_metadata = Base.metadata
 
@@ -31,6 +32,22 @@ target_metadata = Base.metadata
 config.set_main_option("sqlalchemy.url", settings.db.url)
 
 
+def include_name(name, type_, parent_names) -> bool:
+    # служебную таблицу прогресса backfill (core/migrations.py) autogenerate не трогает
+    return not (type_ == "table" and name == PROGRESS_TABLE)
+
+
+# Каждая миграция своей транзакцией, а не все разом: хелперы из core/migrations.py
+# выходят из транзакции (autocommit_block), и уже сделанные миграции не должны
+# откатываться из-за следующей, которая упала по lock_timeout
+CONFIGURE_OPTIONS = {
+    "target_metadata": target_metadata,
+    "include_name": include_name,
+    "transaction_per_migration": True,
+}
+LOCK_TIMEOUT_SQL = f"SET lock_timeout = '{settings.migrations.lock_timeout}'"
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -46,17 +63,23 @@ def run_migrations_offline() -> None:
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
         url=url,
-        target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        **CONFIGURE_OPTIONS,
     )
+    if context.get_context().dialect.name == "postgresql":
+        context.execute(LOCK_TIMEOUT_SQL)
 
     with context.begin_transaction():
         context.run_migrations()
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    if connection.dialect.name == "postgresql":
+        # на всю сессию: ALTER, не дождавшийся блокировки, падает, а не копит очередь за собой
+        connection.exec_driver_sql(LOCK_TIMEOUT_SQL)
+        connection.commit()
+    context.configure(connection=connection, **CONFIGURE_OPTIONS)
 
     with context.begin_transaction():
         context.run_migrations()
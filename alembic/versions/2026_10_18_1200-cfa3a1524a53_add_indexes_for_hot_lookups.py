@@ -0,0 +1,45 @@
+"""add indexes for hot lookups
+
+Revision ID: cfa3a1524a53
+Revises: 086c6ecaaa6d
+Create Date: 2026-10-18 12:00:41.518022
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = "cfa3a1524a53"
+down_revision: Union[str, None] = "086c6ecaaa6d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY: product и post большие, обычный CREATE INDEX держал бы запись на все время построения
+    create_index_concurrently(
+        "ix_product_name",
+        "product",
+        ["name"],
+        unique=False,
+        postgresql_ops={"name": "text_pattern_ops"},
+    )
+    create_index_concurrently(
+        "ix_product_price_id", "product", ["price", "id"], unique=False
+    )
+    create_index_concurrently(
+        "ix_post_user_id_id", "post", ["user_id", "id"], unique=False
+    )
+    # user.username не трогаем: поиск по нему уже идет по индексу user_username_key
+
+
+def downgrade() -> None:
+    drop_index_concurrently("ix_post_user_id_id", "post")
+    drop_index_concurrently("ix_product_price_id", "product")
+    drop_index_concurrently("ix_product_name", "product")
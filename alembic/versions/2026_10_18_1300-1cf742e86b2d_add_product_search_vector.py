@@ -0,0 +1,79 @@
+"""add product search vector
+
+Revision ID: 1cf742e86b2d
+Revises: cfa3a1524a53
+Create Date: 2026-10-18 13:00:12.730412
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from core.migrations import (
+    backfill,
+    create_index_concurrently,
+    drop_index_concurrently,
+    is_postgres,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = "1cf742e86b2d"
+down_revision: Union[str, None] = "cfa3a1524a53"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 'simple' без стемминга, так поиск одинаково работает для русских и английских названий
+SEARCH_VECTOR = (
+    "to_tsvector('simple', "
+    "coalesce({row}name, '') || ' ' || coalesce({row}description, ''))"
+)
+
+
+def upgrade() -> None:
+    # tsvector и plpgsql есть только в постгресе, локальная sqlite ищет через LIKE
+    if not is_postgres():
+        return
+    # Не STORED generated колонка: ее добавление переписывает всю product под ACCESS EXCLUSIVE.
+    # Обычная nullable колонка без default - только каталог, новые и измененные строки
+    # заполняет триггер, старые - backfill кусками
+    op.add_column(
+        "product",
+        sa.Column("search_vector", postgresql.TSVECTOR(), nullable=True),
+    )
+    op.execute(
+        "CREATE OR REPLACE FUNCTION product_search_vector_update() RETURNS trigger AS $$ "
+        f"BEGIN NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')}; RETURN NEW; END "
+        "$$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        "CREATE TRIGGER product_search_vector "
+        "BEFORE INSERT OR UPDATE OF name, description ON product "
+        "FOR EACH ROW EXECUTE FUNCTION product_search_vector_update()"
+    )
+    # IS NULL - повтор после сбоя не пересчитывает уже заполненное,
+    # а строки, которые успел заполнить триггер, не трогаются
+    backfill(
+        "product",
+        f"search_vector = {SEARCH_VECTOR.format(row='')}",
+        where="search_vector IS NULL",
+    )
+    create_index_concurrently(
+        "ix_product_search_vector",
+        "product",
+        ["search_vector"],
+        unique=False,
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    if not is_postgres():
+        return
+    drop_index_concurrently("ix_product_search_vector", "product")
+    op.execute("DROP TRIGGER IF EXISTS product_search_vector ON product")
+    op.execute("DROP FUNCTION IF EXISTS product_search_vector_update()")
+    op.drop_column("product", "search_vector")
@@ -0,0 +1,49 @@
+"""add product version and updated_at
+
+Revision ID: 5b0e2f9c7d41
+Revises: 1cf742e86b2d
+Create Date: 2026-10-18 14:00:12.304117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5b0e2f9c7d41"
+down_revision: Union[str, None] = "1cf742e86b2d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # server_default заполняет уже существующие строки, поэтому сразу NOT NULL.
+    # Постгрес 11+ с неволатильным default (1, now()) таблицу не переписывает: ALTER только
+    # меняет каталог, а его короткую ACCESS EXCLUSIVE ограничивает lock_timeout из env.py
+    op.add_column(
+        "product",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.add_column(
+        "product",
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+    create_index_concurrently(
+        "ix_product_updated_at", "product", ["updated_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    drop_index_concurrently("ix_product_updated_at", "product")
+    op.drop_column("product", "updated_at")
+    op.drop_column("product", "version")
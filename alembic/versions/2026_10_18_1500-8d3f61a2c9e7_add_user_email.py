@@ -0,0 +1,34 @@
+"""add user email
+
+Revision ID: 8d3f61a2c9e7
+Revises: 5b0e2f9c7d41
+Create Date: 2026-10-18 15:00:27.613402
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8d3f61a2c9e7"
+down_revision: Union[str, None] = "5b0e2f9c7d41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # nullable колонка без default - только запись в каталоге, таблица не переписывается
+    op.add_column("user", sa.Column("email", sa.String(length=254), nullable=True))
+    # NULL в уникальном индексе не конфликтуют, старые пользователи без email не мешают.
+    # Если CONCURRENTLY упадет на дубликате, невалидный индекс удалится при повторе
+    create_index_concurrently("ix_user_email", "user", ["email"], unique=True)
+
+
+def downgrade() -> None:
+    drop_index_concurrently("ix_user_email", "user")
+    op.drop_column("user", "email")
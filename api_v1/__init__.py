@@ -1,5 +1,7 @@
 from fastapi import APIRouter
 from api_v1.products.views import router as producs_router
+from api_v1.users.views import router as users_router
 
 router = APIRouter()
 router.include_router(router=producs_router, prefix="/products")
+router.include_router(router=users_router, prefix="/users")
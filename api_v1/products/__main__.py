@@ -0,0 +1,55 @@
+# Импорт и экспорт каталога продуктов из командной строки, формат по расширению файла
+# python -m api_v1.products import products.csv
+# python -m api_v1.products export products.ndjson
+import argparse
+import asyncio
+from pathlib import Path
+from typing import AsyncIterator
+
+from api_v1.products.transfer import (
+    MEDIA_TYPES,
+    Format,
+    export_products,
+    import_products,
+)
+from core.models import db_helper
+
+EXTENSIONS: dict[str, Format] = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+async def iter_file(path: Path, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with path.open("rb") as file:
+        while chunk := await asyncio.to_thread(file.read, chunk_size):
+            yield chunk
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", type=Path)
+    parser.add_argument(
+        "--format", choices=list(MEDIA_TYPES), help="по умолчанию по расширению"
+    )
+    args = parser.parse_args()
+    format = args.format or EXTENSIONS.get(args.path.suffix.lower())
+    if format is None:
+        parser.error(f"Can't guess format of {args.path}, use --format")
+
+    async with db_helper.session_factory() as session:
+        if args.command == "import":
+            async for report in import_products(
+                session=session, chunks=iter_file(args.path), format=format
+            ):
+                print(f"imported {report.imported}, failed {report.failed}")
+            for row_error in report.errors:
+                print(f"line {row_error.line}: {row_error.errors}")
+        else:
+            with args.path.open("wb") as file:
+                async for chunk in export_products(session=session, format=format):
+                    await asyncio.to_thread(file.write, chunk)
+            print(f"exported to {args.path}")
+    await db_helper.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+import json
+from datetime import datetime
+from typing import NamedTuple
+
+from core.cache import CacheBackend, create_cache_backend
+from core.config import settings
+from core.models import Product
+
+from api_v1.products.schemas import Product as ProductSchema
+
+
+class CachedProduct(NamedTuple):
+    payload: bytes
+    # валидаторы для ETag/Last-Modified, чтобы ответить 304 не разбирая json
+    version: int
+    updated_at: datetime
+
+
+class ProductCache:
+    # В кеше лежит готовый json ответа, при попадании ORM объект вообще не создается
+    PAGES_GENERATION_KEY = "products:pages:generation"
+    # Поколения продуктов, как у страниц, только для защиты заполнения кеша при промахе.
+    # Счетчик общий на группу id (id % GENERATION_SHARDS): счетчики не вытесняются и не
+    # протухают, поэтому по одному на продукт копились бы вечно. Запись соседнего продукта
+    # в худшем случае пропустит одно заполнение, устаревших данных это не дает
+    GENERATION_SHARDS = 4096
+
+    def __init__(self, backend: CacheBackend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_fills = 0
+
+    async def _lookup(self, key: str) -> bytes | None:
+        payload = await self.backend.get(key)
+        if payload is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return payload
+
+    @staticmethod
+    def product_key(product_id: int) -> str:
+        return f"products:id:{product_id}"
+
+    async def has_product(self, product_id: int) -> bool:
+        # без счетчиков попаданий: это проверка существования, а не отдача из кеша
+        return await self.backend.get(self.product_key(product_id)) is not None
+
+    async def get_product(self, product_id: int) -> CachedProduct | None:
+        value = await self._lookup(self.product_key(product_id))
+        if value is None:
+            return None
+        # первая строка - "версия updated_at", дальше json как есть
+        header, payload = value.split(b"\n", 1)
+        version, updated_at = header.decode().split(" ")
+        return CachedProduct(payload, int(version), datetime.fromisoformat(updated_at))
+
+    @classmethod
+    def generation_key(cls, product_id: int) -> str:
+        return f"products:generation:{product_id % cls.GENERATION_SHARDS}"
+
+    async def product_generation(self, product_id: int) -> bytes:
+        # читать до SELECT, которым заполняется кеш, и передать в set_product
+        return await self.backend.get(self.generation_key(product_id)) or b"0"
+
+    async def set_product(
+        self, product: Product, generation: bytes | None = None
+    ) -> CachedProduct:
+        entry = CachedProduct(
+            payload=ProductSchema.model_validate(product).model_dump_json().encode(),
+            version=product.version,
+            updated_at=product.updated_at,
+        )
+        await self.set_product_entry(product.id, entry, generation)
+        return entry
+
+    async def set_product_entry(
+        self, product_id: int, entry: CachedProduct, generation: bytes | None = None
+    ) -> None:
+        # generation - поколение до чтения из бд. Если с тех пор продукт изменили или удалили,
+        # прочитанное уже устарело, а invalidate_products могла отработать раньше этого set:
+        # тогда старые данные отдавались бы до ttl. Такое заполнение просто пропускаем
+        if (
+            generation is not None
+            and await self.product_generation(product_id) != generation
+        ):
+            self.stale_fills += 1
+            return
+        header = f"{entry.version} {entry.updated_at.isoformat()}\n".encode()
+        await self.backend.set(
+            self.product_key(product_id), header + entry.payload, self.ttl
+        )
+
+    async def invalidate_products(self, *product_ids: int) -> None:
+        # сначала поколение, потом удаление: заполнение, которое проверит поколение между ними,
+        # уже увидит новое и ничего не запишет
+        for key in {self.generation_key(pk) for pk in product_ids}:
+            await self.backend.incr(key)
+        await self.backend.delete(*(self.product_key(pk) for pk in product_ids))
+
+    # Страницы списка не удаляем по одной: любая запись увеличивает "поколение",
+    # оно входит в ключ страницы, и все старые страницы просто перестают читаться
+    async def pages_generation(self) -> bytes:
+        return await self.backend.get(self.PAGES_GENERATION_KEY) or b"0"
+
+    async def page_key(self, **params) -> str:
+        generation = await self.pages_generation()
+        # json, а не склейка name=value: "&" и "=" внутри значений не дают двум разным
+        # наборам параметров один ключ, и None отличается от строки "None"
+        query = json.dumps(params, sort_keys=True)
+        return f"products:pages:{generation.decode()}:{query}"
+
+    async def get_page(self, key: str) -> bytes | None:
+        return await self._lookup(key)
+
+    async def set_page(self, key: str, payload: bytes) -> None:
+        await self.backend.set(key, payload, self.ttl)
+
+    async def invalidate_pages(self) -> None:
+        await self.backend.incr(self.PAGES_GENERATION_KEY)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_fills": self.stale_fills,
+        }
+
+
+product_cache = ProductCache(
+    backend=create_cache_backend(settings.cache),
+    ttl=settings.cache.ttl,
+)
@@ -1,17 +1,201 @@
-from sqlalchemy import select
+from typing import AsyncIterator, Iterator, Sequence, TypeVar
+
+from sqlalchemy import select, insert, update, delete, func, text, or_, tuple_, case
+from sqlalchemy import ColumnElement, Select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.engine import Result
+from sqlalchemy.engine import Result, Row
+from core.loader import Loaders
 from core.models import Product
-from api_v1.products.schemas import ProductCreate, ProductUpdate, ProductUpdatePartial
+from api_v1.products.cache import product_cache
+from api_v1.products.pagination import Cursor
+from api_v1.products.schemas import (
+    ProductCreate,
+    ProductUpdate,
+    ProductUpdatePartial,
+    ProductBulkUpdate,
+    ProductFilter,
+)
+
+T = TypeVar("T")
+
+
+def _batched(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+SORT_COLUMNS = {"id": Product.id, "price": Product.price}
+
+
+def text_search_clause(dialect_name: str, q: str) -> ColumnElement[bool]:
+    if dialect_name == "postgresql":
+        # search_vector - tsvector колонка с GIN индексом (заполняет триггер), есть только в постгресе
+        # (см. миграцию), поэтому в модели ее нет и локальная sqlite создается без нее
+        return text(
+            "product.search_vector @@ websearch_to_tsquery('simple', :q)"
+        ).bindparams(q=q)
+    # autoescape: % и _ из запроса ищутся как обычные символы, а не как шаблон LIKE
+    return or_(
+        Product.name.icontains(q, autoescape=True),
+        Product.description.icontains(q, autoescape=True),
+    )
 
 
-async def get_products(session: AsyncSession) -> list[Product]:
-    stmt = select(Product).order_by(Product.id)
+def products_statement(
+    dialect_name: str,
+    filters: ProductFilter = ProductFilter(),
+    after: Cursor | None = None,
+) -> Select:
+    stmt = select(Product)
+    if filters.min_price is not None:
+        stmt = stmt.where(Product.price >= filters.min_price)
+    if filters.max_price is not None:
+        stmt = stmt.where(Product.price <= filters.max_price)
+    if filters.name_prefix:
+        stmt = stmt.where(Product.name.startswith(filters.name_prefix, autoescape=True))
+    if filters.q:
+        stmt = stmt.where(text_search_clause(dialect_name, filters.q))
+
+    descending = filters.sort.startswith("-")
+    column = SORT_COLUMNS[filters.sort.lstrip("-")]
+    # id всегда последний в сортировке, так порядок однозначный даже при одинаковой цене
+    order_columns = [column, Product.id] if column is not Product.id else [Product.id]
+    stmt = stmt.order_by(*(c.desc() if descending else c for c in order_columns))
+
+    # keyset пагинация: вместо OFFSET ищем по индексу сразу с нужного места,
+    # поэтому стоимость запроса не растет с номером страницы
+    if after is not None:
+        position = [after.value, after.id] if column is not Product.id else [after.id]
+        keys = tuple_(*order_columns)
+        stmt = stmt.where(
+            keys < tuple_(*position) if descending else keys > tuple_(*position)
+        )
+    return stmt
+
+
+async def get_products(
+    session: AsyncSession,
+    filters: ProductFilter = ProductFilter(),
+    after: Cursor | None = None,
+    limit: int | None = None,
+) -> list[Product]:
+    stmt = products_statement(session.get_bind().dialect.name, filters, after)
+    if limit is not None:
+        stmt = stmt.limit(limit)
     result: Result = await session.execute(stmt)
     products = result.scalars().all()
     return list(products)
 
 
+def next_page_cursor(last: Product | Row, filters: ProductFilter) -> Cursor:
+    sort_key = filters.sort.lstrip("-")
+    return Cursor(
+        id=last.id,
+        value=getattr(last, sort_key) if sort_key != "id" else None,
+        sort=filters.sort,
+    )
+
+
+async def get_products_page(
+    session: AsyncSession,
+    limit: int,
+    filters: ProductFilter = ProductFilter(),
+    after: Cursor | None = None,
+) -> tuple[list[Product], Cursor | None]:
+    # берем на одну строку больше, чтобы понять есть ли следующая страница без COUNT(*)
+    products = await get_products(
+        session=session, filters=filters, after=after, limit=limit + 1
+    )
+    if len(products) > limit:
+        products = products[:limit]
+        return products, next_page_cursor(products[-1], filters)
+    return products, None
+
+
+# Те же запросы, но только нужные колонки и Row вместо ORM объектов:
+# нет identity map, нет отслеживания изменений, нет валидации from_attributes
+PRODUCT_COLUMNS = (Product.name, Product.description, Product.price, Product.id)
+
+
+async def get_product_rows_page(
+    session: AsyncSession,
+    limit: int,
+    filters: ProductFilter = ProductFilter(),
+    after: Cursor | None = None,
+) -> tuple[list[Row], Cursor | None]:
+    stmt = products_statement(session.get_bind().dialect.name, filters, after)
+    stmt = stmt.with_only_columns(*PRODUCT_COLUMNS).limit(limit + 1)
+    rows = list(await session.execute(stmt))
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, next_page_cursor(rows[-1], filters)
+    return rows, None
+
+
+async def get_product_row(session: AsyncSession, product_id: int) -> Row | None:
+    # version и updated_at нужны для ETag, в тело ответа они не попадают
+    stmt = select(*PRODUCT_COLUMNS, Product.version, Product.updated_at).where(
+        Product.id == product_id
+    )
+    result = await session.execute(stmt)
+    return result.one_or_none()
+
+
+async def load_products(
+    loaders: Loaders, product_ids: Sequence[int]
+) -> list[Product | None]:
+    # через лоадер запроса: SELECT на batch_size id вместо SELECT на каждый id
+    return await loaders[Product].load_many(product_ids)
+
+
+async def get_products_state(session: AsyncSession) -> Row:
+    # Из этого строится ETag списка: любая запись двигает max(updated_at), удаление меняет count.
+    # Поэтому last_modified идет только в ETag, отдельным Last-Modified он был бы неверен.
+    # max(version) тут не подходит - версия у каждой строки своя и у другой строки может не вырасти.
+    # max берется из ix_product_updated_at, count - index only scan, строки таблицы не читаются
+    stmt = select(
+        func.count(Product.id).label("count"),
+        func.max(Product.updated_at).label("last_modified"),
+    )
+    result = await session.execute(stmt)
+    return result.one()
+
+
+async def stream_products(
+    session: AsyncSession,
+    chunk_size: int,
+    filters: ProductFilter = ProductFilter(),
+) -> AsyncIterator[list[Product]]:
+    # stream_scalars работает через серверный курсор, yield_per ограничивает буфер,
+    # так что в памяти одновременно не больше chunk_size объектов
+    stmt = products_statement(session.get_bind().dialect.name, filters)
+    result = await session.stream_scalars(stmt.execution_options(yield_per=chunk_size))
+    async for chunk in result.partitions():
+        yield list(chunk)
+
+
+async def stream_product_rows(
+    session: AsyncSession,
+    chunk_size: int,
+    filters: ProductFilter = ProductFilter(),
+) -> AsyncIterator[list[Row]]:
+    stmt = products_statement(session.get_bind().dialect.name, filters)
+    stmt = stmt.with_only_columns(*PRODUCT_COLUMNS)
+    result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+    async for chunk in result.partitions():
+        yield list(chunk)
+
+
+async def prime_statements(session: AsyncSession) -> None:
+    # Прогрев на старте: те же запросы, что у горячих ручек продуктов. Значения параметров
+    # не важны, SQL текст тот же, и asyncpg подготавливает statements на этом соединении
+    await get_product(session=session, product_id=0)
+    await get_product_row(session=session, product_id=0)
+    await get_products_state(session=session)
+    await get_products_page(session=session, limit=1)
+    await get_product_rows_page(session=session, limit=1)
+
+
 async def get_product(session: AsyncSession, product_id: int) -> Product | None:
     return await session.get(Product, product_id)
 
@@ -27,21 +211,206 @@ async def create_product(session: AsyncSession, product_in: ProductCreate) -> Pr
     # объект будет в том состоянии в котором мы его сохраним,
     # а не идем за ним в БД дополнительно чтобы вернуть.
     # У нас асинхронное взаимодействие и это могут быть не самые актуальные данные
+    # write-through, следующий GET уже из кеша. Id новый, более ранних записей у него нет
+    await product_cache.set_product(product)
+    await product_cache.invalidate_pages()
     return product
 
 
+async def get_product_version(session: AsyncSession, product_id: int) -> int | None:
+    stmt = select(Product.version).where(Product.id == product_id)
+    return await session.scalar(stmt)
+
+
 async def update_product(
     session: AsyncSession,
-    product: Product,
+    product_id: int,
     product_update: ProductUpdate | ProductUpdatePartial,
     partial: bool = False,
-) -> Product:  # http put заменяет полностью объект, patch - частично
-    for name, value in product_update.model_dump(exclude_unset=partial).items():
-        setattr(product, name, value)
+    version: int | None = None,
+) -> Product | None:  # http put заменяет полностью объект, patch - частично
+    # Один UPDATE ... WHERE id = ? [AND version = ?] RETURNING вместо чтения объекта и flush:
+    # один round trip, без блокировок строк, а конкурентная запись с той же версией просто
+    # не найдет строку. None - продукта нет или версия уже другая, отличает вызывающий
+    values = product_update.model_dump(exclude_unset=partial)
+    if not values:
+        # PATCH {} ничего не меняет: version и updated_at не сдвигаем, иначе ETag у клиентов
+        # и кеши устареют без изменения данных. Отдаем текущую строку
+        stmt = select(Product).where(Product.id == product_id)
+        if version is not None:
+            stmt = stmt.where(Product.version == version)
+        return await session.scalar(stmt)
+    stmt = (
+        update(Product)
+        .where(Product.id == product_id)
+        .values(**values, version=Product.version + 1)
+        .returning(Product)
+    )
+    if version is not None:
+        stmt = stmt.where(Product.version == version)
+    result = await session.scalars(stmt)
+    product = result.one_or_none()
     await session.commit()
+    if product is not None:
+        # Только инвалидация, без write-through: два одновременных UPDATE могут положить
+        # в кеш свои версии в обратном порядке, и старая провисела бы до ttl
+        await product_cache.invalidate_products(product_id)
+        await product_cache.invalidate_pages()
     return product
 
 
-async def delete_product(session: AsyncSession, product: Product) -> None:
-    await session.delete(product)
+async def delete_product(
+    session: AsyncSession,
+    product_id: int,
+    version: int | None = None,
+) -> bool:
+    stmt = delete(Product).where(Product.id == product_id).returning(Product.id)
+    if version is not None:
+        stmt = stmt.where(Product.version == version)
+    result = await session.scalars(stmt)
+    deleted = result.one_or_none() is not None
+    await session.commit()
+    if deleted:
+        await product_cache.invalidate_products(product_id)
+        await product_cache.invalidate_pages()
+    return deleted
+
+
+# Bulk операции: одна транзакция на весь запрос и один statement на батч,
+# вместо add + commit на каждый объект
+
+
+async def create_products_bulk(
+    session: AsyncSession,
+    products_in: Sequence[ProductCreate],
+    batch_size: int,
+) -> list[Product]:
+    products: list[Product] = []
+    for batch in _batched(products_in, batch_size):
+        # многострочный INSERT ... VALUES (...), (...) RETURNING, порядок строк как во входе
+        stmt = (
+            insert(Product)
+            .values([product_in.model_dump() for product_in in batch])
+            .returning(Product)
+        )
+        result = await session.scalars(stmt)
+        products.extend(result.all())
+    await session.commit()
+    await product_cache.invalidate_pages()
+    return products
+
+
+async def copy_products(
+    session: AsyncSession,
+    products_in: Sequence[ProductCreate],
+) -> None:
+    # Для импорта из файла: на постгресе через COPY (в разы быстрее INSERT, нет лимита
+    # параметров), на остальных бд - многострочный INSERT. Без RETURNING, объекты не создаются
+    connection = await session.connection()
+    if connection.dialect.driver == "asyncpg":
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection  # сам asyncpg.Connection
+        if not driver_connection.is_in_transaction():
+            # Адаптер sqlalchemy открывает транзакцию asyncpg лениво, перед первым запросом
+            # через него самого. COPY идет мимо адаптера и без этого закоммитился бы сразу,
+            # а rollback сессии при ошибке дальше в пачке его бы уже не отменил
+            await connection.exec_driver_sql("SELECT 1")
+        await driver_connection.copy_records_to_table(
+            Product.__tablename__,
+            columns=["name", "description", "price"],
+            records=[
+                (product_in.name, product_in.description, product_in.price)
+                for product_in in products_in
+            ],
+        )
+    else:
+        await session.execute(
+            insert(Product).values(
+                [product_in.model_dump() for product_in in products_in]
+            )
+        )
+    await session.commit()
+    await product_cache.invalidate_pages()
+
+
+# UPDATE для bulk PATCH: через таблицу, а не ORM bulk по первичному ключу - тот из-за
+# version_id_col требует версию в каждой строке и шлет по одному UPDATE на строку.
+# Один UPDATE на батч: значение каждого поля выбирается CASE по id, а RETURNING сразу
+# говорит, какие строки нашлись - отдельный SELECT существующих id не нужен
+BULK_UPDATE_FIELDS = ("name", "description", "price")
+
+
+def bulk_update_statement(rows: dict[int, dict]):
+    # rows: id -> только переданные поля. Поле, которое в батче не передал никто, не трогаем
+    table = Product.__table__
+    values = {}
+    for name in BULK_UPDATE_FIELDS:
+        whens = {id: fields[name] for id, fields in rows.items() if name in fields}
+        if whens:
+            values[name] = case(whens, value=table.c.id, else_=table.c[name])
+    # updated_at ставится через onupdate колонки
+    return (
+        update(table)
+        .where(table.c.id.in_(rows))
+        .values(values | {"version": table.c.version + 1})
+        .returning(table.c.id)
+    )
+
+
+def bulk_update_fields(item: ProductBulkUpdate) -> dict:
+    # None значит "оставить как было", поэтому поле без значения - не изменение
+    return {
+        name: value
+        for name in BULK_UPDATE_FIELDS
+        if (value := getattr(item, name)) is not None
+    }
+
+
+async def update_products_bulk(
+    session: AsyncSession,
+    products_update: Sequence[ProductBulkUpdate],
+    batch_size: int,
+) -> tuple[set[int], set[int]]:
+    # (обновленные id, id без изменений), остальные не найдены. Элементы без полей в UPDATE
+    # не попадают: иначе строка осталась бы как есть, но version и updated_at все равно сдвинулись бы
+    updated_ids: set[int] = set()
+    unchanged_ids: set[int] = set()
+    for batch in _batched(products_update, batch_size):
+        rows: dict[int, dict] = {}
+        empty_ids: set[int] = set()
+        for item in batch:
+            if fields := bulk_update_fields(item):
+                # id дважды в батче: поля сливаются, из одинаковых побеждает последнее
+                rows.setdefault(item.id, {}).update(fields)
+            else:
+                empty_ids.add(item.id)
+        if rows:
+            updated_ids.update(await session.scalars(bulk_update_statement(rows)))
+        # существование пустых элементов проверяем, только если такие вообще пришли
+        empty_ids -= rows.keys()
+        if empty_ids:
+            stmt = select(Product.id).where(Product.id.in_(empty_ids))
+            unchanged_ids.update(await session.scalars(stmt))
+    await session.commit()
+    # id мог прийти дважды в разных батчах: пустым и с полями, тогда он все-таки обновлен
+    unchanged_ids -= updated_ids
+    if updated_ids:
+        await product_cache.invalidate_products(*updated_ids)
+        await product_cache.invalidate_pages()
+    return updated_ids, unchanged_ids
+
+
+async def delete_products_bulk(
+    session: AsyncSession,
+    product_ids: Sequence[int],
+    batch_size: int,
+) -> set[int]:
+    deleted_ids: set[int] = set()
+    for batch in _batched(product_ids, batch_size):
+        stmt = delete(Product).where(Product.id.in_(batch)).returning(Product.id)
+        result = await session.scalars(stmt)
+        deleted_ids.update(result.all())
     await session.commit()
+    await product_cache.invalidate_products(*deleted_ids)
+    await product_cache.invalidate_pages()
+    return deleted_ids
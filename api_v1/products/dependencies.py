@@ -1,18 +1,27 @@
-from typing import Annotated
+from typing import Annotated, Literal
 
-from fastapi import Path, Depends, HTTPException, status
+from fastapi import Path, Query, Header, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.conditional import etag_matches, parse_etags, strong_etag
+from core.config import settings
 from core.models import db_helper, Product
+from core.single_flight import get_one, single_flight
 
 from . import crud
+from .cache import CachedProduct, product_cache
+from .pagination import Cursor, cursor_value_fits, decode_cursor
+from .write_behind import product_write_queue
+from .schemas import INT_MAX, MAX_PRICE, ProductFilter, product_row_adapter
 
 
 async def product_by_id(
     product_id: Annotated[int, Path(..., ge=1, le=1_000_000)],
-    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+    session: AsyncSession = Depends(db_helper.session_dependency),
 ) -> Product:
-    product = await crud.get_product(session=session, product_id=product_id)
+    # популярный товар: сотни одновременных GET делают один SELECT на одном соединении
+    product = await get_one(session, Product, product_id)
+    await db_helper.release_connection(session)
     if product is not None:
         return product
 
@@ -20,3 +29,186 @@ async def product_by_id(
         status_code=status.HTTP_404_NOT_FOUND,
         detail=f"Product id {product_id} not found!",
     )
+
+
+async def product_expected_version(
+    product_id: Annotated[int, Path(..., ge=1, le=1_000_000)],
+    if_match: Annotated[str | None, Header()] = None,
+    session: AsyncSession = Depends(db_helper.session_dependency),
+) -> int | None:
+    # If-Match с ETag из GET - это версия, которую клиент видел. Без заголовка или с "*"
+    # пишем без проверки версии. 400 - только если заголовок не разобрать
+    if if_match is None or if_match.strip() == "*":
+        return None
+    try:
+        etags = parse_etags(if_match)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid If-Match header {if_match!r}",
+        )
+    # If-Match сравнивается строго (RFC 9110 13.1.1): слабый ETag не совпадает никогда.
+    # Версия больше INTEGER колонки тоже ни с чем не совпадет, в бд ее не отправить
+    versions = [
+        int(etag[1:-1])
+        for etag in etags
+        if not etag.startswith("W/")
+        and etag[1:-1].isdigit()
+        and int(etag[1:-1]) <= INT_MAX
+    ]
+    if len(versions) == 1:
+        # одну версию проверяет сам UPDATE/DELETE, без чтения: не совпала - тоже 412
+        # (product_write_failed)
+        return versions[0]
+    if versions:
+        # какой из нескольких ETag текущий, без чтения версии не узнать.
+        # Сначала дописываем write-behind изменения, иначе версия была бы старой
+        await flush_pending(product_id)
+        version = await crud.get_product_version(session=session, product_id=product_id)
+        if version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product id {product_id} not found!",
+            )
+        if etag_matches(if_match, strong_etag(version), weak=False):
+            return version
+    raise HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail=f"If-Match {if_match!r} does not match product id {product_id}",
+    )
+
+
+async def flush_pending(product_id: int) -> None:
+    # Синхронная запись поверх еще не сброшенных write-behind изменений: сначала дописываем их,
+    # иначе очередь запишет их позже и затрет этот запрос
+    try:
+        await product_write_queue.flush_product(product_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Product id {product_id} has pending updates that failed to save",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def ensure_product_exists(session: AsyncSession, product_id: int) -> None:
+    # для PATCH в очередь: после 202 про несуществующий продукт клиенту уже не сказать.
+    # Продукт в очереди или в кеше точно есть, иначе один SELECT по первичному ключу
+    if product_write_queue.is_pending(product_id):
+        return
+    if await product_cache.has_product(product_id):
+        return
+    if await crud.get_product_version(session=session, product_id=product_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product id {product_id} not found!",
+        )
+
+
+async def product_write_failed(session: AsyncSession, product_id: int) -> HTTPException:
+    # UPDATE/DELETE не нашел строку: только тут, уже после неудачи, смотрим почему.
+    # Строка есть - значит не совпала версия из If-Match, это 412 как и любой
+    # неудавшийся If-Match (RFC 9110 13.1.1)
+    version = await crud.get_product_version(session=session, product_id=product_id)
+    if version is None:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product id {product_id} not found!",
+        )
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail=f"Product id {product_id} was modified, current version {version}",
+    )
+
+
+async def fill_product_cache(product_id: int, session: AsyncSession) -> CachedProduct:
+    # Поколение читается до SELECT: если продукт успели изменить или удалить, пока мы читали,
+    # устаревшая запись в кеш не попадет (ProductCache.set_product_entry)
+    generation = await product_cache.product_generation(product_id)
+    if not settings.pagination.fast_json:
+        product = await product_by_id(product_id=product_id, session=session)
+        return await product_cache.set_product(product, generation)
+
+    row = await crud.get_product_row(session=session, product_id=product_id)
+    await db_helper.release_connection(session)
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product id {product_id} not found!",
+        )
+    data = row._asdict()
+    entry = CachedProduct(
+        version=data.pop("version"),
+        updated_at=data.pop("updated_at"),
+        payload=product_row_adapter.dump_json(data),
+    )
+    await product_cache.set_product_entry(product_id, entry, generation)
+    return entry
+
+
+async def product_json_by_id(
+    product_id: Annotated[int, Path(..., ge=1, le=1_000_000)],
+    session: AsyncSession = Depends(db_helper.primary_read_session_dependency),
+) -> CachedProduct:
+    # read-through: при промахе читаем из основной бд и кладем в кеш уже готовый json.
+    # Заполнение целиком под single-flight: ждущие получают запись первого (она неизменяемая)
+    # и сами в кеш не пишут - их поколение могло быть прочитано уже после записи в бд,
+    # а данные первого - до нее
+    cached = await product_cache.get_product(product_id)
+    if cached is not None:
+        return cached
+    return await single_flight.do(
+        ("product_json", product_id),
+        lambda: fill_product_cache(product_id=product_id, session=session),
+    )
+
+
+async def product_filter(
+    min_price: Annotated[int | None, Query(ge=0, le=MAX_PRICE)] = None,
+    max_price: Annotated[int | None, Query(ge=0, le=MAX_PRICE)] = None,
+    name_prefix: Annotated[str | None, Query(min_length=1, max_length=100)] = None,
+    q: Annotated[str | None, Query(min_length=1, max_length=200)] = None,
+    sort: Annotated[Literal["id", "-id", "price", "-price"], Query()] = "id",
+) -> ProductFilter:
+    return ProductFilter(
+        min_price=min_price,
+        max_price=max_price,
+        name_prefix=name_prefix,
+        q=q,
+        sort=sort,
+    )
+
+
+async def products_cursor(
+    filters: Annotated[ProductFilter, Depends(product_filter)],
+    after_id: Annotated[int | None, Query(ge=0, le=INT_MAX)] = None,
+    cursor: Annotated[str | None, Query()] = None,
+) -> Cursor | None:
+    # cursor из ответа имеет приоритет, after_id оставлен для ручных запросов по id
+    if cursor is None:
+        if after_id is None:
+            return None
+        if filters.sort != "id":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="after_id works only with sort=id, use cursor",
+            )
+        return Cursor(id=after_id)
+    try:
+        decoded = decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid cursor {cursor!r}",
+        )
+    if decoded.sort != filters.sort:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cursor was issued for sort={decoded.sort}",
+        )
+    if not cursor_value_fits(decoded):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid cursor {cursor!r}",
+        )
+    return decoded
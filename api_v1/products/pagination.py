@@ -0,0 +1,42 @@
+import base64
+
+from pydantic import BaseModel, ValidationError
+
+from .schemas import INT_MAX
+
+
+class Cursor(BaseModel):
+    # позиция последней строки страницы: id + значение колонки сортировки
+    id: int
+    value: int | str | None = None
+    sort: str = "id"
+
+
+# Тип значения в курсоре для каждого ключа сортировки, у "id" отдельного значения нет.
+# Курсор может прийти подделанный: строка вместо цены на постгресе упала бы 500 при bind
+SORT_VALUE_TYPES: dict[str, type] = {"id": type(None), "price": int}
+
+
+def cursor_value_fits(cursor: Cursor) -> bool:
+    # type(), а не isinstance: bool тоже int
+    if type(cursor.value) is not SORT_VALUE_TYPES.get(cursor.sort.lstrip("-")):
+        return False
+    return cursor.value is None or 0 <= cursor.value <= INT_MAX
+
+
+# Курсор непрозрачный для клиента: это просто base64 от json с позицией последней строки.
+# Клиент не должен его разбирать, а просто передает обратно в ?cursor=
+def encode_cursor(cursor: Cursor) -> str:
+    raw = cursor.model_dump_json(exclude_defaults=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        decoded = Cursor.model_validate_json(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, ValidationError) as exc:
+        raise ValueError(f"Invalid cursor {cursor!r}") from exc
+    if not 0 <= decoded.id <= INT_MAX:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return decoded
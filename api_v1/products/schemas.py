@@ -1,12 +1,22 @@
 from annotated_types import MinLen, MaxLen
-from pydantic import BaseModel, ConfigDict, conint
-from typing import Annotated
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator
+from typing import Annotated, Literal
+
+# pydantic на python < 3.12 требует именно этот TypedDict
+from typing_extensions import TypedDict
+
+# id, price и version в бд - INTEGER (int4 в постгресе). Больше этого asyncpg даже не отправит,
+# а sqlite упадет с OverflowError: значения из запроса проверяем до бд
+INT_MAX = 2**31 - 1
+# Field в Annotated, а не conint: conint внутри Annotated pydantic молча игнорирует
+MAX_PRICE = 1_000_000
+ProductId = Annotated[int, Field(ge=1, le=INT_MAX)]
 
 
 class ProductBase(BaseModel):
     name: str
     description: str
-    price: Annotated[int, conint(ge=1, le=1_000_000)]
+    price: Annotated[int, Field(ge=1, le=MAX_PRICE)]
 
 
 class ProductCreate(ProductBase):  # we dont want users to send us id to create product,
@@ -21,10 +31,80 @@ class ProductUpdate(ProductBase):
 class ProductUpdatePartial(ProductBase):
     name: str | None = None
     description: str | None = None
-    price: Annotated[int, conint(ge=1, le=1_000_000)] | None = None
+    price: Annotated[int, Field(ge=1, le=MAX_PRICE)] | None = None
+
+    # None тут только "поле не передано". Явный null в NOT NULL колонку - 422 сразу,
+    # а не 500 от бд на синхронном пути и не тихий пропуск в write-behind очереди
+    @field_validator("name", "description", "price")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may be omitted, but not null")
+        return value
 
 
 class Product(ProductBase):  # it will be return to users, with id
     model_config = ConfigDict(from_attributes=True)
 
-    id: Annotated[int, conint(ge=1, le=1_000_000)]
+    id: ProductId
+
+
+class ProductFilter(BaseModel):
+    min_price: int | None = Field(None, ge=0, le=MAX_PRICE)
+    max_price: int | None = Field(None, ge=0, le=MAX_PRICE)
+    name_prefix: str | None = Field(None, min_length=1, max_length=100)
+    # поиск по name и description
+    q: str | None = Field(None, min_length=1, max_length=200)
+    # только ключи, под которые есть индекс (pk и ix_product_price_id). "-" - по убыванию
+    sort: Literal["id", "-id", "price", "-price"] = "id"
+
+
+class ProductsPage(BaseModel):
+    items: list[Product]
+    next_cursor: str | None = None  # None - значит это последняя страница
+
+
+# для bulk PATCH id передается в теле, а не в пути
+class ProductBulkUpdate(ProductUpdatePartial):
+    id: ProductId
+
+
+class ProductBulkResult(BaseModel):
+    id: int
+    # found - GET /bulk нашел продукт.
+    # accepted - PATCH в режиме write-behind, в бд еще не записан.
+    # unchanged - в bulk PATCH не передано ни одного поля, строка не тронута
+    status: Literal[
+        "found", "created", "updated", "unchanged", "deleted", "not_found", "accepted"
+    ]
+    product: Product | None = None
+
+
+class ImportRowError(BaseModel):
+    line: int  # номер строки в файле, для csv считая заголовок
+    errors: list[dict]
+
+
+class ImportReport(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    errors: list[ImportRowError] = []  # первые bulk.import_max_errors ошибок
+
+
+# Быстрый путь отдачи: строки из бд (без ORM объектов) сериализуются сразу в json bytes
+# заранее собранным TypeAdapter, без валидации. Поля в том же порядке, что и в Product,
+# поэтому json получается байт в байт как у обычного пути и кеш общий
+class ProductRow(TypedDict):
+    name: str
+    description: str
+    price: int
+    id: int
+
+
+class ProductsPageRows(TypedDict):
+    items: list[ProductRow]
+    next_cursor: str | None
+
+
+product_row_adapter = TypeAdapter(ProductRow)
+products_page_rows_adapter = TypeAdapter(ProductsPageRows)
@@ -0,0 +1,182 @@
+# Потоковый импорт и экспорт каталога продуктов в CSV и NDJSON.
+# Файл читается кусками, строки валидируются ProductCreate пачками по bulk.batch_size
+# и сразу пишутся в бд (COPY на постгресе), экспорт идет через серверный курсор,
+# так что память не зависит от размера файла. Используется в /products/import и /products/export
+# и из командной строки: python -m api_v1.products (см. __main__.py)
+import codecs
+import csv
+import io
+import json
+import logging
+from typing import AsyncIterator, Literal
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api_v1.products import crud
+from api_v1.products.schemas import (
+    ImportReport,
+    ImportRowError,
+    ProductCreate,
+    product_row_adapter,
+)
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Format = Literal["csv", "ndjson"]
+MEDIA_TYPES: dict[Format, str] = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+# (номер строки, данные строки или None, текст ошибки разбора или None)
+ParsedRow = tuple[int, dict | None, str | None]
+
+
+def format_from_media_type(content_type: str | None) -> Format | None:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    for format, known in MEDIA_TYPES.items():
+        if media_type == known:
+            return format
+    return None
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, str]]:
+    # куски приходят произвольной длины, utf-8 символ или строка могут быть разрезаны между ними
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    tail = ""
+    line_number = 0
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            line_number += 1
+            yield line_number, line.removesuffix("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield line_number + 1, tail.removesuffix("\r")
+
+
+async def parse_ndjson(
+    lines: AsyncIterator[tuple[int, str]]
+) -> AsyncIterator[ParsedRow]:
+    async for line_number, line in lines:
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as exc:
+            yield line_number, None, f"Invalid JSON: {exc}"
+            continue
+        if not isinstance(data, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        yield line_number, data, None
+
+
+def parse_csv_record(lines: list[str]) -> list[str] | None:
+    # Строки одной записи (с "\n" на конце, как их читает csv из файла) -> значения.
+    # None - данные кончились внутри кавычек: в значении перевод строки, нужна следующая строка.
+    # Кавычку внутри значения без кавычек (TV 55" screen) csv считает обычным символом
+    try:
+        return next(csv.reader(lines, strict=True), [])
+    except csv.Error as exc:
+        if "unexpected end of data" in str(exc):
+            return None
+        # strict еще и запрещает текст после закрывающей кавычки, а без него csv такое читает
+        return next(csv.reader(lines), [])
+
+
+async def parse_csv(lines: AsyncIterator[tuple[int, str]]) -> AsyncIterator[ParsedRow]:
+    # первая строка - заголовок, лишние колонки (например id из экспорта) игнорируются.
+    # В памяти только строки текущей записи; их размер ограничивает csv.field_size_limit()
+    header: list[str] | None = None
+    record: list[str] = []
+    record_line = 0
+    async for line_number, line in lines:
+        if not record:
+            record_line = line_number
+        record.append(line + "\n")
+        try:
+            values = parse_csv_record(record)
+        except csv.Error as exc:
+            record = []
+            yield record_line, None, f"Invalid CSV: {exc}"
+            continue
+        if values is None:
+            continue
+        record = []
+        if not values:
+            continue  # пустая строка
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield record_line, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield record_line, dict(zip(header, values)), None
+    if record:
+        yield record_line, None, "Unterminated quoted field"
+
+
+PARSERS = {"csv": parse_csv, "ndjson": parse_ndjson}
+
+
+def add_error(report: ImportReport, line: int, errors: list[dict]) -> None:
+    report.failed += 1
+    if len(report.errors) < settings.bulk.import_max_errors:
+        report.errors.append(ImportRowError(line=line, errors=errors))
+
+
+async def import_products(
+    session: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    format: Format,
+    batch_size: int = settings.bulk.batch_size,
+) -> AsyncIterator[ImportReport]:
+    # Отдает отчет после каждой записанной пачки (прогресс), последний - итоговый.
+    # Каждая пачка коммитится сразу: ошибочные строки пропускаются, а не валят весь файл
+    report = ImportReport()
+    batch: list[ProductCreate] = []
+    async for line_number, data, error in PARSERS[format](iter_lines(chunks)):
+        if error is not None:
+            add_error(report, line_number, [{"msg": error}])
+            continue
+        try:
+            batch.append(ProductCreate.model_validate(data))
+        except ValidationError as exc:
+            errors = exc.errors(
+                include_url=False, include_context=False, include_input=False
+            )
+            add_error(report, line_number, [dict(detail) for detail in errors])
+            continue
+        if len(batch) >= batch_size:
+            await crud.copy_products(session=session, products_in=batch)
+            report.imported += len(batch)
+            batch = []
+            logger.info(
+                "products import: %s imported, %s failed",
+                report.imported,
+                report.failed,
+            )
+            yield report
+    if batch:
+        await crud.copy_products(session=session, products_in=batch)
+        report.imported += len(batch)
+    yield report
+
+
+async def export_products(
+    session: AsyncSession,
+    format: Format,
+    chunk_size: int = settings.pagination.stream_chunk_size,
+) -> AsyncIterator[bytes]:
+    columns = [column.key for column in crud.PRODUCT_COLUMNS]
+    if format == "csv":
+        yield (",".join(columns) + "\r\n").encode()
+    async for rows in crud.stream_product_rows(session=session, chunk_size=chunk_size):
+        if format == "ndjson":
+            yield b"".join(
+                product_row_adapter.dump_json(row._asdict()) + b"\n" for row in rows
+            )
+            continue
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        yield buffer.getvalue().encode()
@@ -1,68 +1,404 @@
-from fastapi import APIRouter, status, Depends
+from typing import Annotated, AsyncIterator
 
-from api_v1.products import crud
+from fastapi import (
+    APIRouter,
+    status,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Body,
+    Request,
+    Response,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api_v1.products import crud, transfer
 from api_v1.products.schemas import (
+    ImportReport,
     Product,
     ProductCreate,
     ProductUpdate,
     ProductUpdatePartial,
+    ProductsPage,
+    ProductBulkUpdate,
+    ProductBulkResult,
+    ProductFilter,
+    ProductId,
+    product_row_adapter,
+    products_page_rows_adapter,
+)
+from api_v1.products.cache import CachedProduct, product_cache
+from api_v1.products.dependencies import (
+    ensure_product_exists,
+    flush_pending,
+    product_expected_version,
+    product_filter,
+    product_json_by_id,
+    product_write_failed,
+    products_cursor,
 )
-from api_v1.products.dependencies import product_by_id
+from api_v1.products.pagination import Cursor, encode_cursor
+from api_v1.products.write_behind import WriteQueueFull, product_write_queue
 from sqlalchemy.ext.asyncio import AsyncSession
+from core.conditional import (
+    digest_etag,
+    is_not_modified,
+    strong_etag,
+    validator_headers,
+)
+from core.config import settings
+from core.loader import Loaders, loaders_dependency
+from core.response_cache import cache_response
+from core.responses import RawJSONResponse
+from core.single_flight import single_flight
 from core.models import db_helper
 
 router = APIRouter(tags=["Products"])
 
 
+async def iter_products_ndjson(filters: ProductFilter) -> AsyncIterator[bytes]:
+    # Своя сессия, а не из зависимости: генератор живет дольше обработчика,
+    # тело отдается уже после того как view вернул ответ
+    async with db_helper.session_factory(
+        bind=await db_helper.get_read_engine()
+    ) as session:
+        if settings.pagination.fast_json:
+            async for rows in crud.stream_product_rows(
+                session=session,
+                chunk_size=settings.pagination.stream_chunk_size,
+                filters=filters,
+            ):
+                yield b"".join(
+                    product_row_adapter.dump_json(row._asdict()) + b"\n" for row in rows
+                )
+            return
+
+        async for chunk in crud.stream_products(
+            session=session,
+            chunk_size=settings.pagination.stream_chunk_size,
+            filters=filters,
+        ):
+            yield b"".join(
+                Product.model_validate(product).model_dump_json().encode() + b"\n"
+                for product in chunk
+            )
+
+
+async def render_products_page(
+    session: AsyncSession,
+    limit: int,
+    filters: ProductFilter,
+    after: Cursor | None,
+) -> bytes:
+    if settings.pagination.fast_json:
+        rows, next_cursor = await crud.get_product_rows_page(
+            session=session, limit=limit, filters=filters, after=after
+        )
+        await db_helper.release_connection(session)
+        return products_page_rows_adapter.dump_json(
+            {
+                "items": [row._asdict() for row in rows],
+                "next_cursor": encode_cursor(next_cursor) if next_cursor else None,
+            }
+        )
+
+    products, next_cursor = await crud.get_products_page(
+        session=session, limit=limit, filters=filters, after=after
+    )
+    # соединение отдаем до сериализации, она на больших страницах дольше самого SELECT
+    await db_helper.release_connection(session)
+    page = ProductsPage(
+        items=products,
+        next_cursor=encode_cursor(next_cursor) if next_cursor else None,
+    )
+    return page.model_dump_json().encode()
+
+
+# Повторный одинаковый запрос отдается из памяти процесса до роутинга. Любая запись в продукты
+# меняет поколение страниц, и такие ответы перестают отдаваться раньше ttl.
+# Страницы и ответы кешируются, поэтому читаются с основной бд; с реплик идет stream и export
 @router.get("")
+@cache_response(ttl=settings.cache.ttl, version=product_cache.pages_generation)
 async def get_products(
-    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
-) -> list[Product]:
-    return await crud.get_products(session=session)
+    request: Request,
+    filters: Annotated[ProductFilter, Depends(product_filter)],
+    after: Annotated[Cursor | None, Depends(products_cursor)],
+    limit: Annotated[
+        int, Query(ge=1, le=settings.pagination.max_limit)
+    ] = settings.pagination.default_limit,
+    stream: bool = False,  # весь каталог построчно в NDJSON, без пагинации
+    session: AsyncSession = Depends(db_helper.primary_read_session_dependency),
+) -> ProductsPage:
+    if stream and (after is not None or "limit" in request.query_params):
+        # stream отдает весь каталог с начала, молча игнорировать страницу нельзя
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="stream returns the whole catalogue, limit and cursor do not apply",
+        )
+    params = dict(
+        after=after.model_dump_json() if after else None,
+        limit=limit,
+        **filters.model_dump(),
+    )
+    # 304 решается одним агрегатом по таблице, страница не читается и не сериализуется.
+    # Агрегат один для любых параметров, одновременные запросы списка делят один SELECT
+    state = await single_flight.do(
+        ("products_state",), lambda: crud.get_products_state(session)
+    )
+    await db_helper.release_connection(session)
+    etag = digest_etag(
+        state.count, state.last_modified, stream, *sorted(params.items())
+    )
+    # Без Last-Modified: удаление не двигает max(updated_at), и If-Modified-Since
+    # отдал бы 304 на список, где еще есть удаленная строка. ETag видит это по count
+    headers = validator_headers(etag, None)
+    if is_not_modified(request, etag, None):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if stream:
+        return StreamingResponse(
+            iter_products_ndjson(filters),
+            media_type="application/x-ndjson",
+            headers=headers,
+        )
+    cache_key = await product_cache.page_key(**params)
+    payload = await product_cache.get_page(cache_key)
+    if payload is None:
+        # в ключе страницы есть поколение: после записи это уже другой ключ
+        payload = await single_flight.do(
+            ("products_page", cache_key),
+            lambda: render_products_page(
+                session=session, limit=limit, filters=filters, after=after
+            ),
+        )
+        await product_cache.set_page(cache_key, payload)
+    return RawJSONResponse(payload, headers=headers)
 
 
 @router.post("", status_code=status.HTTP_201_CREATED)
 async def create_product(
     product_in: ProductCreate,
-    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+    session: AsyncSession = Depends(db_helper.session_dependency),
 ) -> Product:
     return await crud.create_product(session=session, product_in=product_in)
 
 
+# bulk, import и export объявлены раньше /{product_id}, иначе они попадут в параметр пути
+@router.get("/bulk")
+async def get_products_bulk(
+    ids: Annotated[list[ProductId], Query(max_length=settings.bulk.max_items)],
+    loaders: Annotated[Loaders, Depends(loaders_dependency)],
+) -> list[ProductBulkResult]:
+    # ?ids=1&ids=2...: все load в одном тике - один SELECT на batch_size id,
+    # повторы id в запросе в бд не уходят
+    products = await crud.load_products(loaders=loaders, product_ids=ids)
+    await db_helper.release_connection(loaders.session)
+    return [
+        ProductBulkResult(
+            id=product_id,
+            status="found" if product is not None else "not_found",
+            product=product,
+        )
+        for product_id, product in zip(ids, products)
+    ]
+
+
+@router.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def create_products_bulk(
+    products_in: Annotated[
+        list[ProductCreate], Body(max_length=settings.bulk.max_items)
+    ],
+    session: AsyncSession = Depends(db_helper.session_dependency),
+) -> list[ProductBulkResult]:
+    products = await crud.create_products_bulk(
+        session=session,
+        products_in=products_in,
+        batch_size=settings.bulk.batch_size,
+    )
+    return [
+        ProductBulkResult(id=product.id, status="created", product=product)
+        for product in products
+    ]
+
+
+@router.patch("/bulk")
+async def update_products_bulk(
+    products_update: Annotated[
+        list[ProductBulkUpdate], Body(max_length=settings.bulk.max_items)
+    ],
+    session: AsyncSession = Depends(db_helper.session_dependency),
+) -> list[ProductBulkResult]:
+    updated_ids, unchanged_ids = await crud.update_products_bulk(
+        session=session,
+        products_update=products_update,
+        batch_size=settings.bulk.batch_size,
+    )
+    return [
+        ProductBulkResult(
+            id=item.id,
+            status=(
+                "updated"
+                if item.id in updated_ids
+                else "unchanged" if item.id in unchanged_ids else "not_found"
+            ),
+        )
+        for item in products_update
+    ]
+
+
+@router.delete("/bulk")
+async def delete_products_bulk(
+    product_ids: Annotated[list[ProductId], Body(max_length=settings.bulk.max_items)],
+    session: AsyncSession = Depends(db_helper.session_dependency),
+) -> list[ProductBulkResult]:
+    deleted_ids = await crud.delete_products_bulk(
+        session=session,
+        product_ids=product_ids,
+        batch_size=settings.bulk.batch_size,
+    )
+    return [
+        ProductBulkResult(
+            id=product_id,
+            status="deleted" if product_id in deleted_ids else "not_found",
+        )
+        for product_id in product_ids
+    ]
+
+
+# Файл читается прямо из тела запроса (Content-Type: text/csv или application/x-ndjson),
+# без multipart, поэтому загрузка не копится ни в памяти, ни во временном файле
+@router.post("/import")
+async def import_products(
+    request: Request,
+    format: Annotated[transfer.Format | None, Query()] = None,
+    session: AsyncSession = Depends(db_helper.session_dependency),
+) -> ImportReport:
+    format = format or transfer.format_from_media_type(
+        request.headers.get("content-type")
+    )
+    if format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson, or pass ?format=",
+        )
+    async for report in transfer.import_products(
+        session=session, chunks=request.stream(), format=format
+    ):
+        pass  # промежуточные отчеты пишутся в лог, клиенту отдаем итоговый
+    return report
+
+
+async def iter_products_export(format: transfer.Format) -> AsyncIterator[bytes]:
+    # своя сессия по той же причине, что и в iter_products_ndjson
+    async with db_helper.session_factory(
+        bind=await db_helper.get_read_engine()
+    ) as session:
+        async for chunk in transfer.export_products(session=session, format=format):
+            yield chunk
+
+
+@router.get("/export")
+async def export_products(format: transfer.Format = "ndjson") -> StreamingResponse:
+    return StreamingResponse(
+        iter_products_export(format),
+        media_type=transfer.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'},
+    )
+
+
 @router.get("/{product_id}")
-async def get_product(product: Product = Depends(product_by_id)) -> Product:
-    return product
+async def get_product(
+    request: Request,
+    cached: CachedProduct = Depends(product_json_by_id),
+) -> Product:
+    etag = strong_etag(cached.version)
+    headers = validator_headers(etag, cached.updated_at)
+    if is_not_modified(request, etag, cached.updated_at):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return RawJSONResponse(cached.payload, headers=headers)
 
 
 @router.put("/{product_id}")
 async def update_product(
+    product_id: Annotated[int, Path(ge=1, le=1_000_000)],
     product_update: ProductUpdate,
-    product: Product = Depends(product_by_id),
-    session: AsyncSession = Depends(
-        db_helper.scoped_session_dependency
-    ),  # Fastapi кеширует зависимости, так что это будет тот же самый объект сессии из product_by_id
-):
-    return await crud.update_product(
-        session=session, product=product, product_update=product_update
+    response: Response,
+    version: Annotated[int | None, Depends(product_expected_version)],
+    session: AsyncSession = Depends(db_helper.session_dependency),
+) -> Product:
+    await flush_pending(product_id)
+    product = await crud.update_product(
+        session=session,
+        product_id=product_id,
+        product_update=product_update,
+        version=version,
     )
+    if product is None:
+        raise await product_write_failed(session=session, product_id=product_id)
+    response.headers.update(
+        validator_headers(strong_etag(product.version), product.updated_at)
+    )
+    return product
 
 
-@router.patch("/{product_id}")
+@router.patch(
+    "/{product_id}",
+    responses={status.HTTP_202_ACCEPTED: {"model": ProductBulkResult}},
+)
 async def update_product_partial(
+    product_id: Annotated[int, Path(ge=1, le=1_000_000)],
     product_update: ProductUpdatePartial,
-    product: Product = Depends(product_by_id),
-    session: AsyncSession = Depends(
-        db_helper.scoped_session_dependency
-    ),  # Fastapi кеширует зависимости, так что это будет тот же самый объект сессии из product_by_id
-):
-    return await crud.update_product(
-        session=session, product=product, product_update=product_update, partial=True
+    response: Response,
+    version: Annotated[int | None, Depends(product_expected_version)],
+    session: AsyncSession = Depends(db_helper.session_dependency),
+) -> Product:
+    # С If-Match версию надо проверить в момент записи, такие PATCH всегда идут синхронно.
+    # Пустому PATCH в очереди делать нечего, он просто отдает текущий продукт
+    fields = product_update.model_dump(exclude_unset=True)
+    if settings.write_behind.enabled and version is None and fields:
+        await ensure_product_exists(session=session, product_id=product_id)
+        try:
+            product_write_queue.put(product_id, fields)
+        except WriteQueueFull as exc:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Too many pending updates: {exc}",
+                headers={"Retry-After": "1"},
+            )
+        # 202: принято, но еще не записано. Если продукт удалят до записи, изменения
+        # отбросятся с предупреждением в логе. Готовый ответ идет мимо response_model
+        return JSONResponse(
+            ProductBulkResult(id=product_id, status="accepted").model_dump(),
+            status_code=status.HTTP_202_ACCEPTED,
+        )
+
+    await flush_pending(product_id)
+    product = await crud.update_product(
+        session=session,
+        product_id=product_id,
+        product_update=product_update,
+        partial=True,
+        version=version,
+    )
+    if product is None:
+        raise await product_write_failed(session=session, product_id=product_id)
+    response.headers.update(
+        validator_headers(strong_etag(product.version), product.updated_at)
     )
+    return product
 
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_product(
-    product: Product = Depends(product_by_id),
-    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+    product_id: Annotated[int, Path(ge=1, le=1_000_000)],
+    version: Annotated[int | None, Depends(product_expected_version)],
+    session: AsyncSession = Depends(db_helper.session_dependency),
 ) -> None:
-    await crud.delete_product(session=session, product=product)
+    # отложенные изменения пишутся до удаления, а не выкидываются потом молча
+    await flush_pending(product_id)
+    deleted = await crud.delete_product(
+        session=session, product_id=product_id, version=version
+    )
+    if not deleted:
+        raise await product_write_failed(session=session, product_id=product_id)
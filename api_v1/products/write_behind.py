@@ -0,0 +1,195 @@
+import asyncio
+import contextvars
+import logging
+
+from api_v1.products import crud
+from api_v1.products.schemas import ProductBulkUpdate
+from core.config import settings
+from core.models import db_helper
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueueFull(Exception):
+    pass
+
+
+class ProductWriteQueue:
+    # Write-behind для PATCH: изменения копятся в памяти по id продукта (последняя запись
+    # побеждает по каждому полю отдельно), фоновая задача пишет их пачкой через bulk UPDATE,
+    # когда набралось flush_size продуктов или прошло flush_interval секунд.
+    # Тысяча PATCH одного товара в секунду превращается в одну строку UPDATE.
+    # Очередь живет в процессе: при падении процесса не сброшенные изменения теряются
+    def __init__(self, max_pending: int, flush_size: int, flush_interval: float):
+        self.max_pending = max_pending
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pending: dict[int, dict] = {}
+        self.flushing: dict[int, dict] = {}  # изменения, которые сейчас пишутся в бд
+        self._flushed = asyncio.Event()  # будит ждущих после каждой записи
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self.accepted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.failed_flushes = 0
+
+    def open(self) -> None:
+        # на старте lifespan: после close() в этом же процессе (тесты, второй lifespan)
+        # очередь снова принимает записи. Event заново - он привязывается к своему event loop
+        self._closing = False
+        self._wakeup = asyncio.Event()
+
+    def start(self) -> None:
+        # Пересоздаем и упавшую задачу, и задачу другого event loop (второй lifespan, тесты),
+        # иначе записи молча копились бы без сброса
+        task = self._task
+        if (
+            task is not None
+            and not task.done()
+            and task.get_loop() is asyncio.get_running_loop()
+        ):
+            return
+        if task is not None and task.done() and not task.cancelled():
+            if task.exception() is not None:
+                logger.error(
+                    "write-behind flush task died, restarting",
+                    exc_info=task.exception(),
+                )
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        if len(self.pending) >= self.flush_size:
+            self._wakeup.set()
+        # Пустой контекст: create_task копирует контекст вызывающего, и из put() задача
+        # унесла бы current_scope и current_queries первого PATCH - SQL всех flush
+        # считался бы в метриках его роута и в его давно закрытой проверке N+1
+        self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    def put(self, product_id: int, fields: dict) -> None:
+        if self._closing:
+            raise WriteQueueFull("Write queue is shutting down")
+        # lifespan стартует задачу сам, тут - если приложение поднято без него или задача упала
+        self.start()
+        current = self.pending.get(product_id)
+        if current is None:
+            # новый продукт не влезает - клиент получит 503 и повторит позже,
+            # изменения уже стоящих в очереди продуктов принимаем всегда
+            if len(self.pending) >= self.max_pending:
+                self.rejected += 1
+                raise WriteQueueFull(f"{len(self.pending)} products are pending")
+            self.pending[product_id] = dict(fields)
+        else:
+            current.update(fields)
+            self.coalesced += 1
+        self.accepted += 1
+        if len(self.pending) >= self.flush_size:
+            self._wakeup.set()
+
+    def is_pending(self, product_id: int) -> bool:
+        return product_id in self.pending or product_id in self.flushing
+
+    async def flush_product(self, product_id: int) -> None:
+        # Перед синхронной записью (PUT, DELETE, PATCH с If-Match): отложенные изменения этого
+        # продукта пишутся сразу, иначе очередь записала бы их позже поверх этого запроса.
+        # Горячий продукт так не получает 412 раз за разом, пока к нему идут PATCH
+        while product_id in self.flushing:
+            await self._flushed.wait()
+        fields = self.pending.pop(product_id, None)
+        if fields is None:
+            return
+        await self._write_batch({product_id: fields})
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self.pending:
+            return
+        # Подменяем словарь целиком: пока идет UPDATE, новые PATCH копятся в новом.
+        # Продукты, которые прямо сейчас пишет flush_product, ждут следующего раза:
+        # два UPDATE одной строки одновременно могли бы лечь в бд в обратном порядке
+        batch, self.pending = self.pending, {}
+        for product_id in batch.keys() & self.flushing.keys():
+            self.pending[product_id] = batch.pop(product_id)
+        try:
+            await self._write_batch(batch)
+        except Exception:
+            pass  # уже в логе и снова в очереди, следующий flush попробует еще раз
+
+    async def _write_batch(self, batch: dict[int, dict]) -> None:
+        self.flushing.update(batch)
+        try:
+            await self._write(batch)
+        finally:
+            for product_id in batch:
+                del self.flushing[product_id]
+            self._flushed.set()
+            self._flushed = asyncio.Event()
+
+    async def _write(self, batch: dict[int, dict]) -> None:
+        try:
+            async with db_helper.session_factory() as session:
+                updated_ids, unchanged_ids = await crud.update_products_bulk(
+                    session=session,
+                    products_update=[
+                        ProductBulkUpdate(id=product_id, **fields)
+                        for product_id, fields in batch.items()
+                    ],
+                    batch_size=self.flush_size,
+                )
+        except Exception:
+            self.failed_flushes += 1
+            logger.exception("write-behind flush of %s products failed", len(batch))
+            # возвращаем в очередь, то что пришло за время flush новее и важнее
+            for product_id, fields in batch.items():
+                self.pending[product_id] = fields | self.pending.get(product_id, {})
+            raise
+        self.flushed += len(batch)
+        missing_ids = batch.keys() - updated_ids - unchanged_ids
+        if missing_ids:
+            # PATCH проверяет, что продукт есть, но его могли удалить до записи.
+            # 404 клиенту уже не отдать, ответ 202 ушел до записи
+            logger.warning(
+                "write-behind: products %s not found, updates dropped",
+                sorted(missing_ids),
+            )
+
+    async def close(self) -> None:
+        # на остановке приложения: новые записи не принимаем и дописываем все, что накопилось
+        self._closing = True
+        self._wakeup.set()
+        task, self._task = self._task, None
+        if (
+            task is not None
+            and not task.done()
+            and task.get_loop() is asyncio.get_running_loop()
+        ):
+            await task
+        await self.flush()
+        if self.pending:
+            logger.error("write-behind: %s products were not saved", len(self.pending))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": len(self.pending),
+            "accepted": self.accepted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+product_write_queue = ProductWriteQueue(
+    max_pending=settings.write_behind.max_pending,
+    flush_size=settings.write_behind.flush_size,
+    flush_interval=settings.write_behind.flush_interval,
+)
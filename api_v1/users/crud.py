@@ -0,0 +1,104 @@
+from typing import Iterable
+
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload, load_only, InstrumentedAttribute
+
+from core.models import Base, User, Post, Profile
+from api_v1.users import schemas
+
+# имя в ?include= -> связь модели User и схема, в которую она отдается
+INCLUDES: dict[str, tuple[InstrumentedAttribute, type[BaseModel]]] = {
+    "profile": (User.profile, schemas.Profile),
+    "posts": (User.post, schemas.Post),
+}
+
+
+def schema_columns(model: type[Base], schema: type[BaseModel]) -> list:
+    # только колонки, которые есть в схеме ответа, остальное не тянем из бд
+    column_names = model.__mapper__.column_attrs.keys()
+    return [
+        getattr(model, name) for name in schema.model_fields if name in column_names
+    ]
+
+
+def include_options(include: Iterable[str]) -> list:
+    options = []
+    for name in include:
+        relationship, schema = INCLUDES[name]
+        # один к одному (и многие к одному) - JOIN в тот же запрос, строк не прибавится.
+        # один ко многим - отдельный SELECT ... WHERE user_id IN (...),
+        # так JOIN не размножает строки пользователей
+        loader = selectinload if relationship.property.uselist else joinedload
+        related_model = relationship.property.mapper.class_
+        options.append(
+            loader(relationship).load_only(*schema_columns(related_model, schema))
+        )
+    return options
+
+
+async def get_users(
+    session: AsyncSession,
+    include: Iterable[str] = (),
+    after_id: int | None = None,
+    limit: int | None = None,
+) -> list[User]:
+    stmt = (
+        select(User)
+        .options(load_only(*schema_columns(User, schemas.User)))
+        .options(*include_options(include))
+        .order_by(User.id)
+    )
+    if after_id is not None:
+        stmt = stmt.where(User.id > after_id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    users = await session.scalars(stmt)
+    return list(users.unique())  # unique нужен из-за joinedload
+
+
+async def get_user(
+    session: AsyncSession,
+    user_id: int,
+    include: Iterable[str] = (),
+) -> User | None:
+    stmt = (
+        select(User)
+        .options(load_only(*schema_columns(User, schemas.User)))
+        .options(*include_options(include))
+        .where(User.id == user_id)
+    )
+    result = await session.scalars(stmt)
+    return result.unique().one_or_none()
+
+
+async def get_user_posts(session: AsyncSession, user_id: int) -> list[Post]:
+    stmt = (
+        select(Post)
+        .options(load_only(*schema_columns(Post, schemas.Post)))
+        .where(Post.user_id == user_id)
+        .order_by(Post.id)
+    )
+    posts = await session.scalars(stmt)
+    return list(posts)
+
+
+async def get_user_profile(session: AsyncSession, user_id: int) -> Profile | None:
+    stmt = (
+        select(Profile)
+        .options(load_only(*schema_columns(Profile, schemas.Profile)))
+        .where(Profile.user_id == user_id)
+    )
+    return await session.scalar(stmt)
+
+
+def user_to_schema(user: User, include: Iterable[str]) -> schemas.UserWithRelations:
+    # не валидируем ORM объект целиком: обращение к незагруженной связи
+    # в async сессии - это ленивая загрузка и MissingGreenlet
+    data = {"id": user.id, "username": user.username}
+    if "profile" in include:
+        data["profile"] = user.profile
+    if "posts" in include:
+        data["posts"] = user.post
+    return schemas.UserWithRelations.model_validate(data, from_attributes=True)
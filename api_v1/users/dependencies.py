@@ -0,0 +1,40 @@
+from typing import Annotated
+
+from fastapi import Path, Query, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models import db_helper, User
+
+from . import crud
+
+
+async def user_includes(
+    include: Annotated[
+        str | None, Query(description="Связи через запятую: profile,posts")
+    ] = None,
+) -> set[str]:
+    if not include:
+        return set()
+    names = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = names - crud.INCLUDES.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown include {', '.join(sorted(unknown))}, allowed: {', '.join(crud.INCLUDES)}",
+        )
+    return names
+
+
+async def user_by_id(
+    user_id: Annotated[int, Path(..., ge=1)],
+    include: set[str] = Depends(user_includes),
+    session: AsyncSession = Depends(db_helper.read_session_dependency),
+) -> User:
+    user = await crud.get_user(session=session, user_id=user_id, include=include)
+    if user is not None:
+        return user
+
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"User id {user_id} not found!",
+    )
@@ -0,0 +1,33 @@
+from pydantic import BaseModel, ConfigDict
+
+
+class Post(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    title: str
+    body: str
+    user_id: int
+
+
+class Profile(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    first_name: str | None
+    last_name: str | None
+    bio: str | None
+    user_id: int
+
+
+class User(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    username: str
+
+
+class UserWithRelations(User):
+    # заполняются только если запрошены через ?include=, иначе их нет в ответе
+    profile: Profile | None = None
+    posts: list[Post] | None = None
@@ -0,0 +1,59 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api_v1.users import crud
+from api_v1.users.dependencies import user_by_id, user_includes
+from api_v1.users.schemas import Post, Profile, UserWithRelations
+from core.config import settings
+from core.models import db_helper, User
+
+router = APIRouter(tags=["Users"])
+
+
+@router.get("", response_model_exclude_unset=True)
+async def get_users(
+    include: set[str] = Depends(user_includes),
+    after_id: Annotated[int | None, Query(ge=0)] = None,
+    limit: Annotated[
+        int, Query(ge=1, le=settings.pagination.max_limit)
+    ] = settings.pagination.default_limit,
+    session: AsyncSession = Depends(db_helper.read_session_dependency),
+) -> list[UserWithRelations]:
+    # число запросов не зависит от числа строк: 1 + по одному на каждую selectinload связь
+    users = await crud.get_users(
+        session=session, include=include, after_id=after_id, limit=limit
+    )
+    return [crud.user_to_schema(user, include) for user in users]
+
+
+@router.get("/{user_id}", response_model_exclude_unset=True)
+async def get_user(
+    user: User = Depends(user_by_id),
+    include: set[str] = Depends(user_includes),
+) -> UserWithRelations:
+    return crud.user_to_schema(user, include)
+
+
+@router.get("/{user_id}/posts")
+async def get_user_posts(
+    user: User = Depends(user_by_id),
+    session: AsyncSession = Depends(db_helper.read_session_dependency),
+) -> list[Post]:
+    return await crud.get_user_posts(session=session, user_id=user.id)
+
+
+@router.get("/{user_id}/profile")
+async def get_user_profile(
+    user: User = Depends(user_by_id),
+    session: AsyncSession = Depends(db_helper.read_session_dependency),
+) -> Profile:
+    profile = await crud.get_user_profile(session=session, user_id=user.id)
+    if profile is not None:
+        return profile
+
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Profile for user id {user.id} not found!",
+    )
@@ -0,0 +1,74 @@
+# Сравнение вставки продуктов по одному (как через POST /api/v1/products)
+# и через bulk путь (POST /api/v1/products/bulk).
+# Запуск из корня проекта: python -m benchmarks.bulk_products --count 10000
+import argparse
+import asyncio
+import time
+
+from api_v1.products import crud
+from api_v1.products.schemas import ProductCreate
+from core.config import settings
+from core.models import db_helper
+
+
+def make_products(count: int) -> list[ProductCreate]:
+    return [
+        ProductCreate(name=f"bench-{i}", description="benchmark", price=i % 1000 + 1)
+        for i in range(count)
+    ]
+
+
+async def one_by_one(products_in: list[ProductCreate]) -> list[int]:
+    async with db_helper.session_factory() as session:
+        ids = []
+        for product_in in products_in:
+            product = await crud.create_product(session=session, product_in=product_in)
+            ids.append(product.id)
+        return ids
+
+
+async def bulk(products_in: list[ProductCreate], batch_size: int) -> list[int]:
+    async with db_helper.session_factory() as session:
+        products = await crud.create_products_bulk(
+            session=session, products_in=products_in, batch_size=batch_size
+        )
+        return [product.id for product in products]
+
+
+async def cleanup(ids: list[int], batch_size: int) -> None:
+    async with db_helper.session_factory() as session:
+        await crud.delete_products_bulk(
+            session=session, product_ids=ids, batch_size=batch_size
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=settings.bulk.batch_size)
+    args = parser.parse_args()
+
+    products_in = make_products(args.count)
+
+    started = time.perf_counter()
+    ids = await one_by_one(products_in)
+    single_elapsed = time.perf_counter() - started
+    await cleanup(ids, args.batch_size)
+
+    started = time.perf_counter()
+    ids = await bulk(products_in, args.batch_size)
+    bulk_elapsed = time.perf_counter() - started
+    await cleanup(ids, args.batch_size)
+
+    print(f"rows: {args.count}, batch size: {args.batch_size}")
+    print(
+        f"one by one: {single_elapsed:.3f}s ({args.count / single_elapsed:.0f} rows/s)"
+    )
+    print(f"bulk:       {bulk_elapsed:.3f}s ({args.count / bulk_elapsed:.0f} rows/s)")
+    print(f"speedup:    x{single_elapsed / bulk_elapsed:.1f}")
+
+    await db_helper.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+# Проверка single-flight: N одновременных одинаковых чтений продукта дают один SELECT,
+# N одновременных запросов списка - один агрегат и один SELECT страницы.
+# Продукт убирается из кеша перед раундом, у запросов списка разный лишний параметр ?n=,
+# чтобы они не склеились раньше в кеше ответов (core/response_cache.py) и дошли до бд.
+# Код возврата 1, если SQL запросов больше ожидаемого.
+# Бд из настроек (DB__URL), лучше наполненная: python -m benchmarks.seed
+# python -m benchmarks.coalescing --concurrency 200
+import argparse
+import asyncio
+import sys
+
+import httpx
+from sqlalchemy import event, select
+
+from api_v1.products.cache import product_cache
+from core.models import db_helper, Product
+from core.single_flight import single_flight
+
+
+async def count_statements(client: httpx.AsyncClient, urls: list[str]) -> list[str]:
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(
+        db_helper.engine.sync_engine, "before_cursor_execute", before_cursor_execute
+    )
+    try:
+        responses = await asyncio.gather(*(client.get(url) for url in urls))
+    finally:
+        event.remove(
+            db_helper.engine.sync_engine, "before_cursor_execute", before_cursor_execute
+        )
+    for response in responses:
+        response.raise_for_status()
+    return statements
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    from main import app
+
+    problems = []
+    async with app.router.lifespan_context(app):
+        async with db_helper.session_factory() as session:
+            product_id = await session.scalar(select(Product.id).limit(1))
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://check"
+        ) as client:
+            await product_cache.invalidate_products(product_id)
+            await product_cache.invalidate_pages()
+            rounds = [
+                ("product by id", f"/api/v1/products/{product_id}", 1),
+                ("products page", "/api/v1/products?limit=20&n={}", 2),
+            ]
+            for name, url, expected in rounds:
+                statements = await count_statements(
+                    client, [url.format(n) for n in range(args.concurrency)]
+                )
+                print(
+                    f"{name}: {args.concurrency} concurrent requests, "
+                    f"{len(statements)} SQL statements (expected {expected})"
+                )
+                if len(statements) > expected:
+                    problems.append(f"{name}: {len(statements)} statements")
+    print(f"single flight: {single_flight.stats()}")
+    for problem in problems:
+        print(f"FAIL {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
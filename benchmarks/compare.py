@@ -0,0 +1,42 @@
+# Сравнение двух прогонов benchmarks.load:
+# python -m benchmarks.compare baseline.json candidate.json
+import argparse
+import json
+
+METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+
+
+def delta(before: float | None, after: float | None) -> str:
+    if before is None or after is None:
+        return "-"
+    if before == 0:
+        return "n/a" if after else "0.0%"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)["results"]
+    with open(args.candidate) as file:
+        candidate = json.load(file)["results"]
+
+    # для rps больше - лучше, для задержек и числа запросов - меньше
+    print(f"{'scenario@concurrency':<28}" + "".join(f"{m:>22}" for m in METRICS))
+    for key in sorted(baseline.keys() & candidate.keys()):
+        row = f"{key:<28}"
+        for metric in METRICS:
+            before, after = baseline[key][metric], candidate[key][metric]
+            value = "-" if after is None else f"{after:.2f}"
+            row += f"{value:>12} {delta(before, after):>9}"
+        print(row)
+    for key in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{key:<28} only in {'baseline' if key in baseline else 'candidate'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Проверка, что горячие запросы идут по индексам, а не полным сканом таблицы.
+# Запускать на наполненной бд (python -m benchmarks.seed), на пустых таблицах
+# планировщик честно выбирает seq scan. Код возврата 1, если есть полный скан.
+# python -m benchmarks.explain
+import asyncio
+import json
+import sys
+
+from sqlalchemy import select, text, Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api_v1.products.crud import products_statement
+from api_v1.products.schemas import ProductFilter
+from core.models import db_helper, Product, Post, User
+
+CHECKED_TABLES = {"product", "post", "user"}
+# в sqlite LIKE регистронезависимый и обычный индекс не использует, проверяем только на постгресе
+POSTGRES_ONLY = {"products by name prefix", "products text search"}
+
+
+def key_queries() -> dict[str, Select]:
+    return {
+        "products page by id": select(Product)
+        .where(Product.id > 100)
+        .order_by(Product.id)
+        .limit(50),
+        "products by price range": select(Product)
+        .where(Product.price.between(1000, 2000))
+        .order_by(Product.price, Product.id)
+        .limit(50),
+        "products by name prefix": select(Product)
+        .where(Product.name.like("product-12%"))
+        .limit(50),
+        "products text search": products_statement(
+            "postgresql", ProductFilter(q="product")
+        ).limit(50),
+        "posts of user": select(Post).where(Post.user_id == 10).order_by(Post.id),
+        "posts of users (selectinload)": select(Post).where(
+            Post.user_id.in_([1, 2, 3])
+        ),
+        "user by username": select(User).where(User.username == "user-10"),
+    }
+
+
+def postgres_seq_scans(plan: dict) -> list[str]:
+    scans = []
+    if plan["Node Type"] == "Seq Scan" and plan["Relation Name"] in CHECKED_TABLES:
+        scans.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scans.extend(postgres_seq_scans(child))
+    return scans
+
+
+async def seq_scans(session: AsyncSession, stmt: Select) -> list[str]:
+    dialect = session.bind.dialect
+    sql = str(stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if dialect.name == "postgresql":
+        result = await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+        plan = result.scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return postgres_seq_scans(plan[0]["Plan"])
+    # sqlite: "SCAN product" - полный проход, "SEARCH product USING INDEX ..." - по индексу
+    result = await session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+    scans = []
+    for row in result:
+        words = row.detail.split()
+        if words[0] == "SCAN" and words[1] in CHECKED_TABLES and "INDEX" not in words:
+            scans.append(words[1])
+    return scans
+
+
+async def main() -> int:
+    failed = False
+    async with db_helper.session_factory() as session:
+        if session.bind.dialect.name == "postgresql":
+            await session.execute(text("ANALYZE"))  # свежая статистика для планировщика
+        for name, stmt in key_queries().items():
+            if name in POSTGRES_ONLY and session.bind.dialect.name != "postgresql":
+                print(f"{name:<32} skipped")
+                continue
+            scans = await seq_scans(session, stmt)
+            status = "SEQ SCAN on " + ", ".join(scans) if scans else "ok"
+            print(f"{name:<32} {status}")
+            failed = failed or bool(scans)
+    await db_helper.engine.dispose()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
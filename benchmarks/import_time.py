@@ -0,0 +1,108 @@
+# Бюджет времени импорта main (холодный старт в serverless/автоскейлинге).
+# Каждый замер - отдельный процесс с python -X importtime, берем медиану и самые тяжелые модули.
+# Код возврата 1, если медиана больше --budget-ms или подтянулся модуль из FORBIDDEN.
+# Те же проверки в pytest: tests/test_import_time.py, json отсюда - для сравнения между прогонами.
+# Бд не нужна: при импорте ничего не подключается и движок не создается
+# python -m benchmarks.import_time --runs 5 --budget-ms 1500 --output import_time.json
+# python -m benchmarks.import_time --baseline import_time.json
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# модули, которых не должно быть в рантайме сразу после импорта приложения.
+# email_validator (~30 мс) тут нет: его импортирует сам fastapi.openapi.models, если он установлен
+FORBIDDEN = (
+    "sqlalchemy.testing",  # тестовый набор sqlalchemy, ~200 мс
+    "asyncpg",  # диалект подтягивается при создании движка, а он ленивый (db_helper)
+)
+
+
+def measure_once(module: str) -> dict[str, int]:
+    # cumulative и self (ключ "self:имя") время в микросекундах, importtime пишет их в stderr:
+    # import time: self [us] | cumulative | imported package
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        timings[name.strip()] = int(cumulative_us)
+        timings.setdefault(f"self:{name.strip()}", 0)
+        timings[f"self:{name.strip()}"] += int(self_us)
+    return timings
+
+
+def median_ms(runs: list[dict[str, int]], module: str) -> float:
+    return statistics.median(run[module] for run in runs) / 1000
+
+
+def forbidden_modules(timings: dict[str, int]) -> list[str]:
+    return [
+        bad
+        for bad in FORBIDDEN
+        if any(name == bad or name.startswith(bad + ".") for name in timings)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="сохранить результат в json")
+    parser.add_argument("--baseline", help="json прошлого запуска для сравнения")
+    args = parser.parse_args()
+
+    runs = [measure_once(args.module) for _ in range(args.runs)]
+    total_ms = median_ms(runs, args.module)
+    last = runs[-1]
+    heaviest = sorted(
+        (
+            (name.removeprefix("self:"), us / 1000)
+            for name, us in last.items()
+            if name.startswith("self:")
+        ),
+        key=lambda item: item[1],
+        reverse=True,
+    )[: args.top]
+    forbidden = forbidden_modules(last)
+
+    print(f"import {args.module}: {total_ms:.1f} ms (median of {args.runs})")
+    for name, ms in heaviest:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    problems = [f"forbidden module imported: {name}" for name in forbidden]
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        problems.append(f"over budget: {total_ms:.1f} ms > {args.budget_ms} ms")
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline_ms = json.load(file)["results"]["import_ms"]
+        change = (total_ms - baseline_ms) / baseline_ms * 100
+        print(f"baseline: {baseline_ms:.1f} ms, change {change:+.1f}%")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "module": args.module,
+                    "runs": args.runs,
+                    "results": {"import_ms": total_ms},
+                    "heaviest": dict(heaviest),
+                },
+                file,
+                indent=2,
+            )
+    for problem in problems:
+        print(f"FAIL {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
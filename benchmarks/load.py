@@ -0,0 +1,265 @@
+# Нагрузочный прогон API с фиксированной конкуррентностью.
+# httpx и aiosqlite ставятся с dev зависимостями (poetry install),
+# по умолчанию приложение поднимается в процессе через ASGITransport,
+# бд берется из настроек (DB__URL), перед прогоном ее нужно наполнить: python -m benchmarks.seed
+#
+# python -m benchmarks.load --concurrency 1 10 50 --requests 500 --output run.json
+# python -m benchmarks.compare baseline.json run.json
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import httpx
+from sqlalchemy import event, func, select
+
+from core.models import db_helper, Product, User
+
+
+@dataclass
+class State:
+    product_ids: list[int]
+    user_ids: list[int]
+    created_product_ids: list[int] = field(default_factory=list)
+    rnd: random.Random = field(default_factory=lambda: random.Random(42))
+
+
+Scenario = Callable[[httpx.AsyncClient, State], Awaitable[httpx.Response]]
+
+
+async def products_list(client: httpx.AsyncClient, state: State) -> httpx.Response:
+    return await client.get("/api/v1/products", params={"limit": 50})
+
+
+async def product_detail(client: httpx.AsyncClient, state: State) -> httpx.Response:
+    return await client.get(f"/api/v1/products/{state.rnd.choice(state.product_ids)}")
+
+
+async def product_create(client: httpx.AsyncClient, state: State) -> httpx.Response:
+    response = await client.post(
+        "/api/v1/products",
+        json={"name": "bench", "description": "bench", "price": 100},
+    )
+    if response.status_code == 201:
+        state.created_product_ids.append(response.json()["id"])
+    return response
+
+
+async def product_update(client: httpx.AsyncClient, state: State) -> httpx.Response:
+    return await client.patch(
+        f"/api/v1/products/{state.rnd.choice(state.product_ids)}",
+        json={"price": state.rnd.randint(1, 1_000_000)},
+    )
+
+
+async def product_delete(client: httpx.AsyncClient, state: State) -> httpx.Response:
+    # удаляем только то, что сами создали в product_create, сид не трогаем
+    return await client.delete(f"/api/v1/products/{state.created_product_ids.pop()}")
+
+
+async def items_list(client: httpx.AsyncClient, state: State) -> httpx.Response:
+    return await client.get("/items")
+
+
+async def item_detail(client: httpx.AsyncClient, state: State) -> httpx.Response:
+    return await client.get(f"/items/{state.rnd.randint(1, 999_999)}")
+
+
+async def user_create(client: httpx.AsyncClient, state: State) -> httpx.Response:
+    suffix = state.rnd.randint(0, 10**9)
+    return await client.post(
+        "/users",
+        json={"username": f"bench{suffix}", "email": f"bench{suffix}@example.com"},
+    )
+
+
+async def users_list(client: httpx.AsyncClient, state: State) -> httpx.Response:
+    return await client.get(
+        "/api/v1/users", params={"include": "profile,posts", "limit": 50}
+    )
+
+
+async def user_detail(client: httpx.AsyncClient, state: State) -> httpx.Response:
+    return await client.get(
+        f"/api/v1/users/{state.rnd.choice(state.user_ids)}",
+        params={"include": "profile,posts"},
+    )
+
+
+# порядок важен: product_delete удаляет то, что создал product_create
+SCENARIOS: dict[str, Scenario] = {
+    "products_list": products_list,
+    "product_detail": product_detail,
+    "product_create": product_create,
+    "product_update": product_update,
+    "product_delete": product_delete,
+    "items_list": items_list,
+    "item_detail": item_detail,
+    "user_create": user_create,
+    "users_list": users_list,
+    "user_detail": user_detail,
+}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def percentile(sorted_values: list[float], share: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(share * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    state: State,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    counter: QueryCounter | None,
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await scenario(client, state)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    queries_before = counter.count if counter else 0
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "queries_per_request": (
+            (counter.count - queries_before) / len(latencies) if counter else None
+        ),
+    }
+
+
+async def load_state(sample: int = 10_000) -> State:
+    async with db_helper.session_factory() as session:
+        product_ids = list(await session.scalars(select(Product.id).limit(sample)))
+        user_ids = list(await session.scalars(select(User.id).limit(sample)))
+        if not product_ids or not user_ids:
+            raise SystemExit("database is empty, run python -m benchmarks.seed first")
+        await session.scalar(select(func.count(Product.id)))  # прогреваем пул
+    return State(product_ids=product_ids, user_ids=user_ids)
+
+
+def format_row(name: str, result: dict) -> str:
+    queries = result["queries_per_request"]
+    return (
+        f"{name:<28} {result['throughput_rps']:>9.1f} "
+        f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+        f"{'-' if queries is None else f'{queries:.2f}':>7} {result['errors']:>6}"
+    )
+
+
+def print_header() -> None:
+    print(
+        f"{'scenario@concurrency':<28} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'q/req':>7} {'errors':>6}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument(
+        "--base-url",
+        help="гонять по уже запущенному серверу, без него main.app поднимается в процессе "
+        "(тогда считается и число SQL запросов на запрос)",
+    )
+    parser.add_argument("--output", help="сохранить результаты в json для compare")
+    args = parser.parse_args()
+
+    state = await load_state()
+    counter = None
+    lifespan = contextlib.nullcontext()
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+    else:
+        from main import app
+
+        # ASGITransport сам lifespan не запускает: без него нет прогрева пула на старте,
+        # а write-behind очередь не дописывается в конце
+        lifespan = app.router.lifespan_context(app)
+        counter = QueryCounter()
+        for engine in [db_helper.engine, *db_helper.replica_engines]:
+            event.listen(engine.sync_engine, "before_cursor_execute", counter)
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+        )
+
+    results = {}
+    print_header()
+    async with lifespan, client:
+        for concurrency in args.concurrency:
+            for name in args.scenarios:
+                if name == "product_delete":
+                    requests = min(args.requests, len(state.created_product_ids))
+                else:
+                    requests = args.requests
+                if not requests:
+                    continue
+                result = await run_scenario(
+                    client=client,
+                    state=state,
+                    scenario=SCENARIOS[name],
+                    requests=requests,
+                    concurrency=concurrency,
+                    counter=counter,
+                )
+                key = f"{name}@{concurrency}"
+                results[key] = result
+                print(format_row(key, result))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "meta": {
+                        "requests": args.requests,
+                        "concurrency": args.concurrency,
+                        "base_url": args.base_url,
+                        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    },
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+    await db_helper.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+# Проверка batch loader (core/loader.py): загрузки в одном тике event loop - один SELECT,
+# повторная загрузка того же id - ноль, посты и их авторы - по SELECT на модель.
+# Код возврата 1, если SQL запросов больше ожидаемого.
+# Бд из настроек (DB__URL), наполненная: python -m benchmarks.seed
+# python -m benchmarks.loader --ids 500
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import event, select
+
+from core.config import settings
+from core.loader import Loaders, loader_metrics
+from core.models import db_helper, Post, Product, User
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, *args):
+        self.count += 1
+
+
+async def check(name: str, counter: StatementCounter, expected: int, call) -> bool:
+    counter.count = 0
+    await call()
+    print(f"{name}: {counter.count} SQL statements (expected {expected})")
+    return counter.count <= expected
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ids", type=int, default=200)
+    args = parser.parse_args()
+
+    async with db_helper.session_factory() as session:
+        product_ids = list(await session.scalars(select(Product.id).limit(args.ids)))
+        post_ids = list(await session.scalars(select(Post.id).limit(args.ids)))
+
+    counter = StatementCounter()
+    event.listen(db_helper.engine.sync_engine, "before_cursor_execute", counter)
+    ok = True
+    async with db_helper.session_factory() as session:
+        loaders = Loaders(session=session, max_batch_size=settings.bulk.batch_size)
+
+        async def products():
+            loaded = await asyncio.gather(
+                *(loaders[Product].load(pk) for pk in product_ids + [0])
+            )
+            assert [product.id for product in loaded[:-1]] == product_ids
+            assert loaded[-1] is None  # несуществующий id
+
+        async def posts_with_authors():
+            async def post_with_author(post_id: int):
+                post = await loaders[Post].load(post_id)
+                return post, await loaders[User].load(post.user_id)
+
+            await asyncio.gather(*(post_with_author(pk) for pk in post_ids))
+
+        ok &= await check(f"{len(product_ids) + 1} products", counter, 1, products)
+        ok &= await check("same products again", counter, 0, products)
+        ok &= await check(
+            f"{len(post_ids)} posts with authors", counter, 2, posts_with_authors
+        )
+    event.remove(db_helper.engine.sync_engine, "before_cursor_execute", counter)
+    for line in loader_metrics.render().splitlines():
+        if line.startswith(("loader_batch_size_sum", "loader_batch_size_count")):
+            print(line)
+    await db_helper.dispose()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+# Наполняет локальную бд данными для бенчмарков.
+# python -m benchmarks.seed --products 10000 --users 1000 --posts-per-user 5 --recreate
+import argparse
+import asyncio
+import random
+
+from sqlalchemy import insert
+
+from api_v1.products import crud as products_crud
+from api_v1.products.schemas import ProductCreate
+from core.config import settings
+from core.models import db_helper, Base, User, Post, Profile
+
+
+async def recreate_schema() -> None:
+    # только для локальной бд! на нормальной бд схема создается миграциями
+    async with db_helper.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def seed(
+    products: int,
+    users: int,
+    posts_per_user: int,
+    profiles_share: float,
+    batch_size: int = settings.bulk.batch_size,
+) -> None:
+    rnd = random.Random(42)  # одинаковые данные от запуска к запуску
+    async with db_helper.session_factory() as session:
+        await products_crud.create_products_bulk(
+            session=session,
+            products_in=[
+                ProductCreate(
+                    name=f"product-{i}",
+                    description=f"description of product {i}",
+                    price=rnd.randint(1, 1_000_000),
+                )
+                for i in range(products)
+            ],
+            batch_size=batch_size,
+        )
+
+        user_ids = []
+        for start in range(0, users, batch_size):
+            rows = [
+                {"username": f"user-{i}"}
+                for i in range(start, min(start + batch_size, users))
+            ]
+            result = await session.scalars(insert(User).values(rows).returning(User.id))
+            user_ids.extend(result.all())
+
+        posts = [
+            {
+                "title": f"post {n} of {user_id}",
+                "body": "lorem ipsum",
+                "user_id": user_id,
+            }
+            for user_id in user_ids
+            for n in range(posts_per_user)
+        ]
+        profiles = [
+            {"first_name": f"name-{user_id}", "user_id": user_id}
+            for user_id in user_ids
+            if rnd.random() < profiles_share
+        ]
+        for model, rows in ((Post, posts), (Profile, profiles)):
+            for start in range(0, len(rows), batch_size):
+                await session.execute(insert(model), rows[start : start + batch_size])
+        await session.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts-per-user", type=int, default=5)
+    parser.add_argument("--profiles-share", type=float, default=0.5)
+    parser.add_argument("--recreate", action="store_true", help="drop_all + create_all")
+    args = parser.parse_args()
+
+    if args.recreate:
+        await recreate_schema()
+    await seed(
+        products=args.products,
+        users=args.users,
+        posts_per_user=args.posts_per_user,
+        profiles_share=args.profiles_share,
+    )
+    await db_helper.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+# Сравнение путей отдачи списка продуктов на больших страницах:
+#  - fastapi_default: ORM -> валидация list[Product] -> jsonable dict -> json.dumps (как было до RawJSONResponse)
+#  - orm_model_dump: ORM -> ProductsPage(...).model_dump_json() (обычный режим сейчас)
+#  - rows_type_adapter: Row -> TypeAdapter.dump_json без ORM и без валидации (pagination.fast_json)
+# python -m benchmarks.serialization --rows 10000
+import argparse
+import asyncio
+import json
+import time
+
+from pydantic import TypeAdapter
+
+from api_v1.products import crud
+from api_v1.products.schemas import (
+    Product,
+    ProductsPage,
+    products_page_rows_adapter,
+)
+from core.models import db_helper
+
+products_adapter = TypeAdapter(list[Product])
+
+
+async def fastapi_default(session, rows: int) -> bytes:
+    products = await crud.get_products(session=session, limit=rows)
+    validated = products_adapter.validate_python(products, from_attributes=True)
+    return json.dumps(products_adapter.dump_python(validated, mode="json")).encode()
+
+
+async def orm_model_dump(session, rows: int) -> bytes:
+    products, _ = await crud.get_products_page(session=session, limit=rows)
+    return ProductsPage(items=products).model_dump_json().encode()
+
+
+async def rows_type_adapter(session, rows: int) -> bytes:
+    product_rows, _ = await crud.get_product_rows_page(session=session, limit=rows)
+    return products_page_rows_adapter.dump_json(
+        {"items": [row._asdict() for row in product_rows], "next_cursor": None}
+    )
+
+
+PATHS = {
+    "fastapi_default": fastapi_default,
+    "orm_model_dump": orm_model_dump,
+    "rows_type_adapter": rows_type_adapter,
+}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'path':<20} {'best ms':>9} {'mean ms':>9} {'bytes':>10}")
+    for name, path in PATHS.items():
+        timings = []
+        for _ in range(args.repeat):
+            # новая сессия на каждый прогон, иначе identity map отдаст ORM объекты из прошлого
+            async with db_helper.session_factory() as session:
+                started = time.perf_counter()
+                payload = await path(session, args.rows)
+                timings.append(time.perf_counter() - started)
+        print(
+            f"{name:<20} {min(timings) * 1000:>9.2f} "
+            f"{sum(timings) / len(timings) * 1000:>9.2f} {len(payload):>10}"
+        )
+    await db_helper.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
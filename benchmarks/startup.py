@@ -0,0 +1,77 @@
+# Время от старта процесса до первого успешного ответа /api/v1/products,
+# с прогревом пула на старте и без него (LIFESPAN__WARMUP_CONNECTIONS=0).
+# Каждый запуск в отдельном процессе, чтобы пул и кеши были холодными.
+# Бд из настроек (DB__URL), наполненная: python -m benchmarks.seed
+# python -m benchmarks.startup --runs 5 --warmup 0 5
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+STARTED = time.perf_counter()
+
+
+async def measure_child() -> dict:
+    import httpx
+
+    from main import app
+
+    imported = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://startup"
+        ) as client:
+            response = await client.get("/api/v1/products")
+            response.raise_for_status()
+        first_response = time.perf_counter()
+    return {
+        "import_ms": (imported - STARTED) * 1000,
+        "lifespan_ms": (ready - imported) * 1000,
+        "first_request_ms": (first_response - ready) * 1000,
+        "total_ms": (first_response - STARTED) * 1000,
+    }
+
+
+def run_child(warmup: int) -> dict:
+    env = os.environ | {"LIFESPAN__WARMUP_CONNECTIONS": str(warmup)}
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child"],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", type=int, nargs="+", default=[0, 5])
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(measure_child())))
+        return
+
+    print(
+        f"{'warmup':>6} {'import ms':>10} {'lifespan ms':>12} "
+        f"{'first req ms':>13} {'total ms':>9}"
+    )
+    for warmup in args.warmup:
+        runs = [run_child(warmup) for _ in range(args.runs)]
+        median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        print(
+            f"{warmup:>6} {median['import_ms']:>10.1f} {median['lifespan_ms']:>12.1f} "
+            f"{median['first_request_ms']:>13.1f} {median['total_ms']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from core.config import CacheSettings
+
+
+class CacheBackend(ABC):
+    # Кеш хранит уже сериализованные байты, так что бэкенды взаимозаменяемы:
+    # что в памяти процесса, что в redis лежит одно и то же
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: int) -> None: ...
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None: ...
+
+    @abstractmethod
+    async def incr(self, key: str) -> int: ...
+
+
+class MemoryCache(CacheBackend):
+    # LRU + TTL в памяти процесса. У каждого воркера uvicorn свой экземпляр,
+    # поэтому между воркерами данные могут расходиться максимум на ttl
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        # счетчики отдельно: их нельзя вытеснять по LRU, иначе сбросится поколение
+        self._counters: dict[str, int] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        if key in self._counters:
+            return str(self._counters[key]).encode()
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)  # выкидываем самый давно использованный
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+            self._counters.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+
+class RedisCache(CacheBackend):
+    # client - любой объект с интерфейсом redis.asyncio.Redis (get/set/delete/incr),
+    # в тестах вместо него можно передать fakeredis.aioredis.FakeRedis
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCache":
+        # импортируем только если redis реально выбран, ставится extra: poetry install -E redis
+        from redis import asyncio as redis
+
+        return cls(client=redis.from_url(url))
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        await self.client.set(key, value, ex=ttl)
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.client.delete(*keys)
+
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(key)
+
+
+def create_cache_backend(cache_settings: CacheSettings) -> CacheBackend:
+    if cache_settings.backend == "redis":
+        return RedisCache.from_url(cache_settings.redis_url)
+    return MemoryCache(max_size=cache_settings.max_size)
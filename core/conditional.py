@@ -0,0 +1,86 @@
+import hashlib
+import re
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request
+
+
+# Условные запросы по RFC 9110: клиент присылает ETag/дату из прошлого ответа,
+# если ничего не поменялось - отвечаем 304 без тела
+
+
+def strong_etag(value: int | str) -> str:
+    return f'"{value}"'
+
+
+def digest_etag(*parts) -> str:
+    # для составных значений (например состояние таблицы + параметры запроса)
+    value = ":".join(str(part) for part in parts)
+    return strong_etag(hashlib.sha1(value.encode()).hexdigest())
+
+
+def http_date(value: datetime) -> str:
+    # sqlite отдает naive datetime, в бд пишем всегда utc
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+# entity-tag из RFC 9110 8.8.3: [W/] и значение в кавычках без пробелов и кавычек внутри
+ETAG_PATTERN = re.compile(r'(W/)?"[^"\s]*"')
+
+
+def parse_etags(header: str) -> list[str]:
+    # список ETag из If-Match/If-None-Match, ValueError - если заголовок не разобрать
+    etags = [candidate.strip() for candidate in header.split(",")]
+    for etag in etags:
+        if not ETAG_PATTERN.fullmatch(etag):
+            raise ValueError(f"invalid entity-tag {etag!r}")
+    return etags
+
+
+def etag_matches(header: str | None, etag: str, weak: bool = True) -> bool:
+    # weak=True - слабое сравнение для If-None-Match, False - строгое для If-Match
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def validator_headers(etag: str, last_modified: datetime | None) -> dict[str, str]:
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: datetime | None
+) -> bool:
+    # If-None-Match главнее: If-Modified-Since смотрим, только если ETag не прислали
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # в заголовке точность до секунды
+    return last_modified.replace(microsecond=0) <= since
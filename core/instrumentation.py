@@ -0,0 +1,163 @@
+import logging
+import random
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from core.config import InstrumentationSettings, settings
+
+logger = logging.getLogger(__name__)
+
+# ASGI scope текущего запроса. Роутер starlette дописывает в этот же словарь "route"
+# после матчинга, поэтому к моменту выполнения SQL шаблон пути уже известен
+Labels = tuple[str, str]  # (route, operation)
+
+current_scope: ContextVar[dict | None] = ContextVar("current_scope", default=None)
+
+
+def current_route() -> str:
+    scope = current_scope.get()
+    if scope is None:
+        return "-"  # запрос не из http, например скрипт или миграция
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("path", "-")
+
+
+class RouteContextMiddleware:
+    # чистый ASGI middleware, BaseHTTPMiddleware тут лишний оверхед
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
+
+
+class Histogram:
+    def __init__(self, buckets: list[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя ячейка - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        result, total = [], 0
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+def metric_family(
+    name: str, kind: str, description: str, samples: list[tuple[str, float]]
+) -> list[str]:
+    # counter/gauge в prometheus text format: HELP и TYPE один раз перед всеми строками
+    # семейства. samples - пары (метки вида '{engine="primary"}' или "", значение)
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{labels} {value}" for labels, value in samples]
+    return lines
+
+
+class QueryMetrics:
+    def __init__(self, config: InstrumentationSettings):
+        self.config = config
+        self.durations: dict[Labels, Histogram] = defaultdict(
+            lambda: Histogram(self.config.buckets)
+        )
+        self.rows: dict[Labels, int] = defaultdict(int)
+        self.slow: dict[Labels, int] = defaultdict(int)
+
+    def instrument(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+
+    # Время старта по execution context: conn.info живет столько же, сколько соединение в пуле,
+    # поэтому запись убирается и после успешного запроса, и после упавшего
+    @staticmethod
+    def _before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        conn.info.setdefault("query_started", {})[context] = time.perf_counter()
+
+    @staticmethod
+    def _handle_error(exception_context) -> None:
+        # ошибка бд: after_cursor_execute уже не будет. Если упало до курсора (connect),
+        # записи и не было
+        connection = exception_context.connection
+        if connection is not None:
+            connection.info.get("query_started", {}).pop(
+                exception_context.execution_context, None
+            )
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop(context)
+        route = current_route()
+        labels = (route, statement.lstrip().split(None, 1)[0].upper())
+        self.durations[labels].observe(elapsed)
+        # для SELECT rowcount берется из статуса команды (asyncpg), sqlite отдает -1
+        if cursor.rowcount is not None and cursor.rowcount > 0:
+            self.rows[labels] += cursor.rowcount
+        if elapsed >= self.config.slow_query_threshold:
+            self.slow[labels] += 1
+            if random.random() < self.config.slow_query_sample_rate:
+                # параметры не пишем: там могут быть персональные данные
+                logger.warning(
+                    "slow query %.3fs route=%s statement=%s",
+                    elapsed,
+                    route,
+                    statement[: self.config.slow_query_max_length],
+                )
+
+    def render(self) -> str:
+        # prometheus text exposition format
+        lines = [
+            "# HELP db_query_duration_seconds SQL statement latency",
+            "# TYPE db_query_duration_seconds histogram",
+        ]
+        for (route, operation), histogram in self.durations.items():
+            labels = f'route="{route}",operation="{operation}"'
+            for bound, count in histogram.cumulative():
+                lines.append(
+                    f'db_query_duration_seconds_bucket{{{labels},le="{bound}"}} {count}'
+                )
+            lines.append(f"db_query_duration_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(
+                f"db_query_duration_seconds_count{{{labels}}} {histogram.count}"
+            )
+        lines += [
+            "# HELP db_query_rows_total Rows returned or affected by SQL statements",
+            "# TYPE db_query_rows_total counter",
+        ]
+        for (route, operation), rows in self.rows.items():
+            lines.append(
+                f'db_query_rows_total{{route="{route}",operation="{operation}"}} {rows}'
+            )
+        lines += [
+            "# HELP db_slow_queries_total SQL statements slower than the threshold",
+            "# TYPE db_slow_queries_total counter",
+        ]
+        for (route, operation), count in self.slow.items():
+            lines.append(
+                f'db_slow_queries_total{{route="{route}",operation="{operation}"}} {count}'
+            )
+        return "\n".join(lines) + "\n"
+
+
+query_metrics = QueryMetrics(config=settings.instrumentation)
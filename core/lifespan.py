@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import signal
+import threading
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class AppState:
+    # Состояние процесса для readiness и плавной остановки.
+    # started ставит lifespan после прогрева, draining - как только пришел сигнал остановки
+    # (SIGTERM или POST /internal/drain), пока сервер еще принимает соединения:
+    # балансер видит 503 на /internal/ready и перестает слать новые запросы
+    def __init__(self):
+        self.started = False
+        self.draining = False
+        self.in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def reset(self) -> None:
+        # на старте lifespan: в одном процессе он может подниматься не первый раз
+        # (тесты, benchmarks.load). Event заново - он привязывается к своему event loop
+        self.started = False
+        self.draining = False
+        self._idle = asyncio.Event()
+        if not self.in_flight:
+            self._idle.set()
+
+    def request_started(self) -> None:
+        self.in_flight += 1
+        self._idle.clear()
+
+    def request_finished(self) -> None:
+        self.in_flight -= 1
+        if not self.in_flight:
+            self._idle.set()
+
+    def start_draining(self) -> None:
+        if not self.draining:
+            logger.info("draining: readiness now fails, %s in flight", self.in_flight)
+        self.draining = True
+
+    async def drain(self, timeout: float) -> bool:
+        self.start_draining()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+app_state = AppState()
+
+
+def install_drain_on_sigterm(delay: float) -> Callable[[], None]:
+    # uvicorn на SIGTERM сразу перестает принимать соединения, и 503 от /internal/ready
+    # никто бы уже не увидел. Перехватываем SIGTERM: сначала draining, и только через delay
+    # секунд (балансер успел убрать инстанс) отдаем сигнал прежнему обработчику uvicorn.
+    # Повторный SIGTERM отдается сразу. Возвращает функцию, которая вернет прежний обработчик
+    if threading.current_thread() is not threading.main_thread():
+        return lambda: None  # сигналы ловятся только в главном потоке
+    loop = asyncio.get_running_loop()
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def stop(signum: int, frame) -> None:
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            # обработчика не было (SIG_DFL): возвращаем его и повторяем сигнал
+            signal.signal(signal.SIGTERM, previous)
+            signal.raise_signal(signum)
+
+    def handle_sigterm(signum: int, frame) -> None:
+        if app_state.draining:
+            stop(signum, frame)
+            return
+        app_state.start_draining()
+        # обработчик сигнала прерывает event loop в любом месте, планируем через threadsafe
+        loop.call_soon_threadsafe(loop.call_later, delay, stop, signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    return lambda: signal.signal(signal.SIGTERM, previous)
+
+
+class InFlightMiddleware:
+    # считает запросы, которые еще не отдали ответ целиком (включая стриминг)
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        app_state.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            app_state.request_finished()
@@ -0,0 +1,166 @@
+# Batch loader в духе DataLoader: вызовы loader.load(id), сделанные в одном тике event loop
+# (например из asyncio.gather по списку ссылок), собираются в один SELECT ... WHERE id = ANY(:ids)
+# вместо SELECT на каждый id. Лоадеры живут один запрос (зависимость loaders_dependency):
+# повторный load того же id отдает тот же объект без SQL, между запросами ничего не кешируется
+import asyncio
+from collections import defaultdict
+from typing import Generic, Iterable, TypeVar
+
+from fastapi import Depends
+from sqlalchemy import ARRAY, any_, bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.util import identity_key
+
+from core.config import settings
+from core.instrumentation import Histogram
+from core.models import Base, db_helper
+
+ModelT = TypeVar("ModelT", bound=Base)
+
+BATCH_SIZE_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+class LoaderMetrics:
+    def __init__(self):
+        self.batch_sizes: dict[str, Histogram] = defaultdict(
+            lambda: Histogram(BATCH_SIZE_BUCKETS)
+        )
+
+    def observe(self, model: str, batch_size: int) -> None:
+        self.batch_sizes[model].observe(batch_size)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP loader_batch_size Ids per SELECT issued by batch loaders",
+            "# TYPE loader_batch_size histogram",
+        ]
+        for model, histogram in self.batch_sizes.items():
+            labels = f'model="{model}"'
+            for bound, count in histogram.cumulative():
+                lines.append(
+                    f'loader_batch_size_bucket{{{labels},le="{bound}"}} {count}'
+                )
+            lines.append(f"loader_batch_size_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"loader_batch_size_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+loader_metrics = LoaderMetrics()
+
+
+class BatchLoader(Generic[ModelT]):
+    def __init__(
+        self,
+        session: AsyncSession,
+        model: type[ModelT],
+        lock: asyncio.Lock,
+        max_batch_size: int,
+    ):
+        self.session = session
+        self.model = model
+        # одна сессия на все лоадеры запроса, а AsyncSession не умеет два запроса сразу
+        self.lock = lock
+        self.max_batch_size = max_batch_size
+        self.cache: dict[int, asyncio.Future] = {}
+        self._queue: list[int] = []
+        self._tasks: set[asyncio.Task] = set()  # ссылка, чтобы задачу не собрал gc
+
+    async def load(self, id: int) -> ModelT | None:
+        # None - строки с таким id нет
+        future = self.cache.get(id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.cache[id] = loop.create_future()
+            if not self._queue:
+                # выборка запустится, когда все уже готовые к выполнению задачи сделают свои load
+                loop.call_soon(self._dispatch)
+            self._queue.append(id)
+        # future общий для всех, кто ждет этот id: отмена одного не должна задеть остальных
+        return await asyncio.shield(future)
+
+    async def load_many(self, ids: Iterable[int]) -> list[ModelT | None]:
+        return list(await asyncio.gather(*(self.load(id) for id in ids)))
+
+    def _dispatch(self) -> None:
+        ids, self._queue = self._queue, []
+        futures = {id: self.cache[id] for id in ids}
+        task = asyncio.create_task(self._fetch(ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._cancel_unresolved(futures))
+
+    def id_clause(self, ids: list[int]):
+        if self.session.get_bind().dialect.name == "postgresql":
+            # один и тот же текст запроса для любого числа id - один prepared statement в asyncpg,
+            # у IN (...) на каждое новое число параметров свой
+            return self.model.id == any_(
+                bindparam("ids", ids, type_=ARRAY(self.model.id.type))
+            )
+        return self.model.id.in_(ids)
+
+    async def _fetch(self, ids: list[int]) -> None:
+        found: dict[int, ModelT] = {}
+        missing = []
+        for id in ids:
+            # уже загруженные в эту сессию объекты берем из identity map
+            instance = self.session.identity_map.get(identity_key(self.model, id))
+            if instance is not None:
+                found[id] = instance
+            else:
+                missing.append(id)
+        try:
+            for start in range(0, len(missing), self.max_batch_size):
+                batch = missing[start : start + self.max_batch_size]
+                loader_metrics.observe(self.model.__name__, len(batch))
+                async with self.lock:
+                    result = await self.session.scalars(
+                        select(self.model).where(self.id_clause(batch))
+                    )
+                    found.update((instance.id, instance) for instance in result)
+        except Exception as exc:
+            for id in ids:
+                # из кеша убираем, следующий load этого id попробует снова
+                future = self.cache.pop(id)
+                future.set_exception(exc)
+                future.exception()  # без ждущих asyncio иначе пишет "never retrieved" в лог
+            return
+        for id in ids:
+            self.cache[id].set_result(found.get(id))
+
+    def _cancel_unresolved(self, futures: dict[int, asyncio.Future]) -> None:
+        # Выборку отменили (остановка loop, отмена запроса), возможно еще до ее первого шага,
+        # так что finally в _fetch мог и не выполниться. Ждущие получают CancelledError,
+        # а future не остается в кеше навсегда: следующий load этого id пойдет в бд
+        for id, future in futures.items():
+            if future.done():
+                continue
+            future.cancel()
+            if self.cache.get(id) is future:
+                del self.cache[id]
+
+
+class Loaders:
+    # лоадеры одного запроса, по одному на модель
+    def __init__(self, session: AsyncSession, max_batch_size: int):
+        self.session = session
+        self.max_batch_size = max_batch_size
+        self.lock = asyncio.Lock()
+        self._loaders: dict[type[Base], BatchLoader] = {}
+
+    def __getitem__(self, model: type[ModelT]) -> BatchLoader[ModelT]:
+        loader = self._loaders.get(model)
+        if loader is None:
+            loader = self._loaders[model] = BatchLoader(
+                session=self.session,
+                model=model,
+                lock=self.lock,
+                max_batch_size=self.max_batch_size,
+            )
+        return loader
+
+
+async def loaders_dependency(
+    session: AsyncSession = Depends(db_helper.read_session_dependency),
+) -> Loaders:
+    # в обработчике: product = await loaders[Product].load(product_id)
+    return Loaders(session=session, max_batch_size=settings.bulk.batch_size)
@@ -0,0 +1,243 @@
+# Хелперы для миграций на больших таблицах (product, post) под живой нагрузкой, для alembic/versions.
+# Обычные op.create_index / op.add_column + NOT NULL / op.create_foreign_key держат
+# ACCESS EXCLUSIVE на все время сканирования таблицы, и все запросы к ней встают в очередь.
+# Здесь тяжелая часть идет без такой блокировки и вне общей транзакции миграции
+# (autocommit_block), а короткие ALTER ограничены lock_timeout из env.py.
+# На других бд (sqlite локально) - обычные op.* без особенностей постгреса
+import hashlib
+import logging
+import time
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from alembic import op
+
+from core.config import settings
+
+logger = logging.getLogger("alembic.online")
+
+# прогресс backfill, чтобы прерванная миграция продолжила с того же id.
+# В моделях ее нет, env.py исключает ее из autogenerate
+PROGRESS_TABLE = "alembic_backfill_progress"
+PROGRESS_NAME_LENGTH = 255
+
+
+def is_postgres() -> bool:
+    return op.get_context().dialect.name == "postgresql"
+
+
+def quote(name: str) -> str:
+    # "user" - зарезервированное слово в постгресе, имена в сыром SQL только так
+    return op.get_context().dialect.identifier_preparer.quote(name)
+
+
+@contextmanager
+def lock_timeout(value: str):
+    # на уровне сессии: в autocommit_block каждая команда - своя транзакция, SET LOCAL не подходит
+    op.execute(f"SET lock_timeout = '{value}'")
+    try:
+        yield
+    finally:
+        op.execute(f"SET lock_timeout = '{settings.migrations.lock_timeout}'")
+
+
+def drop_invalid_index(index_name: str) -> None:
+    # прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс: его не использует
+    # планировщик, но IF NOT EXISTS его видит и не пересоздает
+    if op.get_context().as_sql:
+        return
+    invalid = op.get_bind().scalar(
+        sa.text(
+            "SELECT NOT i.indisvalid FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+        ),
+        {"name": index_name},
+    )
+    if invalid:
+        logger.warning(
+            "dropping invalid index %s left by an interrupted build", index_name
+        )
+        op.drop_index(index_name, postgresql_concurrently=True, if_exists=True)
+
+
+def create_index_concurrently(
+    index_name: str, table_name: str, columns: list[str], **kw
+) -> None:
+    # CONCURRENTLY не блокирует запись, но не работает внутри транзакции
+    if not is_postgres():
+        op.create_index(index_name, table_name, columns, **kw)
+        return
+    with op.get_context().autocommit_block():
+        drop_invalid_index(index_name)
+        # ждать старые транзакции тут можно сколько угодно: запись в таблицу не блокируется
+        with lock_timeout("0"):
+            op.create_index(
+                index_name,
+                table_name,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+                **kw,
+            )
+
+
+def drop_index_concurrently(index_name: str, table_name: str) -> None:
+    if not is_postgres():
+        op.drop_index(index_name, table_name=table_name)
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            index_name,
+            table_name=table_name,
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def validate_constraint(table_name: str, constraint_name: str) -> None:
+    # проверка существующих строк под SHARE UPDATE EXCLUSIVE: чтение и запись идут дальше
+    op.execute(
+        f"ALTER TABLE {quote(table_name)} VALIDATE CONSTRAINT {quote(constraint_name)}"
+    )
+
+
+def add_foreign_key_online(
+    constraint_name: str,
+    source_table: str,
+    referent_table: str,
+    local_cols: list[str],
+    remote_cols: list[str],
+    ondelete: str | None = None,
+) -> None:
+    # NOT VALID - ограничение действует только на новые строки, ALTER занимает миллисекунды.
+    # Старые строки проверяет VALIDATE отдельной транзакцией уже без тяжелой блокировки
+    if not is_postgres():
+        op.create_foreign_key(
+            constraint_name,
+            source_table,
+            referent_table,
+            local_cols,
+            remote_cols,
+            ondelete=ondelete,
+        )
+        return
+    local = ", ".join(quote(name) for name in local_cols)
+    remote = ", ".join(quote(name) for name in remote_cols)
+    on_delete = f" ON DELETE {ondelete}" if ondelete else ""
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"ALTER TABLE {quote(source_table)} ADD CONSTRAINT {quote(constraint_name)} "
+            f"FOREIGN KEY ({local}) REFERENCES {quote(referent_table)} ({remote})"
+            f"{on_delete} NOT VALID"
+        )
+        validate_constraint(source_table, constraint_name)
+
+
+def set_not_null_online(table_name: str, column_name: str) -> None:
+    # SET NOT NULL сам сканирует таблицу под ACCESS EXCLUSIVE. Если уже есть проверенный
+    # CHECK (column IS NOT NULL), постгрес (12+) скан пропускает - делаем его через NOT VALID
+    if not is_postgres():
+        op.alter_column(table_name, column_name, nullable=False)
+        return
+    check_name = f"ck_{table_name}_{column_name}_not_null"
+    table = quote(table_name)
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {quote(check_name)} "
+            f"CHECK ({quote(column_name)} IS NOT NULL) NOT VALID"
+        )
+        validate_constraint(table_name, check_name)
+        op.alter_column(table_name, column_name, nullable=False)
+        op.drop_constraint(check_name, table_name, type_="check")
+
+
+def backfill_name(table_name: str, set_clause: str, where: str | None = None) -> str:
+    # имя по умолчанию - сам UPDATE, чтобы его было видно в таблице прогресса. Длинный
+    # set_clause обрезаем, а хеш полного текста в конце оставляет имена разными
+    name = f"{table_name}: {set_clause}" + (f" WHERE {where}" if where else "")
+    if len(name) <= PROGRESS_NAME_LENGTH:
+        return name
+    digest = hashlib.sha256(name.encode()).hexdigest()[:16]
+    return f"{name[: PROGRESS_NAME_LENGTH - len(digest) - 1]} {digest}"
+
+
+def backfill(
+    table_name: str,
+    set_clause: str,
+    where: str | None = None,
+    name: str | None = None,
+    batch_size: int | None = None,
+    pause: float | None = None,
+) -> None:
+    # UPDATE table SET set_clause WHERE where - кусками по диапазонам id, каждый кусок
+    # своей транзакцией, с паузой между ними, чтобы не забивать бд и реплики.
+    # Прогресс пишется после каждого куска: упавшая миграция при повторе продолжит с того же id,
+    # поэтому set_clause должен давать тот же результат при повторном применении.
+    # Строки, вставленные после старта, должно заполнять уже само приложение
+    batch_size = batch_size or settings.migrations.backfill_batch_size
+    pause = settings.migrations.backfill_pause if pause is None else pause
+    table = quote(table_name)
+    condition = f" AND ({where})" if where else ""
+    if op.get_context().as_sql:
+        # в --sql режиме результатов запросов нет, выводим один UPDATE для ручного запуска
+        op.execute(f"UPDATE {table} SET {set_clause} WHERE true{condition}")
+        return
+    name = name or backfill_name(table_name, set_clause, where)
+    if len(name) > PROGRESS_NAME_LENGTH:
+        raise ValueError(
+            f"backfill name is longer than {PROGRESS_NAME_LENGTH} characters: {name!r}"
+        )
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        bind.execute(
+            sa.text(
+                f"CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} "
+                "(name VARCHAR(255) PRIMARY KEY, last_id BIGINT NOT NULL)"
+            )
+        )
+        last_id = (
+            bind.scalar(
+                sa.text(f"SELECT last_id FROM {PROGRESS_TABLE} WHERE name = :name"),
+                {"name": name},
+            )
+            or 0
+        )
+        max_id = bind.scalar(sa.text(f"SELECT max(id) FROM {table}")) or 0
+        if last_id:
+            logger.info("backfill %s: resuming after id %s", name, last_id)
+        while last_id < max_id:
+            started = time.monotonic()
+            result = bind.execute(
+                sa.text(
+                    f"UPDATE {table} SET {set_clause} "
+                    f"WHERE id > :low AND id <= :high{condition}"
+                ),
+                {"low": last_id, "high": last_id + batch_size},
+            )
+            last_id += batch_size
+            saved = bind.execute(
+                sa.text(
+                    f"UPDATE {PROGRESS_TABLE} SET last_id = :last_id WHERE name = :name"
+                ),
+                {"name": name, "last_id": last_id},
+            )
+            if not saved.rowcount:
+                bind.execute(
+                    sa.text(
+                        f"INSERT INTO {PROGRESS_TABLE} (name, last_id) "
+                        "VALUES (:name, :last_id)"
+                    ),
+                    {"name": name, "last_id": last_id},
+                )
+            logger.info(
+                "backfill %s: id %s of %s, %s rows in %.2fs",
+                name,
+                min(last_id, max_id),
+                max_id,
+                result.rowcount,
+                time.monotonic() - started,
+            )
+            time.sleep(pause)
+        bind.execute(
+            sa.text(f"DELETE FROM {PROGRESS_TABLE} WHERE name = :name"), {"name": name}
+        )
@@ -1,24 +1,72 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
 from asyncio import current_task
+from contextlib import AsyncExitStack
+from functools import cached_property
+from typing import AsyncIterator, Awaitable, Callable
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
     async_scoped_session,
     AsyncSession,
+    AsyncEngine,
 )
-from core.config import settings
+from core.config import settings, DbPoolSettings, AsyncpgSettings, DbReplicaSettings
+from core.instrumentation import QueryMetrics, query_metrics
+from core.models.pool import MeasuredQueuePool
+
+logger = logging.getLogger(__name__)
 
 
 class DatabaseHelper:
-    def __init__(self, url: str, echo: bool = False):
+    def __init__(
+        self,
+        url: str,
+        echo: bool = False,
+        pool: DbPoolSettings = DbPoolSettings(),
+        asyncpg: AsyncpgSettings = AsyncpgSettings(),
+        replicas: DbReplicaSettings = DbReplicaSettings(),
+        query_metrics: QueryMetrics | None = None,
+        autocommit_reads: bool = False,
+    ):
+        self.query_metrics = query_metrics
+        self.autocommit_reads = autocommit_reads
+        self.pool_settings = pool
+        self.asyncpg_settings = asyncpg
+        self.replica_settings = replicas
+        self.url = url
         # echo - if True, the Engine will log all statements as well as a repr() of their parameter lists to the default log handler,
         # which defaults to sys.stdout for output
         # on prod must set to False
-        self.engine = create_async_engine(
-            url=url,
-            echo=echo,
-        )
+        self.echo = echo
+        self._replica_counter = itertools.count()
+        self._replica_lag: dict[AsyncEngine, tuple[float, float]] = {}
+        self._autocommit_engines: dict[AsyncEngine, AsyncEngine] = {}
+
+    # Движки и фабрика сессий создаются при первом обращении, а не при импорте:
+    # create_async_engine импортирует драйвер (asyncpg - десятки мс), а импорт core.models
+    # нужен и там, где бд не трогают вообще (alembic, --help у скриптов, холодный старт)
+    @cached_property
+    def engine(self) -> AsyncEngine:
+        # основная бд, все записи идут сюда
+        return self.create_engine(url=self.url, echo=self.echo)
+
+    @cached_property
+    def replica_engines(self) -> list[AsyncEngine]:
+        return [
+            self.create_engine(url=replica_url, echo=self.echo)
+            for replica_url in self.replica_settings.urls
+        ]
 
-        self.session_factory = async_sessionmaker(
+    @cached_property
+    def session_factory(self) -> async_sessionmaker[AsyncSession]:
+        return async_sessionmaker(
             bind=self.engine,
             autoflush=False,  # When True, all query operations will issue a Session.flush() call to this Session before proceeding.
             # This is a convenience feature so that Session.flush() need not be called repeatedly in order for database queries to retrieve results
@@ -33,6 +81,134 @@ class DatabaseHelper:
             # если вы не хотите лишних запросов. Но при этом не гарантируется их актуальность
         )
 
+    def create_engine(self, url: str, echo: bool = False) -> AsyncEngine:
+        connect_args = {}
+        if make_url(url).drivername == "postgresql+asyncpg":
+            # эти аргументы уходят прямо в asyncpg.connect, другие драйверы их не знают
+            connect_args = {
+                "statement_cache_size": self.asyncpg_settings.statement_cache_size,
+                "prepared_statement_cache_size": self.asyncpg_settings.prepared_statement_cache_size,
+                "command_timeout": self.asyncpg_settings.command_timeout,
+                "server_settings": self.asyncpg_settings.server_settings,
+            }
+        engine = create_async_engine(
+            url=url,
+            echo=echo,
+            poolclass=MeasuredQueuePool,
+            pool_size=self.pool_settings.size,
+            max_overflow=self.pool_settings.max_overflow,
+            pool_timeout=self.pool_settings.timeout,
+            pool_recycle=self.pool_settings.recycle,
+            pool_pre_ping=self.pool_settings.pre_ping,
+            pool_use_lifo=self.pool_settings.use_lifo,
+            connect_args=connect_args,
+        )
+        if self.query_metrics is not None:
+            # события вешаются на sync_engine, у AsyncEngine своих событий нет
+            self.query_metrics.instrument(engine.sync_engine)
+        return engine
+
+    async def get_replica_lag(self, engine: AsyncEngine) -> float:
+        checked_at, lag = self._replica_lag.get(engine, (None, 0.0))
+        now = time.monotonic()
+        if (
+            checked_at is not None
+            and now - checked_at < self.replica_settings.lag_check_interval
+        ):
+            return lag
+        if engine.dialect.name != "postgresql":
+            lag = 0.0  # локальные sqlite "реплики" не отстают
+        else:
+            # время с последней примененной транзакции; на простаивающем мастере тоже растет,
+            # поэтому max_lag лучше ставить с запасом
+            query = text(
+                "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+            )
+            try:
+                async with engine.connect() as conn:
+                    lag = float(await conn.scalar(query))
+            except (SQLAlchemyError, OSError):
+                lag = (
+                    math.inf
+                )  # недоступную реплику не используем до следующей проверки
+        self._replica_lag[engine] = (now, lag)
+        return lag
+
+    async def get_read_engine(self) -> AsyncEngine:
+        candidates = self.replica_engines
+        if candidates and self.replica_settings.max_lag is not None:
+            candidates = [
+                engine
+                for engine in candidates
+                if await self.get_replica_lag(engine) <= self.replica_settings.max_lag
+            ]
+        if not candidates:
+            return self.engine  # реплик нет или все отстают - читаем с основной
+        if self.replica_settings.strategy == "least_loaded":
+            return min(candidates, key=lambda engine: engine.pool.checkedout())
+        return candidates[next(self._replica_counter) % len(candidates)]
+
+    def pool_status(self, engine: AsyncEngine | None = None) -> dict[str, int | float]:
+        # занятость пула + время ожидания соединения,
+        # по checked_out и wait_seconds_* подбираем size/max_overflow под max_connections постгреса
+        pool = (engine or self.engine).pool
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            **pool.metrics.as_dict(),
+        }
+
+    async def warm_up(
+        self,
+        connections: int,
+        prime: Callable[[AsyncSession], Awaitable[None]] | None = None,
+    ) -> bool:
+        # Открываем соединения заранее, чтобы первые запросы после деплоя не платили
+        # за TCP/TLS/авторизацию и интроспекцию типов asyncpg. prime гоняет по каждому
+        # соединению горячие запросы - asyncpg кеширует prepared statements на соединение
+        async def open_connection(engine: AsyncEngine, stack: AsyncExitStack) -> None:
+            connection = await stack.enter_async_context(engine.connect())
+            if prime is None:
+                await connection.execute(text("SELECT 1"))
+                return
+            async with self.session_factory(bind=connection) as session:
+                await prime(session)
+
+        try:
+            for engine in [self.engine, *self.replica_engines]:
+                # все соединения держим открытыми одновременно, иначе пул
+                # раз за разом выдавал бы одно и то же
+                async with AsyncExitStack() as stack:
+                    await asyncio.gather(
+                        *(open_connection(engine, stack) for _ in range(connections))
+                    )
+        except (SQLAlchemyError, OSError):
+            logger.exception("database warm-up failed")
+            return False
+        return True
+
+    async def ping(self) -> bool:
+        # для readiness: только основная бд, без реплик чтения идут в нее же
+        try:
+            async with self.engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+        except (SQLAlchemyError, OSError):
+            return False
+        return True
+
+    async def dispose(self) -> None:
+        # закрывает все соединения пулов, на остановке приложения.
+        # Движки, которые так и не создавались, не трогаем
+        engines = [
+            self.__dict__.get("engine"),
+            *self.__dict__.get("replica_engines", []),
+        ]
+        for engine in engines:
+            if engine is not None:
+                await engine.dispose()
+
     def get_scoped_session(self):
         session = async_scoped_session(
             session_factory=self.session_factory,
@@ -45,15 +221,70 @@ class DatabaseHelper:
         return session
 
     # асинхронный генератор, который используется для предоставления сессии как зависимости
-    async def scoped_session_dependency(self) -> AsyncSession:
+    async def scoped_session_dependency(self) -> AsyncIterator[AsyncSession]:
         session = self.get_scoped_session()
-        yield session
-        # await session.close()  # На самом деле тут это не нужно,
-        # так как используетсяa sync_scoped_session, то
-        # сессия закрывается когда завершается асинхронная таска.
+        try:
+            yield session
+        finally:
+            # Раньше тут не было ничего: считалось, что сессия закрывается вместе с таской.
+            # Но реестр async_scoped_session держит на нее ссылку, сессия не закрывается,
+            # а ее соединение не возвращается в пул, пока до него не доберется сборщик мусора.
+            # remove() закрывает сессию и убирает ее из реестра
+            await session.remove()
+
+    # Сессия на один запрос, без реестра: после ответа всегда закрывается и отдает соединение,
+    # если обработчик упал - незакоммиченная транзакция откатывается
+    async def session_dependency(self) -> AsyncIterator[AsyncSession]:
+        async with self.session_factory() as session:
+            try:
+                yield session
+            except Exception:
+                await session.rollback()
+                raise
+
+    def autocommit_engine(self, engine: AsyncEngine) -> AsyncEngine:
+        # тот же пул, просто соединения выдаются с isolation_level AUTOCOMMIT
+        # и при возврате в пул уровень изоляции сбрасывается обратно
+        if engine not in self._autocommit_engines:
+            self._autocommit_engines[engine] = engine.execution_options(
+                isolation_level="AUTOCOMMIT"
+            )
+        return self._autocommit_engines[engine]
+
+    def read_session(self, engine: AsyncEngine) -> AsyncSession:
+        if self.autocommit_reads:
+            engine = self.autocommit_engine(engine)
+        return self.session_factory(bind=engine)
+
+    # Только для GET без записи. Запросы, которые пишут (и читают то, что записали),
+    # используют session_dependency - она всегда на основной бд.
+    # async with прямо здесь, а не во вложенном генераторе: исключение из обработчика
+    # FastAPI бросает в эту точку yield, и сессия закрывается сразу, а не сборщиком мусора
+    async def read_session_dependency(self) -> AsyncIterator[AsyncSession]:
+        async with self.read_session(await self.get_read_engine()) as session:
+            yield session
+
+    # GET, ответ которого кладется в кеш: только основная бд. Реплика сразу после записи
+    # еще может отдать старую (или удаленную) строку, а инвалидация уже прошла -
+    # она пролежала бы в кеше весь ttl. Соединение берется только при промахе кеша
+    async def primary_read_session_dependency(self) -> AsyncIterator[AsyncSession]:
+        async with self.read_session(self.engine) as session:
+            yield session
+
+    async def release_connection(self, session: AsyncSession) -> None:
+        # Зовется сразу после SELECT в обработчиках чтения. Без этого соединение занято,
+        # пока не сериализуется ответ и не закроется сессия. В AUTOCOMMIT commit ничего не шлет
+        # в бд, только отдает соединение в пул; загруженные объекты остаются (expire_on_commit=False)
+        if self.autocommit_reads:
+            await session.commit()
 
 
 db_helper = DatabaseHelper(
     url=settings.db.url,
     echo=settings.db.echo,
+    pool=settings.db.pool,
+    asyncpg=settings.db.asyncpg,
+    replicas=settings.db.replicas,
+    query_metrics=query_metrics if settings.instrumentation.enabled else None,
+    autocommit_reads=settings.db.autocommit_reads,
 )
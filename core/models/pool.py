@@ -0,0 +1,92 @@
+import time
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util.queue import AsyncAdaptedQueue, Empty
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.connects = 0
+        self.connect_total = 0.0
+        self.connect_max = 0.0
+
+    def observe_wait(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def observe_connect(self, seconds: float) -> None:
+        self.connects += 1
+        self.connect_total += seconds
+        self.connect_max = max(self.connect_max, seconds)
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": self.wait_total,
+            "wait_seconds_max": self.wait_max,
+            "wait_seconds_avg": (
+                self.wait_total / self.checkouts if self.checkouts else 0.0
+            ),
+            "connects": self.connects,
+            "connect_seconds_total": self.connect_total,
+            "connect_seconds_max": self.connect_max,
+        }
+
+
+class MeasuredQueue(AsyncAdaptedQueue):
+    # Очередь свободных соединений пула. Время в get - это ровно ожидание соединения:
+    # открытие нового соединения при overflow идет мимо очереди и считается отдельно
+    metrics: PoolMetrics
+
+    def get(self, block: bool = True, timeout: float | None = None):
+        started = time.perf_counter()
+        try:
+            connection = super().get(block, timeout)
+        except Empty:
+            # без block пул просто проверяет, есть ли свободное, и откроет новое, это не ожидание
+            if block:
+                self.metrics.timeouts += 1
+                self.metrics.observe_wait(time.perf_counter() - started)
+            raise
+        self.metrics.observe_wait(time.perf_counter() - started)
+        return connection
+
+
+class MeasuredQueuePool(AsyncAdaptedQueuePool):
+    # Тот же пул, что sqlalchemy использует для async движков по умолчанию,
+    # только замеряет сколько запрос ждал свободное соединение и сколько открывалось новое
+    _queue_class = MeasuredQueue
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    @property
+    def metrics(self) -> PoolMetrics:
+        return self._pool.metrics
+
+    @metrics.setter
+    def metrics(self, metrics: PoolMetrics) -> None:
+        self._pool.metrics = metrics
+
+    def _create_connection(self):
+        # QueuePool открывает новое соединение только на checkout, когда очередь пуста
+        # и есть место в overflow: в очереди такой запрос не ждал
+        started = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            self.metrics.observe_connect(time.perf_counter() - started)
+            self.metrics.observe_wait(0.0)
+
+    def recreate(self) -> "MeasuredQueuePool":
+        # engine.dispose() пересоздает пул, метрики переносим в новый
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
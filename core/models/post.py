@@ -1,4 +1,4 @@
-from sqlalchemy import String, Text
+from sqlalchemy import String, Text, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from core.models.base import Base
 from .mixins import UserRelationMixin
@@ -14,6 +14,12 @@ class Post(UserRelationMixin, Base):
 
     _user_back_populates = "post"
 
+    __table_args__ = (
+        # Постгрес не создает индекс на foreign key сам.
+        # (user_id, id) - посты пользователя сразу в порядке id, и selectinload по user_id IN (...)
+        Index("ix_post_user_id_id", "user_id", "id"),
+    )
+
     title: Mapped[str] = mapped_column(String(100), unique=False)
     body: Mapped[str] = mapped_column(
         Text,
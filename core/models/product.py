@@ -1,8 +1,51 @@
-from sqlalchemy.orm import Mapped
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.functions import now
 from core.models.base import Base
 
 
+@compiles(now, "sqlite")
+def sqlite_now(element, compiler, **kw) -> str:
+    # CURRENT_TIMESTAMP в sqlite с точностью до секунды: две записи за секунду
+    # не сдвинули бы max(updated_at) и ETag списка. %f - секунды с миллисекундами
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
 class Product(Base):
+    # Для полнотекстового поиска в постгресе есть еще колонка search_vector (tsvector + GIN),
+    # ее заполняет триггер бд на INSERT/UPDATE name и description. Она создается миграцией и в модель не добавлена специально: ORM ее не читает,
+    # а локальная sqlite без нее создается через create_all. Используется в products crud
+    __table_args__ = (
+        # text_pattern_ops - чтобы LIKE 'abc%' шел по индексу при любой collation бд
+        Index("ix_product_name", "name", postgresql_ops={"name": "text_pattern_ops"}),
+        # фильтр по диапазону цен + сортировка по цене с id для стабильной keyset пагинации,
+        # запросы только по price этот индекс тоже покрывает
+        Index("ix_product_price_id", "price", "id"),
+        # max(updated_at) для ETag списка берется из индекса, без чтения таблицы
+        Index("ix_product_updated_at", "updated_at"),
+    )
+
     name: Mapped[str]
     description: Mapped[str]
     price: Mapped[int]
+    # Растет на каждом изменении, из него ETag продукта
+    version: Mapped[int] = mapped_column(default=1, server_default="1")
+    # Время ставит бд (now() прямо в INSERT/UPDATE), а не часы хоста приложения:
+    # с несколькими хостами отстающие часы могли бы не сдвинуть max(updated_at)
+    # после записи, и клиент получил бы 304 на измененный список
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=func.now(),
+        onupdate=func.now(),
+        server_default=func.now(),
+    )
+
+    # Оптимистическая блокировка: при flush ORM сам пишет UPDATE ... WHERE id = ? AND version = ?
+    # и увеличивает версию, если строку успели поменять - StaleDataError вместо тихой перезаписи.
+    # UPDATE/DELETE statement'ы (см. products crud) этого не делают, там версия проверяется явно.
+    # eager_defaults - updated_at из бд возвращается через RETURNING того же INSERT/UPDATE,
+    # без этого после commit атрибут пришлось бы перечитывать отдельным SELECT
+    __mapper_args__ = {"version_id_col": version, "eager_defaults": True}
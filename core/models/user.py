@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String
+from sqlalchemy import String, Index
 from core.models.base import Base
 from typing import TYPE_CHECKING
 
@@ -13,7 +13,15 @@ if TYPE_CHECKING:
 
 
 class User(Base):
+    __table_args__ = (
+        # на уникальных индексах держится INSERT ... ON CONFLICT DO NOTHING в users/crud.py
+        # (для username это индекс unique constraint user_username_key)
+        Index("ix_user_email", "email", unique=True),
+    )
+
     username: Mapped[str] = mapped_column(String(32), unique=True)
+    # nullable: у пользователей, созданных до регистрации по email, его нет
+    email: Mapped[str | None] = mapped_column(String(254))
 
     # ForeignKey создаёт связь на уровне базы данных.
     # relationship создаёт удобный интерфейс на уровне Python-объектов для работы с этой связью.
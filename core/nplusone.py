@@ -0,0 +1,135 @@
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from core.config import NPlusOneSettings, settings
+from core.instrumentation import current_route
+
+logger = logging.getLogger(__name__)
+
+# IN с несколькими параметрами: "IN (?, ?)" в sqlite, "IN ($1::INTEGER, $2::INTEGER)" в asyncpg
+MULTI_VALUE_IN = re.compile(r"\bIN \(\s*(?:\?|\$\d+|%s|%\(\w+\)s|:\w+)[^()]*,", re.I)
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+class RequestQueries:
+    # Все запросы одного http запроса. Одинаковый SELECT, который отличается только параметрами,
+    # дает одинаковый текст statement, поэтому считаем повторы прямо по тексту
+    def __init__(self, config: NPlusOneSettings):
+        self.config = config
+        self.total = 0
+        self.selects: Counter[str] = Counter()
+        self.reported: set[str] = set()
+
+    def report(self, problem: str) -> None:
+        message = f"N+1 suspected on route {current_route()}: {problem}"
+        if self.config.mode == "raise":
+            raise NPlusOneError(message)
+        if (
+            problem not in self.reported
+        ):  # в лог одну и ту же проблему пишем один раз за запрос
+            self.reported.add(problem)
+            logger.warning(message)
+
+    @staticmethod
+    def is_batch(statement: str, parameters) -> bool:
+        # Выборка пачки строк по списку ключей (bulk по batch_size, BatchLoader, selectinload)
+        # повторяется на каждую пачку, но это как раз решение N+1, а не он сам.
+        # Списки через массив (id = ANY($1) в постгресе) видно по параметру-списку
+        if MULTI_VALUE_IN.search(statement):
+            return True
+        values = parameters.values() if isinstance(parameters, dict) else parameters
+        return any(
+            isinstance(value, (list, tuple)) and len(value) > 1
+            for value in values or ()
+        )
+
+    def on_statement(self, statement: str, parameters=None) -> None:
+        self.total += 1
+        if statement.lstrip()[:6].upper() != "SELECT":
+            return
+        if self.is_batch(statement, parameters):
+            return
+        self.selects[statement] += 1
+        if self.selects[statement] == self.config.repeated_select_threshold:
+            self.report(
+                f"same SELECT executed {self.config.repeated_select_threshold} times: "
+                f"{statement[:200]}"
+            )
+
+    def on_lazy_load(self, model: str, attribute: str) -> None:
+        if model in self.config.watched_models:
+            self.report(f"lazy load of {model}.{attribute}")
+
+    def finish(self) -> None:
+        if self.total > self.config.max_statements:
+            logger.warning(
+                "route %s issued %s statements (limit %s)",
+                current_route(),
+                self.total,
+                self.config.max_statements,
+            )
+
+
+current_queries: ContextVar[RequestQueries | None] = ContextVar(
+    "current_queries", default=None
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    queries = current_queries.get()
+    if queries is not None:
+        queries.on_statement(statement, None if executemany else parameters)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _detect_lazy_load(orm_execute_state: ORMExecuteState):
+    queries = current_queries.get()
+    # lazy_loaded_from заполнен только для ленивой загрузки, у selectinload/joinedload его нет
+    if queries is None or not orm_execute_state.is_select:
+        return
+    if orm_execute_state.lazy_loaded_from is None:
+        return
+    path = orm_execute_state.loader_strategy_path
+    queries.on_lazy_load(
+        model=orm_execute_state.lazy_loaded_from.class_.__name__,
+        attribute=path[-1].key if path else "?",
+    )
+
+
+@contextmanager
+def detect_n_plus_one(
+    config: NPlusOneSettings = settings.nplusone,
+) -> Iterator[RequestQueries]:
+    # можно использовать и вне http, например в скриптах:
+    # with detect_n_plus_one(NPlusOneSettings(mode="raise")): ...
+    queries = RequestQueries(config=config)
+    token = current_queries.set(queries)
+    try:
+        yield queries
+    finally:
+        current_queries.reset(token)
+    queries.finish()
+
+
+class NPlusOneMiddleware:
+    def __init__(self, app, config: NPlusOneSettings = settings.nplusone):
+        self.app = app
+        self.config = config
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.config.mode == "off":
+            return await self.app(scope, receive, send)
+        with detect_n_plus_one(self.config):
+            await self.app(scope, receive, send)
@@ -0,0 +1,290 @@
+# Кеш готовых http ответов для GET роутов, которые отдают одно и то же на одинаковый запрос.
+# @cache_response(ttl=...) на роуте сохраняет тело ответа (уже закодированные байты) и заголовки
+# по ключу путь + query. ResponseCacheMiddleware отдает попадания еще до роутинга:
+# без валидации параметров, обработчика и json.
+# Одновременные промахи по одному ключу ждут одно вычисление (single-flight), а не идут
+# в бд все разом, когда запись протухла. Хранилище - LRU, ограниченное по байтам
+import asyncio
+import functools
+import hashlib
+import inspect
+import time
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, NamedTuple
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from core.conditional import is_not_modified, strong_etag, validator_headers
+from core.config import ResponseCacheSettings, settings
+from core.threadpool import run_in_threadpool
+
+# пересчитываются при каждой отдаче из кеша
+SKIPPED_HEADERS = {"content-length", "cache-control", "age"}
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    headers: dict[str, str]
+    etag: str
+    last_modified: datetime | None
+    ttl: int
+    stored_at: float
+    # Версия данных на момент записи, например поколение страниц продуктов.
+    # Если version() вернет другое значение - запись устарела раньше ttl
+    version: Callable[[], Awaitable[Any]] | None
+    version_value: Any
+    client_max_age: int  # сколько клиенту можно не спрашивать сервер, 0 - no-cache
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(
+            len(name) + len(value) for name, value in self.headers.items()
+        )
+
+
+def response_cache_key(scope: dict) -> str:
+    # порядок параметров в query на ответ не влияет, ?b=1&a=2 и ?a=2&b=1 - один ключ
+    query = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+    return f"{scope.get('root_path', '')}{scope['path']}?{urlencode(sorted(query))}"
+
+
+class ResponseStore:
+    # LRU как core.cache.MemoryCache, но предел в байтах, а не в числе записей:
+    # страница продуктов в сотни раз больше ответа /items
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._data: OrderedDict[str, CachedResponse] = OrderedDict()
+
+    def get(self, key: str) -> CachedResponse | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry.stored_at + entry.ttl < time.monotonic():
+            self.delete(key)
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        self.delete(key)
+        self._data[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+
+class ResponseCache:
+    def __init__(self, config: ResponseCacheSettings):
+        self.config = config
+        self.store = ResponseStore(max_bytes=config.max_bytes)
+        # ключ -> future с записью, пока первый промах считает ответ
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def lookup(self, key: str) -> CachedResponse | None:
+        entry = self.store.get(key)
+        if entry is not None and entry.version is not None:
+            if await entry.version() != entry.version_value:
+                self.store.delete(key)
+                return None
+        return entry
+
+    def make_entry(
+        self,
+        response: Response,
+        ttl: int,
+        version: Callable[[], Awaitable[Any]] | None,
+        version_value: Any,
+        client_max_age: int,
+    ) -> CachedResponse | None:
+        # None - такой ответ не кешируем: ошибка, поток, куки, фоновая задача, слишком большой
+        if (
+            response.status_code != 200
+            or not hasattr(response, "body")
+            or response.background is not None
+            or "set-cookie" in response.headers
+            or len(response.body) > self.config.max_entry_bytes
+        ):
+            return None
+        headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name not in SKIPPED_HEADERS
+        }
+        # без своего ETag берем хеш тела, чтобы попадания тоже могли отвечать 304
+        etag = headers.setdefault(
+            "etag", strong_etag(hashlib.sha1(response.body).hexdigest())
+        )
+        last_modified = headers.get("last-modified")
+        return CachedResponse(
+            body=response.body,
+            headers=headers,
+            etag=etag,
+            last_modified=(
+                parsedate_to_datetime(last_modified) if last_modified else None
+            ),
+            ttl=ttl,
+            stored_at=time.monotonic(),
+            version=version,
+            version_value=version_value,
+            client_max_age=client_max_age,
+        )
+
+    def respond(self, entry: CachedResponse, request: Request) -> Response:
+        age = int(time.monotonic() - entry.stored_at)
+        # ttl - сколько ответ живет здесь, у клиента свой предел и не дольше остатка ttl
+        max_age = min(entry.client_max_age, entry.ttl - age)
+        cache_headers = {
+            "Cache-Control": f"max-age={max_age}" if max_age > 0 else "no-cache",
+            "Age": str(age),
+        }
+        if is_not_modified(request, entry.etag, entry.last_modified):
+            return Response(
+                status_code=304,
+                headers=validator_headers(entry.etag, entry.last_modified)
+                | cache_headers,
+            )
+        return Response(entry.body, headers=entry.headers | cache_headers)
+
+    async def run(
+        self,
+        request: Request,
+        ttl: int,
+        version: Callable[[], Awaitable[Any]] | None,
+        client_max_age: int,
+        call: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        key = response_cache_key(request.scope)
+        entry = await self.lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return self.respond(entry, request)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            entry = await asyncio.shield(inflight)
+            if entry is None:
+                return await call()  # ответ первого не подошел для кеша, считаем сами
+            return self.respond(entry, request)
+
+        self.misses += 1
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            version_value = await version() if version is not None else None
+            result = await call()
+            # как сделал бы FastAPI для роута без response_model
+            response = (
+                result
+                if isinstance(result, Response)
+                else JSONResponse(jsonable_encoder(result))
+            )
+            entry = self.make_entry(
+                response, ttl, version, version_value, client_max_age
+            )
+            if entry is not None:
+                self.store.set(key, entry)
+        finally:
+            del self._inflight[key]
+            # при исключении ждущие получат None и посчитают ответ сами
+            future.set_result(entry)
+        if entry is None:
+            return response
+        return self.respond(entry, request)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.store.evictions,
+        }
+
+
+response_cache = ResponseCache(config=settings.response_cache)
+
+
+def cache_response(
+    ttl: int,
+    version: Callable[[], Awaitable[Any]] | None = None,
+    client_max_age: int | None = None,
+) -> Callable:
+    # Ставится под @router.get. Возвращаемое значение кодируется как в JSONResponse,
+    # response_model не применяется - роут, которому он нужен, должен сам вернуть Response.
+    # Нужен Request (путь и query): берем параметр обработчика или добавляем свой.
+    # FastAPI передает Request только в один параметр, поэтому второй заводить нельзя.
+    # client_max_age по умолчанию из настроек. С version клиент всегда перепроверяет по ETag,
+    # иначе запись в бд не дошла бы до браузеров и CDN до конца их max-age
+    if version is not None:
+        client_max_age = 0
+    elif client_max_age is None:
+        client_max_age = settings.response_cache.client_max_age
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        if not settings.response_cache.enabled:
+            return func
+        signature = inspect.signature(func)
+        parameters = list(signature.parameters.values())
+        request_name = next(
+            (p.name for p in parameters if p.annotation is Request), None
+        )
+        own_request = request_name is None
+        if own_request:
+            request_name = "response_cache_request"
+            parameters.append(
+                inspect.Parameter(
+                    request_name, inspect.Parameter.KEYWORD_ONLY, annotation=Request
+                )
+            )
+
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            # FastAPI вызывает обработчик только с именованными аргументами
+            request = kwargs.pop(request_name) if own_request else kwargs[request_name]
+
+            async def call():
+                if inspect.iscoroutinefunction(func):
+                    return await func(**kwargs)
+                return await run_in_threadpool(func, **kwargs)
+
+            return await response_cache.run(request, ttl, version, client_max_age, call)
+
+        wrapper.__signature__ = signature.replace(parameters=parameters)
+        return wrapper
+
+    return decorator
+
+
+class ResponseCacheMiddleware:
+    # чистый ASGI middleware: попадание отдается, не доходя до роутера
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not response_cache.config.enabled
+        ):
+            return await self.app(scope, receive, send)
+        entry = await response_cache.lookup(response_cache_key(scope))
+        if entry is None:
+            return await self.app(scope, receive, send)
+        response_cache.hits += 1
+        await response_cache.respond(entry, Request(scope))(scope, receive, send)
@@ -0,0 +1,7 @@
+from fastapi.responses import Response
+
+
+class RawJSONResponse(Response):
+    # Тело уже сериализовано в json bytes (TypeAdapter.dump_json или из кеша).
+    # В отличие от JSONResponse тут нет jsonable_encoder + json.dumps поверх готовых данных
+    media_type = "application/json"
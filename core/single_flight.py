@@ -0,0 +1,82 @@
+# Single-flight: пока по ключу уже идет запрос в бд, остальные вызовы с тем же ключом
+# не берут свое соединение из пула, а ждут результат первого.
+# Ключи - (модель, primary key) для чтения по id и параметры запроса для списков.
+# Делится только результат, пока первый запрос еще не закончился, это не кеш
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import SingleFlightSettings, settings
+from core.models import Base
+
+T = TypeVar("T")
+ModelT = TypeVar("ModelT", bound=Base)
+
+# первого вызова отменили (клиент отключился), ждущие идут в бд сами
+_RETRY = object()
+
+
+class SingleFlight:
+    def __init__(self, config: SingleFlightSettings):
+        self.config = config
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.bypassed = 0
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        if not self.config.enabled:
+            return await call()
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield: отмена одного ждущего не должна отменять общий future
+            result = await asyncio.shield(future)
+            if result is _RETRY:
+                return await self.do(key, call)
+            return result
+        if len(self._calls) >= self.config.max_keys:
+            self.bypassed += 1
+            return await call()
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.leaders += 1
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.set_result(_RETRY)
+            raise
+        except Exception as exc:
+            # ошибка бд достается всем ждущим, повторять запрос каждым смысла нет
+            future.set_exception(exc)
+            future.exception()  # без ждущих asyncio иначе пишет "never retrieved" в лог
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "bypassed": self.bypassed,
+        }
+
+
+single_flight = SingleFlight(config=settings.single_flight)
+
+
+async def get_one(
+    session: AsyncSession, model: type[ModelT], primary_key
+) -> ModelT | None:
+    # session.get через single-flight. Объект первого вызова живет в его сессии,
+    # остальным отдаем копию в их собственной: merge(load=False) копирует состояние без SQL
+    instance = await single_flight.do(
+        (model, primary_key), lambda: session.get(model, primary_key)
+    )
+    if instance is None or instance in session:
+        return instance
+    return await session.merge(instance, load=False)
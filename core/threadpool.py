@@ -0,0 +1,204 @@
+# Политика для sync кода в async приложении.
+# Обычный def обработчик FastAPI отправляет в пул потоков anyio, даже если он просто
+# возвращает константу: переход в поток и обратно стоит десятки микросекунд, а когда
+# все потоки заняты, запрос ждет в очереди, которую снаружи не видно.
+# @inline - тривиальный sync обработчик выполняется прямо в event loop.
+# probe_threadpool - настоящие переходы в пул через тот же лимитер anyio, что у FastAPI:
+# сколько сейчас стоит один переход, вместе с очередью к занятым потокам.
+# audit_sync_routes - перечисляет оставшиеся sync роуты и их цену по измеренному переходу.
+# В сам FastAPI ничего не подменяем: его внутренние имена меняются между версиями
+import functools
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Callable
+
+from anyio import to_thread
+from fastapi import FastAPI
+from fastapi.dependencies.utils import is_async_gen_callable, is_coroutine_callable
+from fastapi.routing import APIRoute
+
+from core.instrumentation import Histogram, current_route, metric_family
+
+logger = logging.getLogger(__name__)
+
+# под этим route в метриках переходы probe_threadpool
+PROBE_ROUTE = "(probe)"
+# ожидание потока обычно микросекунды, секунды - уже пул забит
+WAIT_BUCKETS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]
+
+
+class ThreadpoolMetrics:
+    def __init__(self):
+        self.waits: dict[str, Histogram] = defaultdict(lambda: Histogram(WAIT_BUCKETS))
+        # весь переход: ожидание потока, запуск в нем и возврат результата в event loop,
+        # без времени самой функции
+        self.overheads: dict[str, Histogram] = defaultdict(
+            lambda: Histogram(WAIT_BUCKETS)
+        )
+
+    def observe_wait(self, route: str, wait: float) -> None:
+        self.waits[route].observe(wait)
+
+    def observe_overhead(self, route: str, overhead: float) -> None:
+        self.overheads[route].observe(overhead)
+
+    @staticmethod
+    def render_histograms(
+        name: str, description: str, histograms: dict[str, Histogram]
+    ) -> list[str]:
+        lines = [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+        for route, histogram in histograms.items():
+            labels = f'route="{route}"'
+            for bound, count in histogram.cumulative():
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return lines
+
+    def render(self) -> str:
+        # лимитер свой у каждого event loop, поэтому читается только внутри async кода
+        limiter = to_thread.current_default_thread_limiter()
+        lines = metric_family(
+            "threadpool_size", "gauge", "Worker threads", [("", limiter.total_tokens)]
+        )
+        lines += metric_family(
+            "threadpool_busy",
+            "gauge",
+            "Worker threads running a call",
+            [("", limiter.borrowed_tokens)],
+        )
+        lines += metric_family(
+            "threadpool_waiting",
+            "gauge",
+            "Calls waiting for a free worker thread",
+            [("", limiter.statistics().tasks_waiting)],
+        )
+        lines += self.render_histograms(
+            "threadpool_queue_wait_seconds",
+            "Time from submit to start in a worker thread",
+            self.waits,
+        )
+        lines += self.render_histograms(
+            "threadpool_overhead_seconds",
+            "Threadpool call time minus the time spent in the function itself",
+            self.overheads,
+        )
+        return "\n".join(lines) + "\n"
+
+
+threadpool_metrics = ThreadpoolMetrics()
+
+
+def configure_threadpool(size: int) -> None:
+    # вызывать из работающего event loop (lifespan), у каждого loop свой лимитер
+    to_thread.current_default_thread_limiter().total_tokens = size
+
+
+async def run_in_threadpool(func: Callable[..., Any], *args, **kwargs) -> Any:
+    # как starlette.concurrency.run_in_threadpool, но с замером ожидания свободного потока
+    # и всей цены перехода. Для sync функций, которые в пул отправляет наш код
+    # (cache_response), свои def вызовы FastAPI делает сам
+    route = current_route()
+    started = finished = None
+    submitted = time.perf_counter()
+
+    def run():
+        nonlocal started, finished
+        started = time.perf_counter()
+        threadpool_metrics.observe_wait(route, started - submitted)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            finished = time.perf_counter()
+
+    try:
+        return await to_thread.run_sync(run)
+    finally:
+        if finished is not None:
+            threadpool_metrics.observe_overhead(
+                route, time.perf_counter() - submitted - (finished - started)
+            )
+
+
+async def probe_threadpool(hops: int) -> dict:
+    # Пустая функция через to_thread.run_sync с лимитером по умолчанию - тот же путь и та же
+    # очередь, что у def обработчиков и зависимостей FastAPI. Переходы по одному, как у запроса
+    waits, overheads = [], []
+    for _ in range(hops):
+        submitted = time.perf_counter()
+        started = await to_thread.run_sync(time.perf_counter)
+        overhead = time.perf_counter() - submitted
+        waits.append(started - submitted)
+        overheads.append(overhead)
+        threadpool_metrics.observe_wait(PROBE_ROUTE, started - submitted)
+        threadpool_metrics.observe_overhead(PROBE_ROUTE, overhead)
+    return {
+        "hops": hops,
+        "overhead_us": round(sum(overheads) / hops * 1_000_000, 1),
+        "wait_us": round(sum(waits) / hops * 1_000_000, 1),
+    }
+
+
+def inline(func: Callable[..., Any]) -> Callable[..., Any]:
+    # Только для обработчиков без блокирующего I/O и тяжелых вычислений:
+    # пока он выполняется, event loop больше ничего не обслуживает.
+    # functools.wraps сохраняет сигнатуру, FastAPI берет параметры из нее
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def sync_calls(route: APIRoute) -> list[Callable[..., Any]]:
+    # обработчик и все его зависимости, которые FastAPI сам отправит в пул потоков.
+    # Проверки те же, что у FastAPI: классы и объекты с sync __call__ тоже уходят в пул
+    calls, dependants = [], [route.dependant]
+    while dependants:
+        dependant = dependants.pop()
+        call = dependant.call
+        if not (
+            call is None or is_coroutine_callable(call) or is_async_gen_callable(call)
+        ):
+            calls.append(call)
+        dependants.extend(dependant.dependencies)
+    return calls
+
+
+def audit_sync_routes(app: FastAPI, probe: dict) -> list[dict]:
+    # каждая sync функция - отдельный переход в пул на каждый запрос,
+    # цена роута - их число на измеренный probe_threadpool переход
+    report = []
+    for route in app.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        calls = sync_calls(route)
+        if calls:
+            report.append(
+                {
+                    "route": f"{','.join(sorted(route.methods))} {route.path}",
+                    "functions": [
+                        getattr(call, "__qualname__", repr(call)) for call in calls
+                    ],
+                    "hops": len(calls),
+                    "overhead_us": round(len(calls) * probe["overhead_us"], 1),
+                    "wait_us": round(len(calls) * probe["wait_us"], 1),
+                }
+            )
+    return report
+
+
+def log_sync_routes(report: list[dict], probe: dict) -> None:
+    for item in report:
+        logger.warning(
+            "sync calls in threadpool: %s -> %s, %s hops ~%sus per request "
+            "(measured hop %sus over %s probes); "
+            "use async def or @inline (core/threadpool.py)",
+            item["route"],
+            ", ".join(item["functions"]),
+            item["hops"],
+            item["overhead_us"],
+            probe["overhead_us"],
+            probe["hops"],
+        )
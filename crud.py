@@ -4,7 +4,6 @@ from sqlalchemy import select, text
 from sqlalchemy.engine import Result
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
-from sqlalchemy.testing.suite.test_reflection import users
 
 from core.models import db_helper, User, Profile, Post
 
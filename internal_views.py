@@ -0,0 +1,205 @@
+import hmac
+from ipaddress import ip_address
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.responses import PlainTextResponse
+
+from api_v1.products.cache import product_cache
+from api_v1.products.write_behind import product_write_queue
+from core.config import settings
+from core.instrumentation import metric_family, query_metrics
+from core.lifespan import app_state
+from core.loader import loader_metrics
+from core.models import db_helper
+from core.response_cache import response_cache
+from core.single_flight import single_flight
+from core.threadpool import audit_sync_routes, probe_threadpool, threadpool_metrics
+
+
+def is_loopback(request: Request) -> bool:
+    if request.client is None:
+        return False
+    try:
+        return ip_address(request.client.host).is_loopback
+    except ValueError:
+        return False  # не ip, например имя хоста от тестового клиента
+
+
+async def internal_access(
+    request: Request, authorization: Annotated[str | None, Header()] = None
+) -> None:
+    # Не надеемся, что балансер не пропустит /internal наружу: POST /internal/drain от любого
+    # клиента вывел бы из балансировки все инстансы сразу
+    token = settings.internal.token
+    if token and authorization is not None:
+        if hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+            return
+    if settings.internal.allow_loopback and is_loopback(request):
+        return
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Internal endpoints need a loopback client or the internal token",
+    )
+
+
+router = APIRouter(
+    prefix="/internal", tags=["Internal"], dependencies=[Depends(internal_access)]
+)  # служебные ручки для мониторинга, только с loopback или по токену (internal_access)
+
+
+@router.get("/ready")
+async def get_readiness(response: Response) -> dict:
+    # готов - прогрев на старте закончен, остановка не началась и бд отвечает
+    ready = app_state.started and not app_state.draining and await db_helper.ping()
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"ready": ready, "in_flight": app_state.in_flight}
+
+
+@router.post("/drain")
+async def start_draining() -> dict:
+    # для preStop хука: readiness начинает отвечать 503 еще до SIGTERM,
+    # запросы при этом обслуживаются как обычно
+    app_state.start_draining()
+    return {"draining": True, "in_flight": app_state.in_flight}
+
+
+@router.get("/threadpool")
+async def get_threadpool_audit(request: Request) -> dict:
+    # переход в поток меряется заново, под текущей нагрузкой: занятый пул видно по wait_us
+    probe = await probe_threadpool(settings.threadpool.probe_hops)
+    return {"probe": probe, "routes": audit_sync_routes(request.app, probe)}
+
+
+@router.get("/db/pool")
+async def get_db_pool_status() -> dict:
+    return {
+        "primary": db_helper.pool_status(),
+        "replicas": [
+            db_helper.pool_status(engine) for engine in db_helper.replica_engines
+        ],
+    }
+
+
+# тип и описание для каждого ключа из db_helper.pool_status
+POOL_METRICS = {
+    "size": ("gauge", "Configured number of pooled connections"),
+    "checked_out": ("gauge", "Connections in use"),
+    "checked_in": ("gauge", "Idle connections in the pool"),
+    "overflow": ("gauge", "Connections above the pool size"),
+    "checkouts": ("counter", "Connections taken from the pool queue"),
+    "timeouts": ("counter", "Checkouts that timed out waiting for a connection"),
+    "wait_seconds_total": ("counter", "Time spent waiting for a pooled connection"),
+    "wait_seconds_max": ("gauge", "Longest wait for a pooled connection"),
+    "wait_seconds_avg": ("gauge", "Average wait for a pooled connection"),
+    "connects": ("counter", "New database connections opened"),
+    "connect_seconds_total": ("counter", "Time spent opening new connections"),
+    "connect_seconds_max": ("gauge", "Longest time to open a new connection"),
+}
+
+
+def render_pool_metrics() -> str:
+    engines = [("primary", db_helper.engine)] + [
+        (f"replica{number}", engine)
+        for number, engine in enumerate(db_helper.replica_engines)
+    ]
+    statuses = [(name, db_helper.pool_status(engine)) for name, engine in engines]
+    lines = []
+    for key, (kind, description) in POOL_METRICS.items():
+        samples = [(f'{{engine="{name}"}}', status[key]) for name, status in statuses]
+        lines += metric_family(f"db_pool_{key}", kind, description, samples)
+    return "\n".join(lines) + "\n"
+
+
+def render_counters(
+    prefix: str, stats: dict[str, int], descriptions: dict
+) -> list[str]:
+    lines = []
+    for key, value in stats.items():
+        name = f"{prefix}_{key}_total"
+        lines += metric_family(name, "counter", descriptions[key], [("", value)])
+    return lines
+
+
+def render_cache_metrics() -> str:
+    lines = render_counters(
+        "products_cache",
+        product_cache.stats(),
+        {
+            "hits": "Product cache hits",
+            "misses": "Product cache misses",
+            "stale_fills": "Cache fills dropped because a write overtook them",
+        },
+    )
+    return "\n".join(lines) + "\n"
+
+
+def render_response_cache_metrics() -> str:
+    lines = metric_family(
+        "response_cache_bytes",
+        "gauge",
+        "Size of cached responses",
+        [("", response_cache.store.size)],
+    )
+    lines += render_counters(
+        "response_cache",
+        response_cache.stats(),
+        {
+            "hits": "Responses served from the cache",
+            "misses": "Responses not found in the cache",
+            "coalesced": "Cache misses that waited for a concurrent fill",
+            "evictions": "Responses evicted to stay within the size limit",
+        },
+    )
+    return "\n".join(lines) + "\n"
+
+
+def render_single_flight_metrics() -> str:
+    lines = render_counters(
+        "single_flight",
+        single_flight.stats(),
+        {
+            "leaders": "Reads that ran the query",
+            "coalesced": "Reads that waited for a concurrent identical read",
+            "bypassed": "Reads run directly because too many keys were in flight",
+        },
+    )
+    return "\n".join(lines) + "\n"
+
+
+def render_write_queue_metrics() -> str:
+    stats = product_write_queue.stats()
+    lines = metric_family(
+        "products_write_queue_pending",
+        "gauge",
+        "Products with queued changes",
+        [("", stats.pop("pending"))],
+    )
+    lines += render_counters(
+        "products_write_queue",
+        stats,
+        {
+            "accepted": "PATCH requests queued",
+            "coalesced": "PATCH requests merged into already queued changes",
+            "rejected": "PATCH requests rejected because the queue was full",
+            "flushed": "Products written to the database",
+            "failed_flushes": "Flushes that failed and were requeued",
+        },
+    )
+    return "\n".join(lines) + "\n"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> str:
+    return PlainTextResponse(
+        query_metrics.render()
+        + render_pool_metrics()
+        + render_cache_metrics()
+        + render_response_cache_metrics()
+        + render_single_flight_metrics()
+        + loader_metrics.render()
+        + render_write_queue_metrics()
+        + threadpool_metrics.render(),
+        media_type="text/plain; version=0.0.4",
+    )
@@ -1,22 +1,34 @@
 from typing import Annotated
 from fastapi import Path, APIRouter
 
+from core.response_cache import cache_response
+from core.threadpool import inline
+
 router = APIRouter(
     prefix="/items", tags=["Items"]  # tag to group up views in swagger
 )  # Namespaces are one honking great idea!
 
 
+# ответы без I/O: @inline выполняет их прямо в event loop, без перехода в пул потоков.
+# Ответ всегда один и тот же, поэтому еще и кешируется целиком (core/response_cache.py),
+# и клиентам тоже можно держать его у себя весь ttl
 @router.get("")
+@cache_response(ttl=3600, client_max_age=3600)
+@inline
 def list_items():
     return ["Item1", "Item2"]
 
 
 @router.get("/latest")
+@cache_response(ttl=3600, client_max_age=3600)
+@inline
 def get_latest_item():
     return {"item": {"id": "0", "name": "latest"}}
 
 
 @router.get("/{item_id}")  # var as a path
+@cache_response(ttl=3600, client_max_age=3600)
+@inline
 def get_item_by_id(
     item_id: Annotated[int, Path(ge=1, lt=1_000_000)]
 ):  # Annotated for validating value. First one is type, second is a special fastapi obj that allows to pass constraits
@@ -1,10 +1,61 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from items_views import router as items_router
 from users.views import router as users_router
+from internal_views import router as internal_router
 from api_v1 import router as router_v1
+from api_v1.products import crud as products_crud
+from api_v1.products.write_behind import product_write_queue
 from core.config import settings
+from core.instrumentation import RouteContextMiddleware
+from core.lifespan import InFlightMiddleware, app_state, install_drain_on_sigterm
+from core.models import db_helper
+from core.nplusone import NPlusOneMiddleware
+from core.response_cache import ResponseCacheMiddleware
+from core.threadpool import (
+    audit_sync_routes,
+    configure_threadpool,
+    log_sync_routes,
+    probe_threadpool,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app_state.reset()
+    product_write_queue.open()
+    if settings.write_behind.enabled:
+        product_write_queue.start()
+    restore_sigterm = install_drain_on_sigterm(settings.lifespan.shutdown_delay)
+    configure_threadpool(settings.threadpool.size)
+    if settings.threadpool.audit:
+        # замер после configure_threadpool: переходы идут через уже настроенный лимитер
+        probe = await probe_threadpool(settings.threadpool.probe_hops)
+        log_sync_routes(audit_sync_routes(app, probe), probe)
+    await db_helper.warm_up(
+        connections=settings.lifespan.warmup_connections,
+        prime=products_crud.prime_statements,
+    )
+    app_state.started = True
+    yield
+    restore_sigterm()
+    # draining обычно уже начат по SIGTERM, тут только ждем начатые запросы
+    await app_state.drain(settings.lifespan.drain_timeout)
+    # отложенные PATCH (write-behind) дописываем в бд до остановки процесса
+    await product_write_queue.close()
+    await db_helper.dispose()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+# самый внутренний: попадания в кеш ответов отдаются до роутинга
+app.add_middleware(ResponseCacheMiddleware)
+app.add_middleware(NPlusOneMiddleware)
+# чтобы SQL метрики знали из какого роута запрос
+app.add_middleware(RouteContextMiddleware)
+# последним, то есть самым внешним: считает запрос целиком для плавной остановки
+app.add_middleware(InFlightMiddleware)
 app.include_router(items_router)
 app.include_router(users_router)
+app.include_router(internal_router)
 app.include_router(router=router_v1, prefix=settings.api_v1_prefix)
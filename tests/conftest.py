@@ -0,0 +1,74 @@
+# Тесты идут на временной sqlite через aiosqlite, постгрес не нужен.
+# Настройки читаются из окружения при импорте core.config, поэтому DB__URL ставится
+# раньше любых импортов приложения. Async тесты запускает плагин anyio (@pytest.mark.anyio)
+import os
+import tempfile
+
+DB_DIR = tempfile.mkdtemp(prefix="learning_fastapi_tests_")
+os.environ["DB__URL"] = f"sqlite+aiosqlite:///{DB_DIR}/primary.db"
+os.environ["NPLUSONE__MODE"] = "raise"
+
+import httpx
+import pytest
+from sqlalchemy import event
+
+from api_v1.products.cache import product_cache
+from core.cache import create_cache_backend
+from core.config import settings
+from core.models import Base, Product, db_helper
+from core.response_cache import ResponseStore, response_cache
+from main import app
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def database():
+    # чистые таблицы и кеши на каждый тест
+    async with db_helper.engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    product_cache.backend = create_cache_backend(settings.cache)
+    response_cache.store = ResponseStore(max_bytes=settings.response_cache.max_bytes)
+    yield db_helper
+    async with db_helper.engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+    # у каждого теста свой event loop, соединения из пула в следующий не переносим
+    await db_helper.dispose()
+
+
+@pytest.fixture
+def statements(database):
+    # тексты всех SQL, выполненных за тест: по ним проверяем число запросов
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    engine = db_helper.engine.sync_engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+async def client(database):
+    # ASGITransport не шлет lifespan события: прогрева, audit и остановки тут нет
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        yield client
+
+
+@pytest.fixture
+async def products(database) -> list[Product]:
+    async with db_helper.session_factory() as session:
+        products = [
+            Product(name=f"product {number}", description="test", price=number)
+            for number in range(1, 11)
+        ]
+        session.add_all(products)
+        await session.commit()
+    return products
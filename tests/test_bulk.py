@@ -0,0 +1,139 @@
+# Bulk ручки продуктов: один statement на батч, статус по каждому элементу в порядке входа
+import pytest
+from sqlalchemy import select
+
+from core.config import settings
+from core.models import Product, db_helper
+
+pytestmark = pytest.mark.anyio
+
+
+async def saved() -> dict[int, tuple[str, str, int, int]]:
+    async with db_helper.session_factory() as session:
+        result = await session.execute(
+            select(
+                Product.id,
+                Product.name,
+                Product.description,
+                Product.price,
+                Product.version,
+            )
+        )
+        return {id: tuple(values) for id, *values in result}
+
+
+async def test_create_bulk(client, database, statements, monkeypatch):
+    monkeypatch.setattr(settings.bulk, "batch_size", 2)
+    response = await client.post(
+        "/api/v1/products/bulk",
+        json=[
+            {"name": f"bulk {number}", "description": "d", "price": number + 1}
+            for number in range(5)
+        ],
+    )
+
+    assert response.status_code == 201
+    results = response.json()
+    assert [result["status"] for result in results] == ["created"] * 5
+    assert [result["product"]["name"] for result in results] == [
+        f"bulk {number}" for number in range(5)
+    ]
+    assert len(await saved()) == 5
+    assert sum(statement.startswith("INSERT") for statement in statements) == 3
+
+
+async def test_update_bulk_statuses(client, products, statements, monkeypatch):
+    monkeypatch.setattr(settings.bulk, "batch_size", 3)
+    first, second, third = (product.id for product in products[:3])
+    response = await client.patch(
+        "/api/v1/products/bulk",
+        json=[
+            {"id": first, "price": 100},
+            {"id": 999_999, "price": 1},
+            {"id": second},
+            {"id": third, "name": "renamed"},
+            {"id": 999_998},
+            {"id": first, "description": "again"},
+        ],
+    )
+
+    assert response.status_code == 200
+    # в каждом батче из 3 элементов UPDATE ... RETURNING и SELECT id пустых элементов
+    assert [statement.split()[0] for statement in statements] == [
+        "UPDATE",
+        "SELECT",
+    ] * 2
+    assert [(result["id"], result["status"]) for result in response.json()] == [
+        (first, "updated"),
+        (999_999, "not_found"),
+        (second, "unchanged"),
+        (third, "updated"),
+        (999_998, "not_found"),
+        (first, "updated"),
+    ]
+    rows = await saved()
+    # переданные поля поменялись, остальные остались, пустой элемент строку не тронул
+    assert rows[first] == ("product 1", "again", 100, 3)
+    assert rows[second] == ("product 2", "test", 2, 1)
+    assert rows[third] == ("renamed", "test", 3, 2)
+    assert rows[products[3].id] == ("product 4", "test", 4, 1)
+
+
+async def test_update_bulk_merges_duplicates_in_batch(client, products):
+    product_id = products[0].id
+    response = await client.patch(
+        "/api/v1/products/bulk",
+        json=[
+            {"id": product_id, "price": 100, "name": "first"},
+            {"id": product_id, "price": 200},
+        ],
+    )
+
+    assert [result["status"] for result in response.json()] == ["updated"] * 2
+    assert (await saved())[product_id] == ("first", "test", 200, 2)
+
+
+async def test_update_bulk_invalidates_cache(client, products):
+    url = f"/api/v1/products/{products[0].id}"
+    assert (await client.get(url)).json()["price"] == 1
+
+    await client.patch(
+        "/api/v1/products/bulk", json=[{"id": products[0].id, "price": 50}]
+    )
+
+    assert (await client.get(url)).json()["price"] == 50
+
+
+async def test_delete_bulk(client, products):
+    ids = [products[0].id, 999_999, products[1].id]
+    response = await client.request("DELETE", "/api/v1/products/bulk", json=ids)
+
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()] == [
+        "deleted",
+        "not_found",
+        "deleted",
+    ]
+    assert set(await saved()) == {product.id for product in products[2:]}
+
+
+async def test_bulk_size_is_limited(client, database, monkeypatch):
+    response = await client.request(
+        "DELETE",
+        "/api/v1/products/bulk",
+        json=list(range(1, settings.bulk.max_items + 2)),
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("product_id", [2**31, 10**30, 0])
+async def test_bulk_ids_out_of_range_are_422(client, products, product_id):
+    response = await client.patch(
+        "/api/v1/products/bulk", json=[{"id": product_id, "price": 5}]
+    )
+    assert response.status_code == 422
+    response = await client.request(
+        "DELETE", "/api/v1/products/bulk", json=[products[0].id, product_id]
+    )
+    assert response.status_code == 422
+    assert products[0].id in await saved()
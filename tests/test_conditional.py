@@ -0,0 +1,128 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_write_responses_have_the_same_shape_as_get(client):
+    created = await client.post(
+        "/api/v1/products", json={"name": "a", "description": "d", "price": 1}
+    )
+    product_id = created.json()["id"]
+    url = f"/api/v1/products/{product_id}"
+
+    put = await client.put(url, json={"name": "b", "description": "d", "price": 2})
+    patch = await client.patch(url, json={"price": 3})
+    get = await client.get(url)
+    assert list(put.json()) == list(patch.json()) == list(get.json())
+    assert get.json() == {"name": "b", "description": "d", "price": 3, "id": product_id}
+    assert patch.headers["etag"] == get.headers["etag"] == '"3"'
+
+
+async def test_list_etag_changes_after_each_write(client, products):
+    first = await client.get("/api/v1/products")
+    etag = first.headers["etag"]
+    for price in (100, 101):
+        # две записи подряд, быстрее разрешения часов в секундах
+        await client.patch(f"/api/v1/products/{products[0].id}", json={"price": price})
+        response = await client.get("/api/v1/products", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        etag = response.headers["etag"]
+    response = await client.get("/api/v1/products", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+async def test_empty_patch_changes_nothing(client, products, statements):
+    url = f"/api/v1/products/{products[0].id}"
+    before = await client.get(url)
+    listed = (await client.get("/api/v1/products")).headers["etag"]
+    statements.clear()
+
+    patch = await client.patch(url, json={})
+
+    # ни UPDATE, ни новой версии: ETag и продукта, и списка у клиентов остаются верными
+    assert patch.status_code == 200
+    assert patch.json() == before.json()
+    assert patch.headers["etag"] == before.headers["etag"] == '"1"'
+    assert not any(statement.startswith("UPDATE") for statement in statements)
+    response = await client.get("/api/v1/products", headers={"If-None-Match": listed})
+    assert response.status_code == 304
+
+
+async def test_empty_patch_checks_product_and_version(client, products):
+    assert (await client.patch("/api/v1/products/999999", json={})).status_code == 404
+    stale = await client.patch(
+        f"/api/v1/products/{products[0].id}", json={}, headers={"If-Match": '"7"'}
+    )
+    assert stale.status_code == 412
+
+
+@pytest.mark.parametrize(
+    "if_match, status_code",
+    [
+        ('W/"1"', 412),  # If-Match сравнивается только строго
+        ('"abc"', 412),
+        ('"5", "1"', 200),  # текущая версия 1 в списке
+        ('"5", W/"1"', 412),  # слабый не считается, остается одна старая версия
+        ('"5"', 412),  # одна старая версия: проверяет сам UPDATE
+        ('"99999999999999999999999"', 412),  # больше INTEGER, в бд не уходит
+        ('"5", "99999999999999999999999"', 412),
+        ('"5", "6"', 412),
+        ("1", 400),
+        ('"1", garbage', 400),
+    ],
+)
+async def test_if_match_strong_comparison(client, products, if_match, status_code):
+    url = f"/api/v1/products/{products[0].id}"
+    response = await client.patch(
+        url, json={"price": 42}, headers={"If-Match": if_match}
+    )
+    assert response.status_code == status_code
+    expected = 42 if status_code == 200 else products[0].price
+    assert (await client.get(url)).json()["price"] == expected
+
+
+async def test_if_match_list_on_missing_product_is_404(client, products):
+    response = await client.delete(
+        "/api/v1/products/999999", headers={"If-Match": '"1", "2"'}
+    )
+    assert response.status_code == 404
+
+
+async def test_list_is_not_cached_by_date_after_delete(client, products):
+    listed = await client.get("/api/v1/products")
+    # max(updated_at) после удаления не растет, по дате список проверять нельзя
+    assert "last-modified" not in listed.headers
+    since = "Fri, 01 Jan 2100 00:00:00 GMT"
+    assert (
+        await client.delete(f"/api/v1/products/{products[0].id}")
+    ).status_code == 204
+
+    response = await client.get(
+        "/api/v1/products",
+        headers={"If-Modified-Since": since, "If-None-Match": listed.headers["etag"]},
+    )
+    assert response.status_code == 200
+    assert products[0].id not in [item["id"] for item in response.json()["items"]]
+    response = await client.get(
+        "/api/v1/products", headers={"If-Modified-Since": since}
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize(
+    "method, body",
+    [
+        ("put", {"name": "b", "description": "d", "price": 2}),
+        ("patch", {"price": 2}),
+        ("delete", None),
+    ],
+)
+@pytest.mark.parametrize("if_match", ['"7"', 'W/"1"', '"7", "8"', '"abc"'])
+async def test_every_failed_if_match_is_412(client, products, method, body, if_match):
+    url = f"/api/v1/products/{products[0].id}"
+    response = await client.request(
+        method, url, json=body, headers={"If-Match": if_match}
+    )
+    assert response.status_code == 412
+    assert (await client.get(url)).json()["price"] == products[0].price
@@ -0,0 +1,18 @@
+# Холодный старт: python -X importtime -c "import main" в отдельных процессах.
+# Бюджет с запасом на медленные машины, переопределяется IMPORT_BUDGET_MS
+import os
+
+from benchmarks.import_time import forbidden_modules, measure_once, median_ms
+
+BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", 1500))
+RUNS = 3
+
+
+def test_import_main_is_lazy_and_within_budget(monkeypatch):
+    # conftest подставил sqlite, а проверять надо настройки по умолчанию - postgresql+asyncpg
+    monkeypatch.delenv("DB__URL")
+    runs = [measure_once("main") for _ in range(RUNS)]
+
+    assert "main" in runs[-1]
+    assert forbidden_modules(runs[-1]) == []
+    assert median_ms(runs, "main") <= BUDGET_MS
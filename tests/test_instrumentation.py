@@ -0,0 +1,45 @@
+# SQL метрики (core/instrumentation.py QueryMetrics): время запроса по before/after_cursor_execute,
+# упавший запрос не оставляет за собой время старта на соединении из пула
+import pytest
+import sqlalchemy as sa
+
+from core.config import InstrumentationSettings
+from core.instrumentation import QueryMetrics
+
+
+@pytest.fixture
+def metrics() -> QueryMetrics:
+    return QueryMetrics(InstrumentationSettings())
+
+
+@pytest.fixture
+def engine(tmp_path, metrics):
+    engine = sa.create_engine(f"sqlite:///{tmp_path}/metrics.db", pool_size=1)
+    metrics.instrument(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_queries_are_measured(engine, metrics):
+    with engine.connect() as connection:
+        for _ in range(3):
+            connection.execute(sa.text("SELECT 1"))
+
+    assert metrics.durations[("-", "SELECT")].count == 3
+    assert 'db_query_duration_seconds_count{route="-",operation="SELECT"} 3' in (
+        metrics.render()
+    )
+
+
+def test_failed_query_does_not_leak_start_time(engine, metrics):
+    for _ in range(3):
+        with engine.connect() as connection:
+            with pytest.raises(sa.exc.OperationalError):
+                connection.execute(sa.text("SELECT * FROM missing_table"))
+            # то же соединение из пула: записи о старте упавших запросов не копятся
+            assert connection.info["query_started"] == {}
+
+    with engine.connect() as connection:
+        connection.execute(sa.text("SELECT 1"))
+        assert connection.info["query_started"] == {}
+    assert metrics.durations[("-", "SELECT")].count == 1
@@ -0,0 +1,90 @@
+# /internal/* доступны только с loopback или с токеном (internal_views.internal_access):
+# drain от внешнего клиента вывел бы инстанс из балансировки
+import httpx
+import pytest
+
+from core.config import settings
+from core.lifespan import app_state
+from main import app
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def remote_client(database, monkeypatch):
+    monkeypatch.setattr(settings.internal, "token", "secret")
+    app_state.reset()
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app, client=("203.0.113.7", 40000)),
+        base_url="http://test",
+    ) as client:
+        yield client
+    app_state.reset()
+
+
+@pytest.mark.parametrize(
+    "method, path",
+    [
+        ("post", "/internal/drain"),
+        ("get", "/internal/ready"),
+        ("get", "/internal/metrics"),
+        ("get", "/internal/db/pool"),
+    ],
+)
+async def test_remote_client_without_token_is_rejected(remote_client, method, path):
+    response = await remote_client.request(method, path)
+    assert response.status_code == 403
+    assert not app_state.draining
+
+
+@pytest.mark.parametrize("authorization", ["Bearer wrong", "secret", ""])
+async def test_wrong_token_is_rejected(remote_client, authorization):
+    response = await remote_client.post(
+        "/internal/drain", headers={"Authorization": authorization}
+    )
+    assert response.status_code == 403
+    assert not app_state.draining
+
+
+async def test_token_allows_remote_client(remote_client):
+    response = await remote_client.post(
+        "/internal/drain", headers={"Authorization": "Bearer secret"}
+    )
+    assert response.status_code == 200
+    assert app_state.draining
+    # обычные ручки доступны всем как и раньше
+    assert (await remote_client.get("/api/v1/products")).status_code == 200
+
+
+async def test_loopback_can_be_disabled(client, monkeypatch):
+    assert (await client.get("/internal/db/pool")).status_code == 200
+    monkeypatch.setattr(settings.internal, "allow_loopback", False)
+    assert (await client.get("/internal/db/pool")).status_code == 403
+
+
+async def test_metrics_declare_every_family(client, products):
+    # prometheus text format: перед строками семейства один раз # HELP и # TYPE
+    await client.get("/api/v1/products")
+    response = await client.get("/internal/metrics")
+    assert response.status_code == 200
+    declared: dict[str, str] = {}
+    helped = set()
+    for line in response.text.splitlines():
+        if line.startswith("# HELP "):
+            helped.add(line.split()[2])
+            continue
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split()
+            assert name not in declared, f"{name} declared twice"
+            declared[name] = kind
+            continue
+        sample = line.split("{")[0].split()[0]
+        family = sample
+        for suffix in ("_bucket", "_sum", "_count"):
+            base = sample.removesuffix(suffix)
+            if declared.get(base) == "histogram":
+                family = base
+        assert family in declared and family in helped, f"{sample} has no # TYPE"
+    assert declared["db_pool_checked_out"] == "gauge"
+    assert declared["products_cache_hits_total"] == "counter"
+    assert declared["threadpool_size"] == "gauge"
@@ -0,0 +1,56 @@
+import asyncio
+import signal
+
+import pytest
+
+from core.config import settings
+from core.lifespan import app_state
+from main import app
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def sigterm_calls(monkeypatch):
+    # вместо обработчика uvicorn: записываем, когда до него дошел SIGTERM
+    calls = []
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: calls.append(signum))
+    monkeypatch.setattr(settings.lifespan, "shutdown_delay", 0.05)
+    yield calls
+    signal.signal(signal.SIGTERM, previous)
+
+
+async def test_sigterm_fails_readiness_before_server_stops(client, sigterm_calls):
+    async with app.router.lifespan_context(app):
+        assert (await client.get("/internal/ready")).status_code == 200
+
+        signal.raise_signal(signal.SIGTERM)
+        # сервер еще обслуживает запросы, но балансеру уже отвечаем 503
+        response = await client.get("/internal/ready")
+        assert response.status_code == 503
+        assert sigterm_calls == []
+
+        await asyncio.sleep(0.1)
+        assert sigterm_calls == [signal.SIGTERM]
+    assert signal.getsignal(signal.SIGTERM) is not None
+    signal.raise_signal(signal.SIGTERM)  # обработчик после остановки снова прежний
+    assert sigterm_calls == [signal.SIGTERM, signal.SIGTERM]
+
+
+async def test_drain_endpoint_fails_readiness(client):
+    async with app.router.lifespan_context(app):
+        assert (await client.post("/internal/drain")).status_code == 200
+        assert (await client.get("/internal/ready")).status_code == 503
+        assert (await client.get("/api/v1/products")).status_code == 200
+
+
+async def test_second_lifespan_starts_clean(client, products, monkeypatch):
+    monkeypatch.setattr(settings.write_behind, "enabled", True)
+    url = f"/api/v1/products/{products[0].id}"
+    for price in (100, 200):
+        async with app.router.lifespan_context(app):
+            assert (await client.get("/internal/ready")).status_code == 200
+            assert (await client.patch(url, json={"price": price})).status_code == 202
+        # остановка дописала очередь в бд
+        assert not app_state.in_flight
+        assert (await client.get(url)).json()["price"] == price
@@ -0,0 +1,145 @@
+# BatchLoader (core/loader.py) и GET /products/bulk через него: load в одном тике - один SELECT,
+# повторный load того же id - тот же объект без SQL, отмена одного ждущего не трогает остальных,
+# ошибка и отмена выборки не кешируются
+import asyncio
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from core.config import settings
+from core.loader import Loaders, loader_metrics
+from core.models import Product, db_helper
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def session(database):
+    async with db_helper.session_factory() as session:
+        yield session
+
+
+async def test_loads_in_one_tick_are_batched(products, statements, session):
+    loader = Loaders(session=session, max_batch_size=100)[Product]
+    batches = loader_metrics.batch_sizes["Product"].count
+    ids = [product.id for product in products[:5]] + [999_999]
+
+    loaded = await loader.load_many(ids)
+
+    assert [product and product.id for product in loaded] == ids[:5] + [None]
+    assert len(statements) == 1
+    assert loader_metrics.batch_sizes["Product"].count == batches + 1
+
+
+async def test_batch_is_split_by_max_batch_size(products, statements, session):
+    loader = Loaders(session=session, max_batch_size=4)[Product]
+
+    loaded = await loader.load_many(product.id for product in products)
+
+    assert [product.id for product in loaded] == [product.id for product in products]
+    assert len(statements) == 3  # 4 + 4 + 2
+
+
+async def test_repeated_load_is_cached(products, statements, session):
+    loader = Loaders(session=session, max_batch_size=100)[Product]
+    first = await loader.load(products[0].id)
+
+    assert await loader.load(products[0].id) is first
+    assert len(statements) == 1
+
+
+async def test_identity_map_is_used_before_select(products, statements, session):
+    # объект уже загружен в сессию другим запросом - в SELECT лоадера его id не попадает
+    already_loaded = await session.get(Product, products[0].id)
+    statements.clear()
+    loader = Loaders(session=session, max_batch_size=100)[Product]
+
+    assert await loader.load(products[0].id) is already_loaded
+    assert statements == []
+
+
+async def test_cancelled_caller_does_not_cancel_others(products, statements, session):
+    loader = Loaders(session=session, max_batch_size=100)[Product]
+    cancelled = asyncio.create_task(loader.load(products[0].id))
+    other = asyncio.create_task(loader.load(products[0].id))
+    await asyncio.sleep(0)  # оба встали на один future, выборка запланирована
+    cancelled.cancel()
+
+    product = await other
+
+    assert product.id == products[0].id
+    assert cancelled.cancelled()
+    assert len(statements) == 1
+
+
+async def test_failed_fetch_is_retried(products, statements, session, monkeypatch):
+    loader = Loaders(session=session, max_batch_size=100)[Product]
+    scalars = session.scalars
+
+    async def failing_scalars(*args, **kwargs):
+        monkeypatch.setattr(session, "scalars", scalars)  # упадет только первый раз
+        raise OperationalError("SELECT", {}, Exception("connection lost"))
+
+    monkeypatch.setattr(session, "scalars", failing_scalars)
+    results = await asyncio.gather(
+        loader.load(products[0].id),
+        loader.load(products[0].id),
+        return_exceptions=True,
+    )
+    # ошибка достается всем, кто ждал этот id, но в кеше лоадера не остается
+    assert all(isinstance(result, OperationalError) for result in results)
+    assert loader.cache == {}
+
+    product = await loader.load(products[0].id)
+
+    assert product.id == products[0].id
+    assert len(statements) == 1
+
+
+async def test_cancelled_fetch_releases_waiters(products, statements, session):
+    loader = Loaders(session=session, max_batch_size=100)[Product]
+    async with loader.lock:  # выборка встанет на lock и будет отменена там
+        waiter = asyncio.create_task(loader.load(products[0].id))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        (fetch,) = loader._tasks
+        fetch.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    # в кеше не осталось вечно висящего future, следующий load идет в бд
+    assert loader.cache == {}
+    product = await asyncio.wait_for(loader.load(products[0].id), timeout=1)
+    assert product.id == products[0].id
+    assert len(statements) == 1
+
+
+async def test_bulk_get_is_one_select(client, products, statements, monkeypatch):
+    monkeypatch.setattr(settings.bulk, "batch_size", 100)
+    ids = [products[2].id, 999_999, products[0].id, products[2].id]
+
+    response = await client.get("/api/v1/products/bulk", params={"ids": ids})
+
+    assert response.status_code == 200
+    assert [(item["id"], item["status"]) for item in response.json()] == [
+        (products[2].id, "found"),
+        (999_999, "not_found"),
+        (products[0].id, "found"),
+        (products[2].id, "found"),
+    ]
+    assert response.json()[0]["product"]["name"] == products[2].name
+    # четыре id, один из них повтор - один SELECT на всех
+    assert len(statements) == 1
+    assert statements[0].startswith("SELECT")
+
+
+async def test_bulk_get_is_batched_by_batch_size(
+    client, products, statements, monkeypatch
+):
+    monkeypatch.setattr(settings.bulk, "batch_size", 4)
+    ids = [product.id for product in products]
+
+    response = await client.get("/api/v1/products/bulk", params={"ids": ids})
+
+    assert [item["id"] for item in response.json()] == ids
+    assert len(statements) == 3  # 4 + 4 + 2
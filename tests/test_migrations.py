@@ -0,0 +1,201 @@
+# Хелперы миграций (core/migrations.py) через alembic MigrationContext/Operations:
+# backfill - на sqlite с настоящим соединением, SQL постгреса - в offline (--sql) режиме
+import importlib.util
+import io
+import logging
+import re
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from core import migrations
+from core.config import settings
+
+ROWS = 10
+
+
+@pytest.fixture
+def connection(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path}/migrations.db")
+    with engine.connect() as connection:
+        connection.execute(
+            sa.text("CREATE TABLE item (id INTEGER PRIMARY KEY, a INT, b INT)")
+        )
+        connection.execute(
+            sa.text("INSERT INTO item (id, a) VALUES (:id, :id)"),
+            [{"id": id} for id in range(1, ROWS + 1)],
+        )
+        connection.commit()
+        yield connection
+    engine.dispose()
+
+
+def run_online(connection, operation) -> None:
+    with Operations.context(MigrationContext.configure(connection)):
+        operation()
+    connection.commit()
+
+
+def run_offline(operation) -> str:
+    output = io.StringIO()
+    context = MigrationContext.configure(
+        dialect_name="postgresql", opts={"as_sql": True, "output_buffer": output}
+    )
+    with Operations.context(context):
+        operation()
+    return output.getvalue()
+
+
+def filled(connection) -> list[int | None]:
+    return list(connection.scalars(sa.text("SELECT b FROM item ORDER BY id")))
+
+
+def progress(connection) -> list[tuple[str, int]]:
+    return [
+        tuple(row)
+        for row in connection.execute(
+            sa.text(f"SELECT name, last_id FROM {migrations.PROGRESS_TABLE}")
+        )
+    ]
+
+
+def test_backfill_in_batches(connection, caplog):
+    with caplog.at_level(logging.INFO, logger="alembic.online"):
+        run_online(
+            connection,
+            lambda: migrations.backfill(
+                "item", "b = a * 2", where="a % 2 = 0", batch_size=3, pause=0
+            ),
+        )
+
+    assert filled(connection) == [None, 4, None, 8, None, 12, None, 16, None, 20]
+    # 10 строк по 3 - четыре куска, прогресс после успешного конца удален
+    assert sum("backfill item" in message for message in caplog.messages) == 4
+    assert progress(connection) == []
+
+
+def test_backfill_resumes_from_progress(connection, monkeypatch, caplog):
+    def interrupt(seconds):
+        raise KeyboardInterrupt
+
+    # миграцию прервали после первого куска
+    monkeypatch.setattr(migrations.time, "sleep", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        run_online(
+            connection,
+            lambda: migrations.backfill("item", "b = a", batch_size=4, pause=0),
+        )
+    name = migrations.backfill_name("item", "b = a")
+    assert progress(connection) == [(name, 4)]
+    assert filled(connection) == [1, 2, 3, 4] + [None] * 6
+
+    # руками правим уже заполненное: повторный запуск не должен его трогать
+    connection.execute(sa.text("UPDATE item SET b = 0 WHERE id <= 4"))
+    connection.commit()
+    monkeypatch.undo()
+    with caplog.at_level(logging.INFO, logger="alembic.online"):
+        run_online(
+            connection,
+            lambda: migrations.backfill("item", "b = a", batch_size=4, pause=0),
+        )
+
+    assert filled(connection) == [0, 0, 0, 0, 5, 6, 7, 8, 9, 10]
+    assert f"backfill {name}: resuming after id 4" in caplog.messages
+    assert progress(connection) == []
+
+
+def test_backfill_default_name_fits_progress_table(connection):
+    set_clause = "b = " + " + ".join(["a"] * 200)
+    name = migrations.backfill_name("item", set_clause)
+    assert len(name) == migrations.PROGRESS_NAME_LENGTH
+    assert name != migrations.backfill_name("item", set_clause + " + 1")
+    assert migrations.backfill_name("item", "b = a") == "item: b = a"
+
+    run_online(connection, lambda: migrations.backfill("item", set_clause, pause=0))
+    assert filled(connection) == [200 * id for id in range(1, ROWS + 1)]
+
+    with pytest.raises(ValueError, match="longer than 255"):
+        run_online(
+            connection,
+            lambda: migrations.backfill("item", "b = a", name="x" * 256, pause=0),
+        )
+
+
+def test_backfill_offline_is_single_update():
+    sql = run_offline(lambda: migrations.backfill("user", "b = a", where="a > 0"))
+    assert 'UPDATE "user" SET b = a WHERE true AND (a > 0)' in sql
+    assert migrations.PROGRESS_TABLE not in sql
+
+
+def test_lock_timeout_is_restored():
+    def operation():
+        with migrations.lock_timeout("0"):
+            migrations.op.execute("SELECT 1")
+
+    statements = [
+        line for line in run_offline(operation).splitlines() if line.strip(" ;")
+    ]
+    assert statements == [
+        "SET lock_timeout = '0';",
+        "SELECT 1;",
+        f"SET lock_timeout = '{settings.migrations.lock_timeout}';",
+    ]
+
+
+def test_lock_timeout_is_restored_after_error():
+    def operation():
+        with migrations.lock_timeout("0"):
+            raise RuntimeError("ALTER failed")
+
+    output = io.StringIO()
+    context = MigrationContext.configure(
+        dialect_name="postgresql", opts={"as_sql": True, "output_buffer": output}
+    )
+    with Operations.context(context), pytest.raises(RuntimeError):
+        operation()
+    assert output.getvalue().strip().splitlines()[-1] == (
+        f"SET lock_timeout = '{settings.migrations.lock_timeout}';"
+    )
+
+
+def test_create_index_concurrently_outside_transaction():
+    sql = run_offline(
+        lambda: migrations.create_index_concurrently("ix_item_a", "item", ["a"])
+    )
+    # COMMIT перед CREATE INDEX CONCURRENTLY: внутри транзакции постгрес его не выполнит,
+    # и ожидание старых транзакций не ограничено lock_timeout
+    create = sql.index("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_item_a ON item (a)")
+    assert sql.rindex("COMMIT", 0, create) < sql.rindex(
+        "SET lock_timeout = '0'", 0, create
+    )
+
+
+def test_create_index_on_sqlite_is_plain(connection):
+    run_online(
+        connection,
+        lambda: migrations.create_index_concurrently("ix_item_a", "item", ["a"]),
+    )
+    assert [index["name"] for index in sa.inspect(connection).get_indexes("item")] == [
+        "ix_item_a"
+    ]
+
+
+def test_versions_do_not_block_writes():
+    # все миграции серии разом в --sql режиме: ни одного обычного CREATE INDEX
+    # и ни одной STORED колонки, переписывающей таблицу
+    versions = Path(__file__).parent.parent / "alembic" / "versions"
+    sql = ""
+    for path in sorted(versions.glob("2026_*.py")):
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sql += run_offline(module.upgrade)
+
+    creates = re.findall(r"CREATE (?:UNIQUE )?INDEX[^;]*", sql)
+    assert len(creates) == 6
+    assert all("CONCURRENTLY" in create for create in creates)
+    assert "GENERATED" not in sql
+    assert "UPDATE product SET search_vector" in sql
@@ -0,0 +1,92 @@
+# Детектор N+1 (core/nplusone.py). В тестах он в режиме raise (conftest), поэтому любая
+# ручка с N+1 падает 500, а пачки по batch_size и selectinload ложных срабатываний давать не должны
+import logging
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from core.config import NPlusOneSettings, settings
+from core.loader import Loaders
+from core.models import Post, Product, User, db_helper
+from core.nplusone import NPlusOneError, detect_n_plus_one
+
+pytestmark = pytest.mark.anyio
+
+RAISE = NPlusOneSettings(mode="raise", repeated_select_threshold=3)
+
+
+@pytest.fixture
+async def users_with_posts(database):
+    async with db_helper.session_factory() as session:
+        users = [User(username=f"user{number}") for number in range(4)]
+        session.add_all(users)
+        await session.flush()
+        session.add_all(
+            Post(title=f"post {number}", user_id=user.id)
+            for user in users
+            for number in range(2)
+        )
+        await session.commit()
+    return users
+
+
+async def test_repeated_get_raises(products):
+    async with db_helper.session_factory() as session:
+        with pytest.raises(NPlusOneError, match="same SELECT executed 3 times"):
+            with detect_n_plus_one(RAISE):
+                for product in products:
+                    await session.get(Product, product.id)
+
+
+async def test_repeated_get_is_logged_once(products, caplog):
+    config = RAISE.model_copy(update={"mode": "log"})
+    async with db_helper.session_factory() as session:
+        with caplog.at_level(logging.WARNING, logger="core.nplusone"):
+            with detect_n_plus_one(config) as queries:
+                for product in products:
+                    await session.get(Product, product.id)
+
+    assert queries.total == len(products)
+    assert len(caplog.records) == 1
+
+
+async def test_lazy_relationship_load_raises(users_with_posts):
+    def titles(session):
+        # обращение к user.post без selectinload - ленивый SELECT на каждого пользователя
+        return [
+            post.title for user in session.scalars(select(User)) for post in user.post
+        ]
+
+    async with db_helper.session_factory() as session:
+        with pytest.raises(NPlusOneError, match="lazy load of User.post"):
+            with detect_n_plus_one(RAISE):
+                await session.run_sync(titles)
+
+
+async def test_selectinload_is_not_flagged(users_with_posts):
+    async with db_helper.session_factory() as session:
+        with detect_n_plus_one(RAISE) as queries:
+            users = await session.scalars(select(User).options(selectinload(User.post)))
+            assert sum(len(user.post) for user in users) == 8
+    assert queries.total == 2
+
+
+async def test_bulk_batches_are_not_flagged(client, products, monkeypatch):
+    # пачки по 2: одинаковые запросы по каждой пачке id - это не N+1
+    monkeypatch.setattr(settings.bulk, "batch_size", 2)
+    response = await client.patch(
+        "/api/v1/products/bulk",
+        json=[{"id": product.id, "price": 100} for product in products],
+    )
+    assert response.status_code == 200
+    assert {item["status"] for item in response.json()} == {"updated"}
+
+
+async def test_loader_chunks_are_not_flagged(products):
+    async with db_helper.session_factory() as session:
+        with detect_n_plus_one(RAISE) as queries:
+            loader = Loaders(session=session, max_batch_size=2)[Product]
+            loaded = await loader.load_many(product.id for product in products)
+    assert len(loaded) == len(products)
+    assert queries.total == 5
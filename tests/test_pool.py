@@ -0,0 +1,61 @@
+# Метрики пула (core/models/pool.py): ожидание свободного соединения в очереди и открытие
+# нового соединения считаются отдельно, медленный connect не выглядит как нехватка пула
+import time
+
+import pytest
+from sqlalchemy import event, exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from core.models import db_helper
+from core.models.pool import MeasuredQueuePool
+
+pytestmark = pytest.mark.anyio
+
+CONNECT_DELAY = 0.05
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path}/pool.db",
+        poolclass=MeasuredQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=CONNECT_DELAY,
+    )
+
+    def slow_connect(dbapi_connection, connection_record):
+        time.sleep(CONNECT_DELAY)
+
+    event.listen(engine.sync_engine, "connect", slow_connect)
+    yield engine
+    await engine.dispose()
+
+
+async def test_connect_time_is_not_wait_time(engine):
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+        # единственное соединение занято: второй checkout ждет pool_timeout и падает
+        with pytest.raises(exc.TimeoutError):
+            await engine.connect()
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+    metrics = db_helper.pool_status(engine)
+    assert metrics["connects"] == 1
+    assert metrics["connect_seconds_total"] >= CONNECT_DELAY
+    assert metrics["checkouts"] == 3
+    assert metrics["timeouts"] == 1
+    # ждали только в checkout, который упал по таймауту, открытие соединения сюда не попало
+    assert CONNECT_DELAY <= metrics["wait_seconds_max"] < 2 * CONNECT_DELAY
+    assert metrics["wait_seconds_total"] < 2 * CONNECT_DELAY
+
+
+async def test_metrics_survive_dispose(engine):
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+    await engine.dispose()
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+    assert db_helper.pool_status(engine)["connects"] == 2
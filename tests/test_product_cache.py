@@ -0,0 +1,163 @@
+# Кеш продуктов (api_v1/products/cache.py): read-through на GET /products/{id},
+# инвалидация на записях и защита заполнения поколением от записи, которая его обогнала
+import pytest
+
+from api_v1.products import crud
+from api_v1.products.cache import CachedProduct, ProductCache, product_cache
+from core.cache import MemoryCache, RedisCache
+from core.config import settings
+from core.models import db_helper
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=[False, True], ids=["orm", "fast_json"])
+def fast_json(request, monkeypatch):
+    monkeypatch.setattr(settings.pagination, "fast_json", request.param)
+    return request.param
+
+
+async def cache_stats(client) -> dict[str, int]:
+    # счетчики кеша отдаются только в /internal/metrics (клиент тестов - loopback)
+    metrics = (await client.get("/internal/metrics")).text
+    prefix, suffix = "products_cache_", "_total"
+    return {
+        name.removeprefix(prefix).removesuffix(suffix): int(value)
+        for name, value in (
+            line.split() for line in metrics.splitlines() if line.startswith(prefix)
+        )
+    }
+
+
+async def test_read_through_counts_hits_and_misses(client, products, fast_json):
+    url = f"/api/v1/products/{products[0].id}"
+    before = await cache_stats(client)
+
+    first = await client.get(url)
+    second = await client.get(url)
+
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content
+    assert first.headers["etag"] == second.headers["etag"]
+    assert await product_cache.get_product(products[0].id) is not None
+    after = await cache_stats(client)
+    # + get_product выше
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 2
+
+
+async def test_missing_product_is_not_cached(client, products, fast_json):
+    assert (await client.get("/api/v1/products/999999")).status_code == 404
+    assert await product_cache.get_product(999_999) is None
+
+
+@pytest.mark.parametrize(
+    "method, body, expected",
+    [
+        ("put", {"name": "new", "description": "new", "price": 7}, 200),
+        ("patch", {"price": 7}, 200),
+        ("delete", None, 404),
+    ],
+)
+async def test_writes_invalidate_product(
+    client, products, fast_json, method, body, expected
+):
+    url = f"/api/v1/products/{products[0].id}"
+    cached = await client.get(url)
+
+    kwargs = {"json": body} if body is not None else {}
+    assert (await client.request(method, url, **kwargs)).status_code < 300
+
+    response = await client.get(url)
+    assert response.status_code == expected
+    if expected == 200:
+        assert response.json()["price"] == 7
+        assert response.headers["etag"] != cached.headers["etag"]
+
+
+async def test_fill_after_concurrent_delete_is_dropped(
+    client, products, fast_json, monkeypatch
+):
+    # DELETE проходит целиком между SELECT промаха и записью в кеш
+    product_id = products[0].id
+    release_connection = db_helper.release_connection
+
+    async def delete_after_select(session):
+        await release_connection(session)
+        monkeypatch.setattr(db_helper, "release_connection", release_connection)
+        async with db_helper.session_factory() as other:
+            assert await crud.delete_product(session=other, product_id=product_id)
+
+    monkeypatch.setattr(db_helper, "release_connection", delete_after_select)
+    stale_fills = product_cache.stale_fills
+
+    # этот ответ прочитан до удаления, но в кеш он попасть не должен
+    assert (await client.get(f"/api/v1/products/{product_id}")).status_code == 200
+    assert product_cache.stale_fills == stale_fills + 1
+    assert (await client.get(f"/api/v1/products/{product_id}")).status_code == 404
+
+
+class FakeRedis:
+    # то подмножество redis.asyncio.Redis, которое использует RedisCache
+    def __init__(self):
+        self.data: dict[str, bytes] = {}
+        self.ttls: dict[str, int] = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.ttls[key] = ex
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, b"0")) + 1).encode()
+        return int(self.data[key])
+
+
+@pytest.mark.parametrize("backend", ["memory", "redis"])
+async def test_product_cache_backends(products, backend):
+    client = FakeRedis()
+    cache = ProductCache(
+        backend=RedisCache(client) if backend == "redis" else MemoryCache(100),
+        ttl=30,
+    )
+    product = products[0]
+
+    generation = await cache.product_generation(product.id)
+    entry = await cache.set_product(product, generation)
+    assert await cache.get_product(product.id) == entry
+    assert isinstance(entry, CachedProduct) and entry.version == product.version
+    if backend == "redis":
+        assert client.ttls[cache.product_key(product.id)] == 30
+
+    # поколение сменилось после чтения - запись пропускается
+    await cache.invalidate_products(product.id)
+    assert await cache.get_product(product.id) is None
+    await cache.set_product(product, generation)
+    assert await cache.get_product(product.id) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "stale_fills": 1}
+
+    pages_generation = await cache.pages_generation()
+    await cache.invalidate_pages()
+    assert await cache.pages_generation() != pages_generation
+
+
+async def test_page_keys_do_not_collide():
+    # склейка name=value без экранирования давала этим двум наборам один ключ
+    first = await product_cache.page_key(name_prefix="a&q=b", q=None)
+    second = await product_cache.page_key(name_prefix="a", q="b&q=None")
+    assert first != second
+    assert await product_cache.page_key(q=None) != await product_cache.page_key(
+        q="None"
+    )
+
+
+async def test_cache_stats_are_not_public(client, database):
+    response = await client.get("/api/v1/products/cache/stats")
+    # те же счетчики есть в /internal/metrics, который закрыт internal_access
+    assert response.status_code == 404
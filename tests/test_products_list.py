@@ -0,0 +1,241 @@
+# Список продуктов: фильтры, сортировки и keyset курсор (api_v1/products crud.products_statement).
+# На sqlite q ищется через LIKE, полнотекстовый поиск есть только на постгресе
+import json
+
+import pytest
+
+from api_v1.products.pagination import Cursor, encode_cursor
+from core.models import Product, db_helper
+
+pytestmark = pytest.mark.anyio
+
+# имя, описание, цена; у части цены совпадают - порядок внутри них решает id
+CATALOG = [
+    ("Red chair", "wooden", 30),
+    ("Blue chair", "plastic", 10),
+    ("Red lamp", "50% off", 20),
+    ("Green lamp", "warm_light", 30),
+    ("Red table", "oak", 50),
+    ("Sofa", "red velvet", 10),
+    ("100% cotton", "towel", 20),
+]
+
+
+@pytest.fixture
+async def catalog(database) -> dict[str, int]:
+    async with db_helper.session_factory() as session:
+        products = [
+            Product(name=name, description=description, price=price)
+            for name, description, price in CATALOG
+        ]
+        session.add_all(products)
+        await session.commit()
+    return {product.name: product.id for product in products}
+
+
+async def names(client, **params) -> list[str]:
+    response = await client.get("/api/v1/products", params=params)
+    assert response.status_code == 200
+    return [item["name"] for item in response.json()["items"]]
+
+
+@pytest.mark.parametrize(
+    "params, expected",
+    [
+        (
+            {"min_price": 20},
+            ["Red chair", "Red lamp", "Green lamp", "Red table", "100% cotton"],
+        ),
+        ({"max_price": 10}, ["Blue chair", "Sofa"]),
+        (
+            {"min_price": 20, "max_price": 30, "name_prefix": "Red"},
+            ["Red chair", "Red lamp"],
+        ),
+        ({"q": "red"}, ["Red chair", "Red lamp", "Red table", "Sofa"]),
+        ({"q": "red", "max_price": 20}, ["Red lamp", "Sofa"]),
+        ({"q": "lamp", "name_prefix": "Green"}, ["Green lamp"]),
+        ({"name_prefix": "100%"}, ["100% cotton"]),
+        ({"min_price": 60}, []),
+    ],
+)
+async def test_filters(client, catalog, params, expected):
+    assert await names(client, **params) == expected
+
+
+@pytest.mark.parametrize(
+    "q, expected",
+    [
+        # % и _ из запроса - обычные символы, а не шаблон LIKE
+        ("%", ["Red lamp", "100% cotton"]),
+        ("0%", ["Red lamp", "100% cotton"]),
+        ("_", ["Green lamp"]),
+        ("d_c", []),  # без экранирования нашлось бы "Red chair"
+    ],
+)
+async def test_q_escapes_like_wildcards(client, catalog, q, expected):
+    assert await names(client, q=q) == expected
+
+
+@pytest.mark.parametrize(
+    "sort, expected",
+    [
+        ("id", [name for name, _, _ in CATALOG]),
+        ("-id", [name for name, _, _ in reversed(CATALOG)]),
+        (
+            "price",
+            [
+                "Blue chair",
+                "Sofa",
+                "Red lamp",
+                "100% cotton",
+                "Red chair",
+                "Green lamp",
+                "Red table",
+            ],
+        ),
+        (
+            "-price",
+            [
+                "Red table",
+                "Green lamp",
+                "Red chair",
+                "100% cotton",
+                "Red lamp",
+                "Sofa",
+                "Blue chair",
+            ],
+        ),
+    ],
+)
+async def test_sort_and_cursor_pages(client, catalog, sort, expected):
+    assert await names(client, sort=sort) == expected
+
+    # по 2 на страницу: страницы стыкуются без пропусков и повторов, в том числе на равных ценах
+    walked, cursor, pages = [], None, 0
+    while True:
+        params = {"sort": sort, "limit": 2} | ({"cursor": cursor} if cursor else {})
+        page = (await client.get("/api/v1/products", params=params)).json()
+        walked += [item["name"] for item in page["items"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert walked == expected
+    assert pages == 4
+
+
+async def test_cursor_keeps_filters_between_pages(client, catalog):
+    first = (
+        await client.get(
+            "/api/v1/products", params={"q": "red", "sort": "-price", "limit": 2}
+        )
+    ).json()
+    second = (
+        await client.get(
+            "/api/v1/products",
+            params={"q": "red", "sort": "-price", "cursor": first["next_cursor"]},
+        )
+    ).json()
+    assert [item["name"] for item in first["items"]] == ["Red table", "Red chair"]
+    assert [item["name"] for item in second["items"]] == ["Red lamp", "Sofa"]
+    assert second["next_cursor"] is None
+
+
+async def test_cursor_for_another_sort_is_rejected(client, catalog):
+    page = (
+        await client.get("/api/v1/products", params={"sort": "price", "limit": 2})
+    ).json()
+
+    response = await client.get(
+        "/api/v1/products", params={"sort": "-price", "cursor": page["next_cursor"]}
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor was issued for sort=price"
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"cursor": "not a cursor"},
+        {"after_id": 1, "sort": "price"},
+        {"sort": "name"},
+    ],
+)
+async def test_bad_paging_params(client, catalog, params):
+    response = await client.get("/api/v1/products", params=params)
+    assert response.status_code in (400, 422)
+
+
+@pytest.mark.parametrize(
+    "sort, value",
+    [
+        ("price", "cheap"),
+        ("-price", "10"),
+        ("price", None),
+        ("-id", 5),
+        ("id", "x"),
+        ("price", 10**30),
+        ("price", 2**31),
+    ],
+)
+async def test_cursor_value_must_fit_sort(client, catalog, sort, value):
+    cursor = encode_cursor(Cursor(id=1, value=value, sort=sort))
+    response = await client.get(
+        "/api/v1/products", params={"sort": sort, "cursor": cursor}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == f"Invalid cursor {cursor!r}"
+
+
+async def test_cursor_id_out_of_column_range_is_rejected(client, catalog):
+    cursor = encode_cursor(Cursor(id=10**30))
+    response = await client.get("/api/v1/products", params={"cursor": cursor})
+    assert response.status_code == 400
+    response = await client.get("/api/v1/products", params={"after_id": 10**23})
+    assert response.status_code == 422
+
+
+async def test_stream_returns_filtered_catalogue(client, catalog):
+    response = await client.get(
+        "/api/v1/products", params={"stream": "true", "sort": "-price", "q": "red"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    # фильтры и сортировка те же, что у страниц
+    assert [line["name"] for line in lines] == [
+        "Red table",
+        "Red chair",
+        "Red lamp",
+        "Sofa",
+    ]
+
+
+@pytest.mark.parametrize(
+    "params", [{"limit": 2}, {"after_id": 1}, {"cursor": encode_cursor(Cursor(id=1))}]
+)
+async def test_stream_rejects_paging_params(client, catalog, params):
+    response = await client.get("/api/v1/products", params={"stream": "true", **params})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"min_price": 10**23},
+        {"max_price": 10**23},
+        {"min_price": 1_000_001},
+        {"max_price": -1},
+    ],
+)
+async def test_price_filter_out_of_range_is_422(client, catalog, params):
+    response = await client.get("/api/v1/products", params=params)
+    assert response.status_code == 422
+
+
+async def test_price_out_of_range_is_422(client, catalog):
+    response = await client.post(
+        "/api/v1/products", json={"name": "a", "description": "b", "price": 10**30}
+    )
+    assert response.status_code == 422
@@ -0,0 +1,85 @@
+import pytest
+from sqlalchemy import update
+
+from core.config import DbReplicaSettings
+from core.models import Base, Product, db_helper
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def replica(database, monkeypatch, tmp_path):
+    # вторая sqlite как реплика. Записи в нее не доходят - это реплика с бесконечным отставанием
+    monkeypatch.setattr(
+        db_helper,
+        "replica_settings",
+        DbReplicaSettings(urls=[f"sqlite+aiosqlite:///{tmp_path}/replica.db"]),
+    )
+    db_helper.__dict__.pop("replica_engines", None)
+    engine = db_helper.replica_engines[0]
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+    db_helper.__dict__.pop("replica_engines", None)
+
+
+async def add_product(engine, name: str) -> None:
+    async with db_helper.session_factory(bind=engine) as session:
+        session.add(Product(id=1, name=name, description="test", price=100))
+        await session.commit()
+
+
+async def test_reads_are_routed_to_replica(client, replica):
+    await add_product(db_helper.engine, "primary")
+    await add_product(replica, "replica")
+
+    assert await db_helper.get_read_engine() is replica
+    response = await client.get("/api/v1/products/export")
+    assert response.json()["name"] == "replica"
+
+
+async def test_cached_reads_come_from_primary(client, replica):
+    await add_product(db_helper.engine, "primary")
+    await add_product(replica, "replica")
+
+    response = await client.get("/api/v1/products/1")
+    assert response.json()["name"] == "primary"
+    response = await client.get("/api/v1/products")
+    assert [item["name"] for item in response.json()["items"]] == ["primary"]
+
+
+async def test_read_after_write_while_replica_lags(client, replica):
+    await add_product(db_helper.engine, "old")
+    await add_product(replica, "old")
+    assert (await client.get("/api/v1/products/1")).json()["price"] == 100
+    assert (await client.get("/api/v1/products")).status_code == 200
+
+    response = await client.patch("/api/v1/products/1", json={"price": 200})
+    assert response.status_code == 200
+    # запись инвалидировала кеш, заново он заполняется с основной, а не со старой реплики
+    assert (await client.get("/api/v1/products/1")).json()["price"] == 200
+    page = (await client.get("/api/v1/products")).json()
+    assert [item["price"] for item in page["items"]] == [200]
+
+    assert (await client.delete("/api/v1/products/1")).status_code == 204
+    assert (await client.get("/api/v1/products/1")).status_code == 404
+    assert (await client.get("/api/v1/products")).json()["items"] == []
+
+
+async def test_lagging_replica_falls_back_to_primary(client, replica, monkeypatch):
+    await add_product(db_helper.engine, "primary")
+    await add_product(replica, "replica")
+    monkeypatch.setattr(db_helper.replica_settings, "max_lag", 1.0)
+    lag = {replica: 10.0}
+
+    async def get_replica_lag(engine):
+        return lag[engine]
+
+    monkeypatch.setattr(db_helper, "get_replica_lag", get_replica_lag)
+    assert await db_helper.get_read_engine() is db_helper.engine
+    response = await client.get("/api/v1/products/export")
+    assert response.json()["name"] == "primary"
+
+    lag[replica] = 0.5
+    assert await db_helper.get_read_engine() is replica
@@ -0,0 +1,149 @@
+# Кеш готовых ответов (core/response_cache.py): попадание отдает middleware до роутинга,
+# смена version сбрасывает запись, хранилище ограничено по байтам, промахи по одному ключу
+# считаются один раз. Клиентам версионные ответы отдаются с no-cache
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+
+from core.response_cache import (
+    CachedResponse,
+    ResponseCacheMiddleware,
+    ResponseStore,
+    cache_response,
+    response_cache,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def calls():
+    return {"handler": 0, "dependency": 0, "version": 0}
+
+
+@pytest.fixture
+async def cached_client(calls):
+    response_cache.store = ResponseStore(max_bytes=1024 * 1024)
+    app = FastAPI()
+    app.add_middleware(ResponseCacheMiddleware)
+
+    def dependency():
+        calls["dependency"] += 1
+
+    async def version():
+        return calls["version"]
+
+    @app.get("/versioned", dependencies=[Depends(dependency)])
+    @cache_response(ttl=60, version=version)
+    async def versioned():
+        calls["handler"] += 1
+        # пока считается, остальные промахи успевают встать в очередь
+        await asyncio.sleep(0.01)
+        return {"handler_calls": calls["handler"]}
+
+    @app.get("/static")
+    @cache_response(ttl=60, client_max_age=30)
+    async def static():
+        return {"static": True}
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        yield client
+
+
+async def test_hit_is_served_before_routing(cached_client, calls):
+    hits = response_cache.hits
+    first = await cached_client.get("/versioned?b=1&a=2")
+    second = await cached_client.get("/versioned?a=2&b=1")
+
+    assert first.json() == second.json() == {"handler_calls": 1}
+    # ни обработчик, ни его зависимости на попадании не вызываются
+    assert calls == {"handler": 1, "dependency": 1, "version": 0}
+    assert response_cache.hits == hits + 1
+    assert second.headers["etag"] == first.headers["etag"]
+
+
+async def test_version_change_invalidates(cached_client, calls):
+    assert (await cached_client.get("/versioned")).json() == {"handler_calls": 1}
+    calls["version"] += 1  # например запись сдвинула поколение страниц
+    assert (await cached_client.get("/versioned")).json() == {"handler_calls": 2}
+    assert (await cached_client.get("/versioned")).json() == {"handler_calls": 2}
+
+
+async def test_concurrent_misses_run_handler_once(cached_client, calls):
+    coalesced = response_cache.coalesced
+    responses = await asyncio.gather(
+        *(cached_client.get("/versioned") for _ in range(10))
+    )
+
+    assert {response.json()["handler_calls"] for response in responses} == {1}
+    assert calls["handler"] == 1
+    assert response_cache.coalesced == coalesced + 9
+
+
+async def test_client_cache_control(cached_client):
+    versioned = await cached_client.get("/versioned")
+    assert versioned.headers["cache-control"] == "no-cache"
+    revalidated = await cached_client.get(
+        "/versioned", headers={"If-None-Match": versioned.headers["etag"]}
+    )
+    assert revalidated.status_code == 304
+    assert revalidated.headers["cache-control"] == "no-cache"
+
+    await cached_client.get("/static")
+    static = await cached_client.get("/static")
+    assert static.headers["cache-control"] == "max-age=30"
+
+
+async def test_products_list_is_revalidated_by_clients(client, products):
+    first = await client.get("/api/v1/products")
+    assert first.headers["cache-control"] == "no-cache"
+
+    await client.patch(f"/api/v1/products/{products[0].id}", json={"price": 999})
+    second = await client.get(
+        "/api/v1/products", headers={"If-None-Match": first.headers["etag"]}
+    )
+    assert second.status_code == 200
+    assert second.json()["items"][0]["price"] == 999
+
+
+def entry(body: bytes) -> CachedResponse:
+    return CachedResponse(
+        body=body,
+        headers={},
+        etag='"x"',
+        last_modified=None,
+        ttl=60,
+        stored_at=time.monotonic(),
+        version=None,
+        version_value=None,
+        client_max_age=0,
+    )
+
+
+def test_store_evicts_least_recently_used_by_bytes():
+    store = ResponseStore(max_bytes=250)
+    store.set("a", entry(b"a" * 100))
+    store.set("b", entry(b"b" * 100))
+    assert store.get("a") is not None  # теперь a свежее b
+
+    store.set("c", entry(b"c" * 100))
+
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+    assert store.size == 200
+    assert store.evictions == 1
+
+    store.set("a", entry(b"a" * 10))  # перезапись не считает старый размер дважды
+    assert store.size == 110
+
+
+def test_expired_entry_is_dropped():
+    store = ResponseStore(max_bytes=1000)
+    store.set("a", entry(b"a")._replace(stored_at=time.monotonic() - 61))
+    assert store.get("a") is None
+    assert store.size == 0
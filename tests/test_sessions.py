@@ -0,0 +1,92 @@
+# Сессии из зависимостей должны закрываться и отдавать соединение в пул сразу после ответа,
+# без помощи сборщика мусора - поэтому он на время тестов выключен
+import gc
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models import Product, db_helper
+
+pytestmark = pytest.mark.anyio
+
+DEPENDENCIES = [
+    "scoped_session_dependency",
+    "session_dependency",
+    "read_session_dependency",
+    "primary_read_session_dependency",
+]
+
+
+@pytest.fixture(autouse=True)
+def no_gc():
+    gc.disable()
+    yield
+    gc.enable()
+
+
+@pytest.fixture(params=[False, True], ids=["transaction", "autocommit_reads"])
+def autocommit_reads(request, monkeypatch):
+    monkeypatch.setattr(db_helper, "autocommit_reads", request.param)
+    return request.param
+
+
+def assert_released(sessions: list[AsyncSession] = ()) -> None:
+    assert db_helper.engine.pool.checkedout() == 0
+    for session in sessions:
+        registry = getattr(session, "registry", None)  # только у async_scoped_session
+        if registry is not None:
+            assert not registry.registry, "session is still in the scoped registry"
+
+
+@pytest.mark.parametrize("dependency", DEPENDENCIES)
+@pytest.mark.parametrize("outcome", ["ok", "not_found", "error"])
+async def test_dependency_releases_connection(
+    database, autocommit_reads, products, dependency, outcome
+):
+    sessions = []
+    app = FastAPI()
+
+    @app.get("/")
+    async def handler(
+        session: AsyncSession = Depends(getattr(db_helper, dependency)),
+    ) -> int:
+        sessions.append(session)
+        product_id = await session.scalar(select(Product.id).limit(1))
+        if outcome == "not_found":
+            raise HTTPException(status_code=404)
+        if outcome == "error":
+            raise RuntimeError("handler failed")
+        return product_id
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/")
+    assert response.status_code == {"ok": 200, "not_found": 404, "error": 500}[outcome]
+    assert_released(sessions)
+
+
+async def test_product_routes_release_connections(client, autocommit_reads, products):
+    product_id = products[0].id
+    for _ in range(3):
+        assert (await client.get("/api/v1/products")).status_code == 200
+        assert_released()
+        assert (await client.get(f"/api/v1/products/{product_id}")).status_code == 200
+        assert_released()
+        assert (await client.get("/api/v1/products/999999")).status_code == 404
+        assert_released()
+        # заведомо старая версия - 412 после неудачного UPDATE
+        response = await client.patch(
+            f"/api/v1/products/{product_id}",
+            json={"price": 5},
+            headers={"If-Match": '"0"'},
+        )
+        assert response.status_code == 412
+        assert_released()
+        response = await client.patch(
+            "/api/v1/products/999999", json={"price": 5}, headers={"If-Match": '"1"'}
+        )
+        assert response.status_code == 404
+        assert_released()
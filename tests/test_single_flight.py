@@ -0,0 +1,63 @@
+# Одновременные GET одного продукта делают один SELECT: первый идет в бд, остальные
+# ждут его результат (core/single_flight.py). SQL считаем фикстурой statements
+import asyncio
+
+import pytest
+
+from core.config import SingleFlightSettings, settings
+from core.single_flight import SingleFlight, single_flight
+
+pytestmark = pytest.mark.anyio
+
+CONCURRENT = 20
+
+
+@pytest.mark.parametrize("fast_json", [False, True], ids=["orm", "fast_json"])
+async def test_concurrent_gets_make_one_select(
+    client, products, statements, monkeypatch, fast_json
+):
+    monkeypatch.setattr(settings.pagination, "fast_json", fast_json)
+    product = products[0]
+    coalesced = single_flight.coalesced
+
+    responses = await asyncio.gather(
+        *(client.get(f"/api/v1/products/{product.id}") for _ in range(CONCURRENT))
+    )
+
+    assert [response.status_code for response in responses] == [200] * CONCURRENT
+    assert {response.json()["name"] for response in responses} == {product.name}
+    assert len(statements) == 1, statements
+    assert single_flight.coalesced - coalesced == CONCURRENT - 1
+
+
+async def test_cancelled_leader_makes_waiters_retry():
+    flight = SingleFlight(config=SingleFlightSettings())
+    leader_started = asyncio.Event()
+    calls = []
+
+    async def leader_call():
+        calls.append("leader")
+        leader_started.set()
+        await asyncio.Event().wait()  # висит, пока задачу не отменят
+
+    async def waiter_call():
+        calls.append("waiter")
+        await asyncio.sleep(0.01)  # запрос в бд, остальные успевают встать в очередь
+        return "fresh"
+
+    leader = asyncio.create_task(flight.do("key", leader_call))
+    await leader_started.wait()
+    waiters = [asyncio.create_task(flight.do("key", waiter_call)) for _ in range(3)]
+    await asyncio.sleep(0)  # ждущие встали на future первого
+    assert flight.coalesced == 3
+
+    leader.cancel()
+    results = await asyncio.gather(*waiters)
+
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    # отмена не достается ждущим: один из них сам идет в бд, остальные ждут уже его
+    assert results == ["fresh"] * 3
+    assert calls == ["leader", "waiter"]
+    assert flight.leaders == 2
+    assert not flight._calls
@@ -0,0 +1,97 @@
+# sync обработчики и зависимости FastAPI отправляет в пул потоков. Цену перехода меряет
+# probe_threadpool настоящими переходами через лимитер anyio, сам FastAPI не подменяется
+import logging
+
+import fastapi.dependencies.utils
+import fastapi.routing
+import pytest
+import starlette.concurrency
+from fastapi import Depends, FastAPI
+
+from core.config import settings
+from core.threadpool import (
+    PROBE_ROUTE,
+    audit_sync_routes,
+    inline,
+    probe_threadpool,
+    threadpool_metrics,
+)
+from main import app as main_app, lifespan
+
+pytestmark = pytest.mark.anyio
+
+
+def sync_dependency() -> int:
+    return 1
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/sync/{value}")
+    def sync_handler(value: int, one: int = Depends(sync_dependency)):
+        return {"value": value + one}
+
+    @app.get("/inline")
+    @inline
+    def inline_handler():
+        return {"value": 0}
+
+    return app
+
+
+async def test_probe_measures_real_hops():
+    before = threadpool_metrics.overheads[PROBE_ROUTE].count
+    probe = await probe_threadpool(5)
+
+    assert probe["hops"] == 5
+    assert probe["overhead_us"] > 0
+    assert probe["wait_us"] <= probe["overhead_us"]
+    assert threadpool_metrics.overheads[PROBE_ROUTE].count == before + 5
+    assert threadpool_metrics.waits[PROBE_ROUTE].count == before + 5
+
+
+def test_audit_prices_each_sync_call():
+    probe = {"hops": 10, "overhead_us": 30.0, "wait_us": 2.5}
+    # @inline роут в пул не ходит и в отчет не попадает
+    [item] = audit_sync_routes(make_app(), probe)
+    assert item["route"] == "GET /sync/{value}"
+    assert sorted(item["functions"]) == [
+        "make_app.<locals>.sync_handler",
+        "sync_dependency",
+    ]
+    # обработчик и зависимость - два перехода на запрос
+    assert (item["hops"], item["overhead_us"], item["wait_us"]) == (2, 60.0, 5.0)
+
+
+async def test_lifespan_logs_measured_cost(database, caplog, monkeypatch):
+    monkeypatch.setattr(settings.threadpool, "audit", True)
+    app = make_app()
+    with caplog.at_level(logging.WARNING, logger="core.threadpool"):
+        async with lifespan(app):
+            pass
+
+    [message] = [m for m in caplog.messages if m.startswith("sync calls")]
+    assert "GET /sync/{value}" in message
+    assert f"over {settings.threadpool.probe_hops} probes" in message
+    assert "not measured" not in message
+    # FastAPI по-прежнему со своим run_in_threadpool, между приложениями ничего не утекает
+    assert fastapi.routing.run_in_threadpool is starlette.concurrency.run_in_threadpool
+    assert (
+        fastapi.dependencies.utils.run_in_threadpool
+        is starlette.concurrency.run_in_threadpool
+    )
+
+
+async def test_metrics_and_audit_endpoint(database, client):
+    await client.get("/items/latest")
+    response = await client.get("/internal/threadpool")
+    report = response.json()
+    # все sync обработчики приложения помечены @inline, в пул ничего не уходит
+    assert report["routes"] == []
+    assert report["probe"]["hops"] == settings.threadpool.probe_hops
+    assert report["routes"] == audit_sync_routes(main_app, report["probe"])
+
+    metrics = (await client.get("/internal/metrics")).text
+    assert "# TYPE threadpool_queue_wait_seconds histogram" in metrics
+    assert f'threadpool_overhead_seconds_count{{route="{PROBE_ROUTE}"}}' in metrics
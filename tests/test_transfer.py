@@ -0,0 +1,150 @@
+# Импорт и экспорт каталога (api_v1/products/transfer.py): тело запроса читается кусками,
+# ошибки копятся по строкам, экспорт идет пачками через серверный курсор
+import csv
+import io
+import json
+
+import pytest
+from sqlalchemy import select
+
+from api_v1.products import transfer
+from core.models import Product, db_helper
+
+pytestmark = pytest.mark.anyio
+
+CSV = (
+    "name,description,price\r\n"
+    'TV 55" screen,big,10\r\n'
+    '"Lamp","warm\r\nlight, two lines",20\r\n'
+    "Broken,no price,abc\r\n"
+    "Short,row\r\n"
+    '"Chair","say ""hi""",30\r\n'
+)
+
+
+async def in_chunks(data: bytes, size: int):
+    # куски режут строки и utf-8 символы где попало
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+async def saved_products() -> list[tuple[str, str, int]]:
+    async with db_helper.session_factory() as session:
+        result = await session.execute(
+            select(Product.name, Product.description, Product.price).order_by(
+                Product.id
+            )
+        )
+        return [tuple(row) for row in result]
+
+
+@pytest.mark.parametrize("chunk_size", [3, 1 << 16])
+async def test_import_csv(client, chunk_size):
+    response = await client.post(
+        "/api/v1/products/import",
+        content=in_chunks(CSV.encode(), chunk_size),
+        headers={"content-type": "text/csv; charset=utf-8"},
+    )
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 3
+    assert report["failed"] == 2
+    # номер строки файла, где начинается запись; заголовок - строка 1
+    assert [error["line"] for error in report["errors"]] == [5, 6]
+    assert report["errors"][0]["errors"][0]["loc"] == ["price"]
+    assert report["errors"][1]["errors"] == [{"msg": "Expected 3 columns, got 2"}]
+    assert await saved_products() == [
+        ('TV 55" screen', "big", 10),
+        ("Lamp", "warm\nlight, two lines", 20),
+        ("Chair", 'say "hi"', 30),
+    ]
+
+
+async def test_import_csv_unterminated_quote(client):
+    body = 'name,description,price\nok,first,1\n"Bad,never closed,2\nlast,row,3\n'
+
+    report = (
+        await client.post("/api/v1/products/import?format=csv", content=body.encode())
+    ).json()
+
+    # кавычка так и не закрылась: ошибка на строке, где начиналась запись
+    assert report["imported"] == 1
+    assert report["errors"] == [
+        {"line": 3, "errors": [{"msg": "Unterminated quoted field"}]}
+    ]
+    assert await saved_products() == [("ok", "first", 1)]
+
+
+async def test_import_ndjson(client):
+    lines = [
+        json.dumps({"name": "Кофе", "description": "зерно", "price": 5}),
+        "",
+        "{not json",
+        "[1, 2]",
+        json.dumps({"name": "No price", "description": "x"}),
+        json.dumps({"name": "Tea", "description": "leaf", "price": 7, "id": 99}),
+    ]
+
+    response = await client.post(
+        "/api/v1/products/import",
+        content=in_chunks("\n".join(lines).encode(), 5),
+        headers={"content-type": "application/x-ndjson"},
+    )
+
+    report = response.json()
+    assert report["imported"] == 2
+    assert [error["line"] for error in report["errors"]] == [3, 4, 5]
+    assert report["errors"][0]["errors"][0]["msg"].startswith("Invalid JSON")
+    assert report["errors"][1]["errors"] == [{"msg": "Expected a JSON object"}]
+    assert report["errors"][2]["errors"][0]["type"] == "missing"
+    assert await saved_products() == [("Кофе", "зерно", 5), ("Tea", "leaf", 7)]
+
+
+async def test_import_requires_known_format(client):
+    response = await client.post(
+        "/api/v1/products/import",
+        content=b"x",
+        headers={"content-type": "application/octet-stream"},
+    )
+    assert response.status_code == 415
+
+
+async def test_export_streams_in_chunks(products):
+    async with db_helper.session_factory() as session:
+        chunks = [
+            chunk
+            async for chunk in transfer.export_products(
+                session=session, format="csv", chunk_size=3
+            )
+        ]
+
+    # заголовок и по куску на каждые 3 строки, весь файл в памяти не собирается
+    assert len(chunks) == 1 + 4
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+    assert rows[0] == ["name", "description", "price", "id"]
+    assert rows[1:] == [
+        [product.name, product.description, str(product.price), str(product.id)]
+        for product in products
+    ]
+
+
+@pytest.mark.parametrize("format", ["csv", "ndjson"])
+async def test_export_round_trip(client, products, format):
+    exported = await client.get(f"/api/v1/products/export?format={format}")
+    assert exported.headers["content-type"].startswith(transfer.MEDIA_TYPES[format])
+    assert (
+        exported.headers["content-disposition"]
+        == f'attachment; filename="products.{format}"'
+    )
+
+    report = (
+        await client.post(
+            f"/api/v1/products/import?format={format}", content=exported.content
+        )
+    ).json()
+
+    # лишняя колонка id игнорируется, получаются копии тех же продуктов
+    assert report == {"imported": len(products), "failed": 0, "errors": []}
+    saved = await saved_products()
+    assert saved[len(products) :] == saved[: len(products)]
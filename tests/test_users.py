@@ -0,0 +1,126 @@
+# Пользователи: в api_v1/users связи из ?include= грузятся selectinload/joinedload, поэтому
+# число запросов на список не растет вместе с числом пользователей. Регистрация (users/) -
+# INSERT ... ON CONFLICT DO NOTHING, занятые username и email отсекают уникальные индексы
+import pytest
+from sqlalchemy import func, select
+
+from core.config import settings
+
+from core.models import Post, Profile, User, db_helper
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_users(prefix: str, count: int, posts: int, profile: bool) -> None:
+    async with db_helper.session_factory() as session:
+        users = [User(username=f"{prefix}{number}") for number in range(count)]
+        session.add_all(users)
+        await session.flush()
+        for user in users:
+            if profile:
+                session.add(Profile(first_name=user.username, user_id=user.id))
+            session.add_all(
+                Post(title=f"post {number}", user_id=user.id) for number in range(posts)
+            )
+        await session.commit()
+
+
+async def list_users(client, statements, include: str | None) -> tuple[int, list]:
+    params = {"include": include} if include else {}
+    statements.clear()
+    response = await client.get("/api/v1/users", params=params)
+    assert response.status_code == 200
+    return len(statements), response.json()
+
+
+@pytest.mark.parametrize("include", [None, "profile", "posts", "profile,posts"])
+async def test_list_statements_do_not_grow_with_users(client, statements, include):
+    await create_users("user", count=1, posts=3, profile=True)
+    one, users = await list_users(client, statements, include)
+    assert len(users) == 1
+
+    await create_users("more", count=9, posts=1, profile=False)
+    many, users = await list_users(client, statements, include)
+
+    assert len(users) == 10
+    # один SELECT пользователей (profile идет JOIN в него же) и один на посты
+    assert many == one == (2 if include and "posts" in include else 1)
+    if include and "posts" in include:
+        assert sum(len(user["posts"]) for user in users) == 3 + 9
+    if include and "profile" in include:
+        assert users[0]["profile"]["first_name"] == "user0"
+        assert users[1]["profile"] is None
+    else:
+        assert "profile" not in users[0]
+
+
+async def test_unknown_include_is_400(client, database):
+    response = await client.get("/api/v1/users", params={"include": "friends"})
+    assert response.status_code == 400
+
+
+def register_body(username: str, email: str | None = None) -> dict:
+    return {"username": username, "email": email or f"{username}@example.com"}
+
+
+async def users_count() -> int:
+    async with db_helper.session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(User))
+
+
+async def test_register(client, database):
+    response = await client.post("/users", json=register_body("alice"))
+
+    assert response.status_code == 201
+    user = response.json()
+    assert user == {"id": user["id"], "username": "alice", "email": "alice@example.com"}
+
+
+@pytest.mark.parametrize(
+    "duplicate",
+    [
+        register_body("alice", "other@example.com"),  # занят username
+        register_body("bob", "alice@example.com"),  # занят email
+    ],
+)
+async def test_register_conflict(client, database, statements, duplicate):
+    await client.post("/users", json=register_body("alice"))
+    statements.clear()
+
+    response = await client.post("/users", json=duplicate)
+
+    assert response.status_code == 409
+    assert await users_count() == 1
+    # конфликт решает сам INSERT, без предварительного SELECT
+    assert [statement.split()[0] for statement in statements][0] == "INSERT"
+
+
+async def test_register_bulk_reports_conflicts(client, database, monkeypatch):
+    monkeypatch.setattr(settings.bulk, "batch_size", 2)
+    await client.post("/users", json=register_body("alice"))
+
+    response = await client.post(
+        "/users/bulk",
+        json=[
+            register_body("bob"),
+            register_body("alice", "alice2@example.com"),  # уже есть в бд
+            register_body("carol"),
+            register_body("carol", "carol2@example.com"),  # повтор в самом запросе
+            register_body("dave", "bob@example.com"),  # email из этого же запроса
+            register_body("erin"),
+        ],
+    )
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [(result["username"], result["status"]) for result in results] == [
+        ("bob", "created"),
+        ("alice", "conflict"),
+        ("carol", "created"),
+        ("carol", "conflict"),
+        ("dave", "conflict"),
+        ("erin", "created"),
+    ]
+    assert results[2]["user"]["email"] == "carol@example.com"
+    assert results[3]["user"] is None
+    assert await users_count() == 4
@@ -0,0 +1,208 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from api_v1.products.write_behind import product_write_queue
+from core.config import settings
+from core.instrumentation import current_scope
+from core.models import Product, db_helper
+from core.nplusone import current_queries
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def write_behind(database, monkeypatch):
+    monkeypatch.setattr(settings.write_behind, "enabled", True)
+    # по умолчанию сами сбрасываем flush(), фоновая задача не успеет сработать сама
+    monkeypatch.setattr(product_write_queue, "flush_size", 1000)
+    monkeypatch.setattr(product_write_queue, "flush_interval", 60)
+    product_write_queue.open()  # как на старте lifespan, ASGITransport его не запускает
+    yield product_write_queue
+    await product_write_queue.close()
+
+
+async def saved(product_id: int) -> Product:
+    async with db_helper.session_factory() as session:
+        return await session.scalar(select(Product).where(Product.id == product_id))
+
+
+async def wait_for_flush(queue, timeout: float = 2.0) -> None:
+    for _ in range(int(timeout / 0.01)):
+        if not queue.pending and not queue.flushing:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("write-behind queue was not flushed")
+
+
+async def test_patches_are_coalesced(client, products, write_behind):
+    product = products[0]
+    url = f"/api/v1/products/{product.id}"
+    coalesced = write_behind.coalesced
+    for body in ({"price": 100}, {"name": "renamed"}, {"price": 300}):
+        response = await client.patch(url, json=body)
+        assert response.status_code == 202
+        assert response.json() == {
+            "id": product.id,
+            "status": "accepted",
+            "product": None,
+        }
+
+    assert write_behind.pending == {product.id: {"price": 300, "name": "renamed"}}
+    assert write_behind.coalesced == coalesced + 2
+    await write_behind.flush()
+
+    row = await saved(product.id)
+    assert (row.name, row.description, row.price) == ("renamed", "test", 300)
+    # три PATCH - одна запись в бд
+    assert row.version == product.version + 1
+
+
+async def test_flush_when_batch_is_full(client, products, write_behind, monkeypatch):
+    monkeypatch.setattr(write_behind, "flush_size", 3)
+    for product in products[:3]:
+        await client.patch(f"/api/v1/products/{product.id}", json={"price": 42})
+
+    await wait_for_flush(write_behind)
+    assert [(await saved(product.id)).price for product in products[:3]] == [42] * 3
+
+
+async def test_flush_by_interval(client, products, write_behind, monkeypatch):
+    monkeypatch.setattr(write_behind, "flush_interval", 0.02)
+    await client.patch(f"/api/v1/products/{products[0].id}", json={"price": 42})
+    assert write_behind.pending
+
+    await wait_for_flush(write_behind)
+    assert (await saved(products[0].id)).price == 42
+
+
+async def test_full_queue_rejects_new_products(
+    client, products, write_behind, monkeypatch
+):
+    monkeypatch.setattr(write_behind, "max_pending", 2)
+    for product in products[:2]:
+        response = await client.patch(
+            f"/api/v1/products/{product.id}", json={"price": 42}
+        )
+        assert response.status_code == 202
+
+    rejected = await client.patch(
+        f"/api/v1/products/{products[2].id}", json={"price": 42}
+    )
+    assert rejected.status_code == 503
+    assert rejected.headers["retry-after"] == "1"
+    # продукт, который уже в очереди, места не занимает и принимается всегда
+    accepted = await client.patch(
+        f"/api/v1/products/{products[0].id}", json={"price": 43}
+    )
+    assert accepted.status_code == 202
+    assert write_behind.pending.keys() == {products[0].id, products[1].id}
+
+
+async def test_patch_of_missing_product_is_404(client, products, write_behind):
+    response = await client.patch("/api/v1/products/999999", json={"price": 1})
+    assert response.status_code == 404
+    assert not write_behind.pending
+
+
+@pytest.mark.parametrize(
+    "method, body",
+    [
+        ("delete", None),
+        ("put", {"name": "put", "description": "put", "price": 7}),
+    ],
+)
+async def test_sync_write_flushes_pending_product(
+    client, products, write_behind, method, body
+):
+    product = products[0]
+    url = f"/api/v1/products/{product.id}"
+    assert (await client.patch(url, json={"price": 500})).status_code == 202
+
+    kwargs = {"json": body} if body is not None else {}
+    response = await client.request(method, url, **kwargs)
+
+    # отложенный PATCH записан раньше, очередь потом ничего не затрет
+    assert response.status_code < 300
+    assert not write_behind.is_pending(product.id)
+    row = await saved(product.id)
+    if method == "delete":
+        assert row is None
+    else:
+        assert (row.name, row.price, row.version) == ("put", 7, product.version + 2)
+
+
+async def test_if_match_patch_sees_pending_changes(client, products, write_behind):
+    url = f"/api/v1/products/{products[0].id}"
+    etag = (await client.get(url)).headers["etag"]
+    await client.patch(url, json={"price": 500})
+
+    # версия из If-Match уже устарела: очередь записала PATCH до проверки
+    stale = await client.patch(url, json={"name": "x"}, headers={"If-Match": etag})
+    assert stale.status_code == 412
+
+    fresh = (await client.get(url)).headers["etag"]
+    response = await client.patch(url, json={"name": "x"}, headers={"If-Match": fresh})
+    assert response.status_code == 200
+    assert response.json()["price"] == 500
+
+
+async def test_dead_flush_task_is_restarted(
+    client, products, write_behind, monkeypatch, caplog
+):
+    async def broken_flush():
+        raise RuntimeError("flush task crashed")
+
+    monkeypatch.setattr(write_behind, "flush_interval", 0.01)
+    monkeypatch.setattr(write_behind, "flush", broken_flush)
+    await client.patch(f"/api/v1/products/{products[0].id}", json={"price": 42})
+    await asyncio.sleep(0.05)
+    assert write_behind._task.done()
+    monkeypatch.delattr(write_behind, "flush")  # снова метод класса
+
+    # следующая запись поднимает задачу заново, и накопленное тоже записывается
+    await client.patch(f"/api/v1/products/{products[1].id}", json={"price": 43})
+
+    await wait_for_flush(write_behind)
+    assert (await saved(products[0].id)).price == 42
+    assert (await saved(products[1].id)).price == 43
+    assert "flush task died" in caplog.text
+
+
+async def test_empty_patch_is_not_queued(client, products, write_behind):
+    response = await client.patch(f"/api/v1/products/{products[0].id}", json={})
+    assert response.status_code == 200
+    assert response.json()["price"] == products[0].price
+    assert not write_behind.pending
+
+
+async def test_flush_task_does_not_inherit_request_context(
+    client, products, write_behind, monkeypatch
+):
+    seen = []
+    write = write_behind._write
+
+    async def recording_write(batch):
+        seen.append((current_scope.get(), current_queries.get()))
+        await write(batch)
+
+    monkeypatch.setattr(write_behind, "_write", recording_write)
+    monkeypatch.setattr(write_behind, "flush_interval", 0.01)
+    # задачу создает put() внутри запроса, но SQL flush не относится к его роуту
+    await client.patch(f"/api/v1/products/{products[0].id}", json={"price": 42})
+    await wait_for_flush(write_behind)
+    assert seen == [(None, None)]
+
+
+@pytest.mark.parametrize("enabled", [True, False])
+async def test_explicit_null_is_rejected(
+    client, products, write_behind, monkeypatch, enabled
+):
+    monkeypatch.setattr(settings.write_behind, "enabled", enabled)
+    url = f"/api/v1/products/{products[0].id}"
+    response = await client.patch(url, json={"name": None, "price": 42})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "name"]
+    assert not write_behind.pending
+    assert (await saved(products[0].id)).name == products[0].name
@@ -1,6 +1,59 @@
+from typing import Sequence
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models import User
 from users.schemas import CreateUser
 
+# INSERT ... ON CONFLICT есть только в диалектных insert, общий sqlalchemy.insert его не умеет
+INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+async def insert_users(
+    session: AsyncSession, users_in: Sequence[CreateUser]
+) -> Sequence[User]:
+    # Дубликаты отсекают уникальные индексы по username и email прямо в INSERT:
+    # без предварительного SELECT и без гонки между ним и вставкой.
+    # RETURNING отдает только вставленные строки, конфликтные молча пропускаются
+    dialect_name = session.get_bind().dialect.name
+    stmt = (
+        INSERTS[dialect_name](User)
+        .values([user_in.model_dump() for user_in in users_in])
+        .on_conflict_do_nothing()
+        .returning(User)
+    )
+    result = await session.scalars(stmt)
+    return result.all()
+
+
+async def create_user(session: AsyncSession, user_in: CreateUser) -> User | None:
+    # None - username или email уже заняты
+    users = await insert_users(session=session, users_in=[user_in])
+    await session.commit()
+    return users[0] if users else None
+
+
+async def create_users_bulk(
+    session: AsyncSession,
+    users_in: Sequence[CreateUser],
+    batch_size: int,
+) -> list[User | None]:
+    # результат по порядку входа: User или None для конфликтующих
+    created: dict[str, User] = {}
+    for start in range(0, len(users_in), batch_size):
+        batch = users_in[start : start + batch_size]
+        for user in await insert_users(session=session, users_in=batch):
+            created[user.username] = user
+    await session.commit()
 
-def create_user(user_in: CreateUser) -> dict:
-    user = user_in.model_dump()
-    return {"success": True, "user": user}
+    results = []
+    for user_in in users_in:
+        user = created.get(user_in.username)
+        # username повторился в самом запросе: вставлена только одна из строк
+        if user is not None and user.email == user_in.email:
+            del created[user_in.username]
+            results.append(user)
+        else:
+            results.append(None)
+    return results
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Annotated
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from typing import Annotated, Literal
 from annotated_types import MinLen, MaxLen
 
 
@@ -7,3 +7,18 @@ class CreateUser(BaseModel):
     # username: str = Field(..., min_length=3, max_length=20) this is old way to annotate
     username: Annotated[str, MinLen(3), MaxLen(20)]  # new style
     email: EmailStr
+
+
+class User(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    username: str
+    email: str | None
+
+
+class UserRegisterResult(BaseModel):
+    username: str
+    # conflict - username или email уже заняты (или повторяются в самом запросе)
+    status: Literal["created", "conflict"]
+    user: User | None = None
@@ -1,10 +1,43 @@
-from fastapi import APIRouter
-from users.schemas import CreateUser
+from typing import Annotated
+
+from fastapi import APIRouter, Body, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from users.schemas import CreateUser, User, UserRegisterResult
 from users import crud
+from core.config import settings
+from core.models import db_helper
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
 
-@router.post("")
-def create_user(user: CreateUser):
-    return crud.create_user(user_in=user)
+@router.post("", status_code=status.HTTP_201_CREATED)
+async def create_user(
+    user: CreateUser,
+    session: AsyncSession = Depends(db_helper.session_dependency),
+) -> User:
+    created = await crud.create_user(session=session, user_in=user)
+    if created is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Username or email is already registered",
+        )
+    return created
+
+
+@router.post("/bulk")
+async def create_users_bulk(
+    users_in: Annotated[list[CreateUser], Body(max_length=settings.bulk.max_items)],
+    session: AsyncSession = Depends(db_helper.session_dependency),
+) -> list[UserRegisterResult]:
+    users = await crud.create_users_bulk(
+        session=session, users_in=users_in, batch_size=settings.bulk.batch_size
+    )
+    return [
+        UserRegisterResult(
+            username=user_in.username,
+            status="created" if user is not None else "conflict",
+            user=user,
+        )
+        for user_in, user in zip(users_in, users)
+    ]